@@ -1,15 +1,22 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone # Import timezone
+from sqlalchemy import Delete, Update, event, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Tuple
 import models
 import schemas
-from database import get_db # Import the get_db dependency
+from database import get_async_db
+from result_cache import ResultCache
 
 load_dotenv()
 
@@ -17,22 +24,105 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "a_default_secret_key_for_development")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 # Increased for better user experience
+# Authenticated users are remembered for this long so most requests skip the users query
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+# Argon2 cost parameters (passlib's defaults). Raising them takes effect for existing
+# users at their next login, when the stored hash is transparently upgraded.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "102400"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "8"))
+# Hashes run on this many threads (argon2 releases the GIL); each needs ARGON2_MEMORY_COST of RAM
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hashes allowed to wait for a thread before logins are turned away with 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "32"))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "1"))
 
 # --- UTILITIES ---
 # Passlib will now use the argon2 library, which is more secure and has no length limit
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
 # The tokenUrl MUST match the path of your login endpoint in main.py
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token") 
 
+# --- PASSWORD HASHING POOL ---
+
+class PasswordHashingPool:
+    """
+    Runs argon2 hashes on a few dedicated threads so they never block the event loop.
+    At most `workers + queue_size` hashes are accepted at once; beyond that callers get
+    503 + Retry-After rather than queueing behind a login storm.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_size: int = PASSWORD_HASH_QUEUE_SIZE):
+        self.workers = max(workers, 1)
+        self.capacity = self.workers + max(queue_size, 0)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many logins in progress, please retry shortly.",
+                    headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+                )
+            self._in_flight += 1
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future: Future):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+
+password_pool = PasswordHashingPool()
+
 # --- CORE AUTHENTICATION FUNCTIONS ---
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verifies a plain password against a hashed one."""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verifies a plain password against a hashed one. For sync callers; waits on the hashing pool."""
+    return password_pool.submit(pwd_context.verify, plain_password, hashed_password).result()
 
 def get_password_hash(password: str) -> str:
-    """Hashes a plain password."""
-    return pwd_context.hash(password)
+    """Hashes a plain password. For sync callers; waits on the hashing pool."""
+    return password_pool.submit(pwd_context.hash, password).result()
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies on the hashing pool. When the stored hash uses outdated argon2 parameters,
+    also returns a fresh hash for the caller to save; otherwise the second item is None.
+    """
+    return await password_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def hash_password(password: str) -> str:
+    """Hashes a plain password on the hashing pool."""
+    return await password_pool.run(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Creates a new JWT access token."""
@@ -45,6 +135,33 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# --- PRINCIPAL CACHE ---
+# username -> schemas.User snapshot (id, username, is_active). Memory only: entries are
+# invalidated in-process when the users table is written, and other workers pick up changes
+# within PRINCIPAL_CACHE_TTL_SECONDS.
+principal_cache = ResultCache("principals", PRINCIPAL_CACHE_SIZE,
+                              ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS, use_disk=False)
+
+def invalidate_principal(username: str):
+    """Drops a cached user, e.g. after deactivating them or changing their password."""
+    principal_cache.invalidate(username)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_principal_on_change(mapper, connection, target):
+    invalidate_principal(target.username)
+    # A rename leaves the old username cached too
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        invalidate_principal(old_username)
+
+@event.listens_for(Engine, "after_execute")
+def _invalidate_principals_on_bulk_write(conn, clauseelement, multiparams, params, execution_options, result):
+    # Core and bulk ORM UPDATE/DELETE statements skip the mapper events above and don't
+    # say which users they touched, so any of them on users drops every cached principal
+    if isinstance(clauseelement, (Update, Delete)) and \
+            getattr(clauseelement.table, "name", None) == models.User.__tablename__:
+        principal_cache.clear()
+
 # --- DATABASE INTERACTION ---
 
 def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
@@ -54,11 +171,17 @@ def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
     """
     return db.query(models.User).filter(models.User.username == username).first()
 
+async def get_user_by_username_async(db: AsyncSession, username: str) -> Optional[models.User]:
+    """Async variant of get_user_by_username for endpoints on the async session."""
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
 # --- DEPENDENCY FOR SECURING ENDPOINTS (The most important part) ---
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """
-    Decodes the JWT token, validates it, and fetches the user from the database.
+    Decodes the JWT token, validates it, and returns the user (a schemas.User snapshot),
+    from the principal cache when possible and the database otherwise.
     This function will be used to protect your endpoints.
     """
     credentials_exception = HTTPException(
@@ -74,9 +197,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    # --- THIS IS THE CRUCIAL DATABASE CALL ---
-    user = get_user_by_username(db, username=username)
-    if user is None:
+    # Cached principals skip the database; tokens carry the user id so a cached entry
+    # for a deleted-and-recreated username can't be reused
+    token_user_id = payload.get("uid")
+    user = principal_cache.get(username)
+    if user is None or (token_user_id is not None and token_user_id != user.id):
+        db_user = await get_user_by_username_async(db, username=username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.model_validate(db_user)
+        principal_cache.set(username, user)
+    if token_user_id is not None and token_user_id != user.id:
         raise credentials_exception
     return user
 
@@ -0,0 +1,406 @@
+# benchmarks/api_bench.py
+"""
+End-to-end API benchmark: boots the app in-process against a throwaway SQLite database
+with stubbed EasyOCR and Whisper models and benchmarks/fake_llm_server.py standing in
+for Groq, seeds a synthetic catalog (users x medicines x lots, spread over categories
+and manufacturers), then drives each scenario under concurrency and reports
+throughput and p50/p95/p99 latency.
+
+    python benchmarks/api_bench.py [--users 4] [--medicines 2000] [--lots 3] [--categories 20]
+                                   [--requests 300] [--concurrency 16] [--scenarios list,barcode,...]
+                                   [--llm-latency lognormal:300,0.4] [--ocr-ms 40] [--whisper-ms 120]
+                                   [--output report.json] [--compare previous-report.json]
+
+Scenarios: list, barcode, smart_create, receive, dispense, restock, chatbot, parse_text,
+ocr, voice (default: all). --output writes a JSON report (run metadata, dataset and
+per-scenario results) and --compare prints the change against an earlier report, so
+two releases can be diffed on the same machine.
+
+Tune with the same environment variables as the server, e.g.
+ARGON2_MEMORY_COST=1024 LLM_MAX_CONCURRENCY=8 python benchmarks/api_bench.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_llm_server  # noqa: E402  (same directory)
+
+SCENARIOS = ["list", "barcode", "smart_create", "receive", "dispense", "restock",
+             "chatbot", "parse_text", "ocr", "voice"]
+
+CHATBOT_QUESTIONS = [
+    "How many {name} do I have?",
+    "what expires in 30 days",
+    "Which medicines should I reorder before the weekend?",
+    "stock of {name}",
+    "Summarise what's running low and what expires soon",
+]
+LABEL_TEXTS = [
+    # Complete labels the local extractor can answer on its own
+    "{name} {strength} Batch No: B{n} Exp: 08/2027 MRP Rs {price}",
+    # Missing fields, so the LLM fills them in
+    "{name} tablets keep in a cool dry place",
+]
+SPOKEN = [
+    "Received {qty} strips of {name} expiring December 2027 lot V{n} price {price}",
+    "add {qty} units of {name} batch V{n}",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_values, pct: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 2)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# --- STUB MODELS ---
+
+class StubReader:
+    """EasyOCR stand-in: a fixed delay and a label-like result in EasyOCR's (bbox, text, conf) shape."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def readtext(self, image, **kwargs):
+        time.sleep(self.delay)
+        n = len(image) if hasattr(image, "__len__") else 0
+        return [(None, "PARACETAMOL", 0.98), (None, "500mg", 0.95), (None, f"Batch No: OCR{n}", 0.9),
+                (None, "Exp: 09/2027", 0.9), (None, "MRP Rs 25.50", 0.9)]
+
+
+class StubWhisper:
+    """Whisper stand-in: a fixed delay and one of a few spoken intake sentences."""
+
+    def __init__(self, delay: float, rng: random.Random):
+        self.delay = delay
+        self.rng = rng
+
+    def transcribe(self, audio, **kwargs):
+        time.sleep(self.delay)
+        template = self.rng.choice(SPOKEN)
+        return {"text": template.format(qty=self.rng.randint(1, 50), name="Paracetamol",
+                                        n=self.rng.randint(1, 10 ** 6), price=self.rng.randint(5, 90))}
+
+
+# --- SEEDING ---
+
+def _seed(users, medicines: int, lots: int, categories: int, rng: random.Random):
+    """Bulk-inserts each user's catalog; returns per-user medicine ids, barcodes and lot ids."""
+    from sqlalchemy import insert, select
+
+    import models
+    from database import SessionLocal
+    from stock import add_stock
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(models.Category), [{"name": f"Category {c}"} for c in range(categories)])
+        db.execute(insert(models.Manufacturer), [{"name": f"Manufacturer {m}"} for m in range(max(categories, 1))])
+        category_ids = db.scalars(select(models.Category.id)).all()
+        manufacturer_ids = db.scalars(select(models.Manufacturer.id)).all()
+        strengths = ["5mg", "10mg", "50mg", "100mg", "250mg", "500mg", "650mg", "1g"]
+        catalog = {}
+        for user_index, user_id in enumerate(users):
+            db.execute(insert(models.Medicine), [
+                {
+                    "name": f"Drug{(user_index * medicines + i) % 997:03d} {rng.choice(strengths)}",
+                    "barcode": f"{8900000000000 + user_index * 10 ** 7 + i}",
+                    "strength": rng.choice(strengths),
+                    "price": round(rng.uniform(1, 500), 2),
+                    "expiry_date": date.today() + timedelta(days=rng.randint(30, 900)),
+                    "user_id": user_id,
+                    "manufacturer_id": rng.choice(manufacturer_ids),
+                }
+                for i in range(medicines)
+            ])
+            rows = db.execute(
+                select(models.Medicine.id, models.Medicine.barcode).where(models.Medicine.user_id == user_id)
+            ).all()
+            medicine_ids = [row.id for row in rows]
+            if category_ids:
+                links = {(m, c) for m in medicine_ids for c in rng.sample(category_ids, min(2, len(category_ids)))}
+                db.execute(insert(models.medicine_category), [{"medicine_id": m, "category_id": c} for m, c in links])
+            lot_rows = [
+                {
+                    "medicine_id": m,
+                    "lot_number": f"S{m}-{l}",
+                    "expiry_date": date.today() + timedelta(days=rng.randint(-10, 720)),
+                    "quantity": rng.randint(50, 500),
+                }
+                for m in medicine_ids for l in range(lots)
+            ]
+            db.execute(insert(models.InventoryItem), lot_rows)
+            totals = {}
+            for row in lot_rows:
+                totals[row["medicine_id"]] = totals.get(row["medicine_id"], 0) + row["quantity"]
+            add_stock(db, totals)
+            lot_ids = db.scalars(
+                select(models.InventoryItem.id)
+                .join(models.Medicine, models.Medicine.id == models.InventoryItem.medicine_id)
+                .where(models.Medicine.user_id == user_id)
+            ).all()
+            catalog[user_id] = {"medicine_ids": medicine_ids, "barcodes": [row.barcode for row in rows], "lot_ids": lot_ids}
+        db.commit()
+        return catalog
+    finally:
+        db.close()
+
+
+# --- SCENARIOS ---
+# Each builds one request as (method, url, httpx keyword arguments) for a random user.
+
+def _build_request(name: str, user, rng: random.Random, counter: int):
+    catalog = user["catalog"]
+    if name == "list":
+        return "GET", "/medicines/", {"params": {"limit": 50, "sort": rng.choice(["id", "name"])}}
+    if name == "barcode":
+        return "GET", f"/medicines/barcode/{rng.choice(catalog['barcodes'])}", {}
+    if name == "smart_create":
+        return "POST", "/medicines/smart-create", {"json": {
+            "name": f"Bench New {counter}", "barcode": f"77{counter:011d}", "strength": "10mg",
+            "price": 12.5, "expiry_date": (date.today() + timedelta(days=400)).isoformat(),
+            "lot_number": f"NEW-{counter}", "quantity": 100,
+            "manufacturer_name": f"Manufacturer {rng.randint(0, 5)}",
+            "category_names": [f"Category {rng.randint(0, 5)}"],
+        }}
+    if name == "receive":
+        return "POST", "/inventory/receive", {"json": {
+            "medicine_id": rng.choice(catalog["medicine_ids"]), "lot_number": f"RCV-{counter}",
+            "expiry_date": (date.today() + timedelta(days=rng.randint(60, 720))).isoformat(), "quantity": 100,
+        }}
+    if name == "dispense":
+        return "POST", "/inventory/dispense", {"json": {"item_id": rng.choice(catalog["lot_ids"]), "quantity": 1}}
+    if name == "restock":
+        return "POST", "/inventory/restock", {"json": {"item_id": rng.choice(catalog["lot_ids"]), "quantity": 1}}
+    if name == "chatbot":
+        question = rng.choice(CHATBOT_QUESTIONS).format(name=f"Drug{rng.randint(0, 996):03d}")
+        return "POST", "/chatbot/query", {"json": {"message": question}}
+    if name == "parse_text":
+        text = rng.choice(LABEL_TEXTS).format(name=f"Drug{rng.randint(0, 996):03d}", strength="500mg",
+                                              n=counter, price=rng.randint(5, 90))
+        return "POST", "/chatbot/parse-medicine-text", {"json": {"extracted_text": text}}
+    if name == "ocr":
+        # Unique bytes per request, so the OCR result cache doesn't answer for the model
+        return "POST", "/ocr/extract-text", {"files": {"file": ("label.png", os.urandom(256) + str(counter).encode(), "image/png")}}
+    if name == "voice":
+        return "POST", "/voice/process-audio", {"files": {"file": (f"bench-{counter}.wav", os.urandom(256), "audio/wav")}}
+    raise ValueError(f"unknown scenario: {name}")
+
+
+async def _run_scenario(client, name: str, users, requests: int, concurrency: int, warmup: int, rng: random.Random):
+    # Offset per scenario so generated lot numbers and barcodes never collide across runs of the suite
+    counter = iter(range(SCENARIOS.index(name) * 10 ** 6, 10 ** 9))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, exceptions = [], {}, 0
+
+    async def one(record: bool):
+        nonlocal exceptions
+        user = rng.choice(users)
+        method, url, kwargs = _build_request(name, user, rng, next(counter))
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, headers=user["headers"], **kwargs)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+        if record:
+            statuses[status] = statuses.get(status, 0) + 1
+            if isinstance(status, str):
+                exceptions += 1
+            else:
+                latencies.append(elapsed)
+
+    for _ in range(warmup):
+        await one(False)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(True) for _ in range(requests)))
+    wall = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": ok,
+        "errors": requests - ok,
+        "status_codes": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "duration_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 1) if wall else None,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+            "p50": _percentile(ordered, 50),
+            "p95": _percentile(ordered, 95),
+            "p99": _percentile(ordered, 99),
+            "max": _percentile(ordered, 100),
+        },
+    }
+
+
+def _print_table(report):
+    print(f"\n{'scenario':<14}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in report["scenarios"].items():
+        latency = result["latency_ms"]
+        print(f"{name:<14}{result['throughput_rps'] or 0:>9}{latency['p50'] or 0:>10}{latency['p95'] or 0:>10}"
+              f"{latency['p99'] or 0:>10}{result['errors']:>8}")
+
+
+def _print_comparison(report, previous):
+    """Relative change per scenario against an earlier report (negative latency change = faster)."""
+    def change(new, old):
+        if new is None or not old:
+            return "    n/a"
+        return f"{(new - old) / old * 100:+7.1f}%"
+
+    print(f"\nvs {previous['meta'].get('commit') or 'previous'} ({previous['meta'].get('started_at')}):")
+    dataset = {k: v for k, v in report["dataset"].items() if k != "seed_seconds"}
+    if any(previous["dataset"].get(k) != v for k, v in dataset.items()):
+        print(f"  note: dataset differs ({previous['dataset']}), so the numbers are not like for like")
+    print(f"{'scenario':<14}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, result in report["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if not old:
+            print(f"{name:<14}{'(new)':>10}")
+            continue
+        print(f"{name:<14}{change(result['throughput_rps'], old['throughput_rps']):>10}"
+              + "".join(f"{change(result['latency_ms'][p], old['latency_ms'][p]):>10}" for p in ("p50", "p95", "p99")))
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    fake = fake_llm_server.FakeLLM(latency=args.llm_latency, token_ms=args.llm_token_ms,
+                                   error_rate=args.llm_error_rate, seed=args.seed)
+    fake_server = fake_llm_server.start_in_thread(fake, port=args.llm_port)
+
+    import httpx
+
+    import main
+    import models
+    from database import SessionLocal
+    from model_registry import model_registry
+
+    model_registry.register("ocr", lambda: StubReader(args.ocr_ms / 1000))
+    model_registry.register("whisper", lambda: StubWhisper(args.whisper_ms / 1000, random.Random(args.seed)))
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "database": "sqlite",
+            "llm_latency": args.llm_latency,
+            "ocr_ms": args.ocr_ms,
+            "whisper_ms": args.whisper_ms,
+            "seed": args.seed,
+        },
+        "dataset": {"users": args.users, "medicines_per_user": args.medicines, "lots_per_medicine": args.lots,
+                    "categories": args.categories},
+        "scenarios": {},
+    }
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            users = []
+            for u in range(args.users):
+                credentials = {"username": f"bench-{u}", "password": "bench-pw"}
+                await client.post("/register", json=credentials)
+                token = (await client.post("/token", data=credentials)).json()["access_token"]
+                users.append({"username": credentials["username"], "headers": {"Authorization": f"Bearer {token}"}})
+
+            db = SessionLocal()
+            user_ids = [db.query(models.User.id).filter(models.User.username == user["username"]).scalar() for user in users]
+            db.close()
+            start = time.perf_counter()
+            catalog = await asyncio.to_thread(_seed, user_ids, args.medicines, args.lots, args.categories, rng)
+            report["dataset"]["seed_seconds"] = round(time.perf_counter() - start, 2)
+            for user, user_id in zip(users, user_ids):
+                user["catalog"] = catalog[user_id]
+            print(f"seeded {args.users} users x {args.medicines} medicines x {args.lots} lots "
+                  f"in {report['dataset']['seed_seconds']}s")
+
+            for name in args.scenarios:
+                result = await _run_scenario(client, name, users, args.requests, args.concurrency, args.warmup, rng)
+                report["scenarios"][name] = result
+                print(f"{name}: {result['throughput_rps']} req/s, p95 {result['latency_ms']['p95']} ms, "
+                      f"status {result['status_codes']}")
+
+    report["llm_server"] = fake.stats()
+    fake_server.should_exit = True
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--medicines", type=int, default=2000, help="per user")
+    parser.add_argument("--lots", type=int, default=3, help="per medicine")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=300, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests before each scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--llm-latency", default="lognormal:300,0.4", help="fake LLM latency spec (ms)")
+    parser.add_argument("--llm-token-ms", type=float, default=10)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-port", type=int, default=0, help="0 = any free port")
+    parser.add_argument("--ocr-ms", type=float, default=40, help="stub OCR time per image")
+    parser.add_argument("--whisper-ms", type=float, default=120, help="stub transcription time")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.llm_port = args.llm_port or _free_port()
+
+    # The app reads its settings at import, so they are fixed before main is imported in run()
+    _db_dir = tempfile.mkdtemp(prefix="api_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+    os.environ["PRELOAD_MODELS"] = "false"
+    os.environ["OCR_WORKERS"] = "0"
+    os.environ["USE_FAKE_LLM"] = "true"
+    os.environ["FAKE_LLM_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ.pop("LLM_BASE_URL", None)
+    os.environ.setdefault("STOCK_RECONCILE_INTERVAL_SECONDS", "0")
+
+    report = asyncio.run(run(args))
+    _print_table(report)
+    if args.compare:
+        with open(args.compare) as f:
+            _print_comparison(report, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nreport written to {args.output}")
@@ -0,0 +1,163 @@
+# benchmarks/bench_dispense.py
+"""
+Concurrent dispense load test: many counters dispensing the same medicines at once
+through /inventory/dispense-by-medicine (FEFO), then a consistency check that no stock
+was lost or oversold, that the medicine_stock totals still match the lots, and that
+lots were emptied strictly in expiry order.
+
+Runs the app in-process against a throwaway SQLite database by default; point
+DATABASE_URL at a scratch PostgreSQL database to exercise the row-locking path:
+
+    python benchmarks/bench_dispense.py [--medicines 5] [--lots 40] [--lot-size 100]
+                                        [--requests 500] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "DATABASE_URL" not in os.environ:
+    _db_dir = tempfile.mkdtemp(prefix="bench_dispense_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ.setdefault("PRELOAD_MODELS", "false")
+
+import httpx  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from stock import add_stock  # noqa: E402
+
+
+def _ms(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000, 1)
+
+
+def _seed(user_id: int, medicines: int, lots: int, lot_size: int):
+    """Medicines with `lots` lots each, expiring one day apart in shuffled insert order."""
+    db = SessionLocal()
+    try:
+        lot_expiry = {}
+        medicine_ids = []
+        for m in range(medicines):
+            medicine = models.Medicine(
+                name=f"Bench medicine {m}", price=1.0, user_id=user_id,
+                expiry_date=date.today() + timedelta(days=400),
+            )
+            db.add(medicine)
+            db.flush()
+            medicine_ids.append(medicine.id)
+            days = list(range(1, lots + 1))
+            random.shuffle(days)
+            for d in days:
+                item = models.InventoryItem(
+                    medicine_id=medicine.id, lot_number=f"M{m}-D{d}", quantity=lot_size,
+                    expiry_date=date.today() + timedelta(days=d),
+                )
+                db.add(item)
+                db.flush()
+                lot_expiry[item.id] = (medicine.id, item.expiry_date)
+            add_stock(db, {medicine.id: lots * lot_size})
+        db.commit()
+        return medicine_ids, lot_expiry
+    finally:
+        db.close()
+
+
+def _check(medicine_ids, lot_expiry, lots: int, lot_size: int, dispensed: dict):
+    db = SessionLocal()
+    try:
+        ok = True
+        for medicine_id in medicine_ids:
+            rows = db.execute(
+                select(models.InventoryItem.id, models.InventoryItem.expiry_date, models.InventoryItem.quantity)
+                .where(models.InventoryItem.medicine_id == medicine_id)
+            ).all()
+            left = sum(row.quantity for row in rows)
+            expected = lots * lot_size - dispensed.get(medicine_id, 0)
+            if left != expected or any(row.quantity < 0 for row in rows):
+                print(f"medicine {medicine_id}: {left} units left, expected {expected}")
+                ok = False
+            stored = db.scalar(select(models.MedicineStock.quantity).where(models.MedicineStock.medicine_id == medicine_id))
+            if rows and stored != left:
+                print(f"medicine {medicine_id}: medicine_stock says {stored}, lots hold {left}")
+                ok = False
+            remaining_ids = {row.id for row in rows}
+            gone = [exp for item_id, (m, exp) in lot_expiry.items() if m == medicine_id and item_id not in remaining_ids]
+            # Only the lot currently being drawn down may be partially used
+            if gone and rows and max(gone) > min(row.expiry_date for row in rows):
+                print(f"medicine {medicine_id}: a later lot was emptied before an earlier one")
+                ok = False
+            partial = [row for row in rows if row.quantity != lot_size]
+            if len(partial) > 1:
+                print(f"medicine {medicine_id}: {len(partial)} partially used lots")
+                ok = False
+        total = db.scalar(select(func.coalesce(func.sum(models.InventoryItem.quantity), 0)))
+        return ok, total
+    finally:
+        db.close()
+
+
+async def run(medicines: int, lots: int, lot_size: int, requests: int, concurrency: int):
+    models.Base.metadata.create_all(bind=engine)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/register", json={"username": "counter", "password": "bench-pw"})
+        token = (await client.post("/token", data={"username": "counter", "password": "bench-pw"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        me = SessionLocal()
+        user_id = me.scalar(select(models.User.id).where(models.User.username == "counter"))
+        me.close()
+        medicine_ids, lot_expiry = _seed(user_id, medicines, lots, lot_size)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses, dispensed = [], {}, {}
+
+        async def dispense(i):
+            medicine_id = medicine_ids[i % len(medicine_ids)]
+            quantity = random.randint(1, lot_size // 2)
+            async with semaphore:
+                start = time.perf_counter()
+                r = await client.post("/inventory/dispense-by-medicine", headers=headers,
+                                      json={"medicine_id": medicine_id, "quantity": quantity})
+                latencies.append(time.perf_counter() - start)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+            if r.status_code == 200:
+                body = r.json()
+                assert sum(a["quantity"] for a in body["allocations"]) == quantity
+                dispensed[medicine_id] = dispensed.get(medicine_id, 0) + quantity
+
+        start = time.perf_counter()
+        await asyncio.gather(*(dispense(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    ok, total_left = _check(medicine_ids, lot_expiry, lots, lot_size, dispensed)
+    print(f"dispenses: {requests} in {elapsed:.2f}s -> {requests / elapsed:.1f}/s (concurrency {concurrency})")
+    print(f"status codes: {statuses}")
+    print(f"latency ms: p50={_ms(latencies, 50)} p95={_ms(latencies, 95)} max={_ms(latencies, 100)}")
+    print(f"units dispensed: {sum(dispensed.values())}, units left: {total_left}")
+    print("consistency: OK" if ok else "consistency: FAILED")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--medicines", type=int, default=5)
+    parser.add_argument("--lots", type=int, default=40)
+    parser.add_argument("--lot-size", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.medicines, args.lots, args.lot_size, args.requests, args.concurrency))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,142 @@
+# benchmarks/bench_field_scanner.py
+"""
+Micro-benchmark: the single-pass label scanner in text_parsing.py versus the
+original per-helper regexes (one re.search per field + dateutil on every date).
+
+    python benchmarks/bench_field_scanner.py [--labels 2000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil.parser import parse as parse_date  # noqa: E402
+
+import text_parsing  # noqa: E402
+
+# --- ORIGINAL HELPERS (as they were in main.py) ---
+
+def legacy_find_and_parse_date(text_block):
+    date_pattern = r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}[/-]\d{1,2}[/-]\d{1,2}|\d{1,2}[ -](?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*[ -]\d{2,4})'
+    match = re.search(date_pattern, text_block, re.IGNORECASE)
+    if match:
+        try:
+            return parse_date(match.group(0)).date()
+        except (ValueError, OverflowError):
+            return None
+    return None
+
+def legacy_find_and_parse_price(text_block):
+    match = re.search(r'(?:MRP|Rs\.?|\$)\s*[:\- ]?\s*(\d+\.?\d*)', text_block, re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+def legacy_find_lot_number(text_block):
+    match = re.search(r'(?:Batch|Lot|B\.?No)\.?\s*:?\s*([\w\-]+)', text_block, re.IGNORECASE)
+    return match.group(1) if match else None
+
+def legacy_parse_gs1_string(data):
+    parsed_data = {}
+    gtin_match = re.search(r'\(01\)(\d+)', data)
+    if gtin_match: parsed_data['gtin'] = gtin_match.group(1)
+    lot_match = re.search(r'\(10\)([\w-]+)', data)
+    if lot_match: parsed_data['lot_number'] = lot_match.group(1)
+    expiry_match = re.search(r'\(17\)(\d{6})', data)
+    if expiry_match:
+        try:
+            parsed_data['expiry_date'] = datetime.strptime(expiry_match.group(1), '%y%m%d').date()
+        except ValueError: pass
+    return parsed_data
+
+# --- CORPUS ---
+
+NAMES = ["DOLO 650", "Crocin Advance", "Azithral 500", "Pan 40", "Augmentin 625 Duo", "Calpol 500",
+         "Montair LC", "Telma 40", "Shelcal 500", "Allegra 120"]
+MAKERS = ["Micro Labs Ltd", "GSK Pharmaceuticals", "Alembic Pharma", "Alkem Laboratories", "Cipla Ltd"]
+TEMPLATES = [
+    "{name} Tablets IP {maker} Batch No. {lot} Mfg. Date {mfg_num} Exp. Date {exp_num} MRP Rs. {price} Incl. of all taxes",
+    "{name} B.No.{lot} MFD {mfg_mon} EXP {exp_mon} M.R.P. ₹{price} per strip of 15 tablets",
+    "Each film coated tablet contains {name} Mfd by {maker} LOT: {lot} USE BEFORE {exp_num} Rs.{price}",
+    "{name} {maker} Batch {lot} {mfg_num} {exp_num} MRP:{price} Store below 30C protect from light",
+    "Rx only {name} Manufactured by {maker} Exp {exp_dmy} Batch: {lot} $ {price}",
+    "(01){gtin}(17){gs1_exp}(10){lot} {name} MRP {price}",
+]
+
+def _random_label(rng):
+    mfg_year, exp_year = rng.randint(2023, 2025), rng.randint(2026, 2029)
+    mfg_month, exp_month = rng.randint(1, 12), rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    month_name = datetime(2000, exp_month, 1).strftime("%b")
+    return rng.choice(TEMPLATES).format(
+        name=rng.choice(NAMES), maker=rng.choice(MAKERS),
+        lot=f"{rng.choice('ABCDEFGH')}{rng.choice('KLMN')}{rng.randint(1000, 99999)}",
+        mfg_num=f"{day:02d}/{mfg_month:02d}/{mfg_year}", exp_num=f"{day:02d}/{exp_month:02d}/{exp_year}",
+        mfg_mon=f"{datetime(2000, mfg_month, 1).strftime('%b').upper()} {mfg_year}",
+        exp_mon=f"{month_name.upper()} {exp_year}", exp_dmy=f"{day} {month_name} {exp_year}",
+        price=f"{rng.randint(10, 900)}.{rng.randint(0, 99):02d}",
+        gtin=f"0890{rng.randint(10**9, 10**10 - 1)}", gs1_exp=f"{exp_year % 100:02d}{exp_month:02d}{day:02d}",
+    )
+
+def build_corpus(size, seed=7):
+    rng = random.Random(seed)
+    return [_random_label(rng) for _ in range(size)]
+
+# --- RUNNERS ---
+
+def run_legacy(corpus):
+    for text in corpus:
+        legacy_find_and_parse_date(text)
+        legacy_find_and_parse_price(text)
+        legacy_find_lot_number(text)
+        legacy_parse_gs1_string(text)
+
+def run_scanner(corpus):
+    for text in corpus:
+        scan = text_parsing.scan_label(text)
+        scan.expiry_date()
+        scan.price()
+        scan.lot_number()
+        scan.of_kind("gs1")
+
+def _time(fn, corpus, repeat, before=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn(corpus)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.labels)
+    legacy_us = _time(run_legacy, corpus, args.repeat)
+    cold_us = _time(run_scanner, corpus, args.repeat, before=text_parsing._parse_date_string.cache_clear)
+    warm_us = _time(run_scanner, corpus, args.repeat)
+
+    agree = {"date": 0, "price": 0, "lot": 0}
+    for text in corpus:
+        scan = text_parsing.scan_label(text)
+        agree["date"] += (scan.expiry_date().value if scan.expiry_date() else None) == legacy_find_and_parse_date(text)
+        agree["price"] += (scan.price().value if scan.price() else None) == legacy_find_and_parse_price(text)
+        agree["lot"] += (scan.lot_number().value if scan.lot_number() else None) == legacy_find_lot_number(text)
+
+    print(f"labels: {len(corpus)}  (best of {args.repeat})")
+    print(f"  legacy helpers          {legacy_us:8.1f} us/label")
+    print(f"  scanner (cold dates)    {cold_us:8.1f} us/label   x{legacy_us / cold_us:.1f}")
+    print(f"  scanner (warm dates)    {warm_us:8.1f} us/label   x{legacy_us / warm_us:.1f}")
+    print("  agreement with legacy:  " + ", ".join(f"{k} {v / len(corpus):.0%}" for k, v in agree.items()))
+    print("  (disagreements are expected where the legacy helpers took an MFG date, a non-MRP amount,")
+    print("   or the word 'No' from 'Batch No.' instead of the lot)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_login.py
+"""
+Login throughput under concurrency, plus how long a cheap request waits while logins
+are in flight (i.e. whether argon2 is blocking the event loop).
+
+Runs the app in-process against a throwaway SQLite database:
+
+    python benchmarks/bench_login.py [--users 20] [--logins 200] [--concurrency 32]
+
+Tune with the same environment variables as the server, e.g.
+PASSWORD_HASH_WORKERS=4 ARGON2_MEMORY_COST=65536 python benchmarks/bench_login.py
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_db_dir = tempfile.mkdtemp(prefix="bench_login_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("GROQ_API_KEY", "bench")
+os.environ.setdefault("PRELOAD_MODELS", "false")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from database import engine  # noqa: E402
+
+
+def _ms(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000, 1)
+
+
+async def run(users: int, logins: int, concurrency: int):
+    models.Base.metadata.create_all(bind=engine)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(users):
+            await client.post("/register", json={"username": f"user{i}", "password": f"pw-{i}"})
+
+        semaphore = asyncio.Semaphore(concurrency)
+        login_latencies, statuses = [], {}
+        probe_latencies = []
+        done = asyncio.Event()
+
+        async def login(i):
+            async with semaphore:
+                start = time.perf_counter()
+                r = await client.post("/token", data={"username": f"user{i % users}", "password": f"pw-{i % users}"})
+                login_latencies.append(time.perf_counter() - start)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        async def probe():
+            # A request that does no work: its latency is pure event-loop wait
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    print(f"logins: {logins} in {elapsed:.2f}s -> {logins / elapsed:.1f}/s (concurrency {concurrency})")
+    print(f"status codes: {statuses}")
+    print(f"login latency ms: p50={_ms(login_latencies, 50)} p95={_ms(login_latencies, 95)} max={_ms(login_latencies, 100)}")
+    print(f"probe latency ms: p50={_ms(probe_latencies, 50)} p95={_ms(probe_latencies, 95)} "
+          f"max={_ms(probe_latencies, 100)} (n={len(probe_latencies)}, mean={statistics.mean(probe_latencies) * 1000:.1f})")
+    print(f"hashing pool: {main.auth.password_pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.logins, args.concurrency))
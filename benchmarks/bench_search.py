@@ -0,0 +1,108 @@
+# benchmarks/bench_search.py
+"""
+Fuzzy medicine-name search latency on a large catalog: builds one user's catalog of
+synthetic drug names, then times search_medicines() for exact, prefix and misspelt
+queries (index build and fingerprint check included in the first / every lookup).
+
+Runs against a throwaway SQLite database (the in-process trigram index) unless
+DATABASE_URL points at PostgreSQL, where pg_trgm is used:
+
+    python benchmarks/bench_search.py [--rows 50000] [--lookups 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "DATABASE_URL" not in os.environ:
+    _db_dir = tempfile.mkdtemp(prefix="bench_search_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+
+import models  # noqa: E402
+from database import SessionLocal, engine, ensure_indexes  # noqa: E402
+from search import ensure_search_index, search_medicines  # noqa: E402
+
+CONSONANTS = "bcdfghklmnprstvxz"
+VOWELS = "aeiou"
+ENDINGS = ["", "", "n", "l", "m", "x", "ne", "ol", "in", "ide", "ate", "one", "cin", "pril", "sartan", "statin"]
+STRENGTHS = ["5mg", "10mg", "20mg", "40mg", "100mg", "250mg", "500mg", "1g", "5ml"]
+
+
+def _molecules(rng: random.Random, count: int):
+    """Pseudo drug names: 2-4 consonant-vowel syllables plus a common pharmaceutical ending."""
+    return [
+        "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 4))) + rng.choice(ENDINGS)
+        for _ in range(count)
+    ]
+
+
+def _name(rng: random.Random, molecules) -> str:
+    # Like a real catalog: many products share a molecule, differing by strength
+    return f"{rng.choice(molecules).capitalize()} {rng.choice(STRENGTHS)}"
+
+
+def _misspell(rng: random.Random, name: str) -> str:
+    word = name.split()[0]
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]  # drop one letter
+
+
+def _ms(values, pct):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000, 2)
+
+
+def run(rows: int, lookups: int):
+    models.Base.metadata.create_all(bind=engine)
+    ensure_indexes(models.Base.metadata)
+    backend = "pg_trgm" if ensure_search_index(engine) else "in-process index"
+    rng = random.Random(7)
+    db = SessionLocal()
+    try:
+        user = models.User(username=f"bench-search-{time.time_ns()}", hashed_password="x")
+        db.add(user)
+        db.commit()
+        molecules = _molecules(rng, max(rows // 10, 1))
+        names = [_name(rng, molecules) for _ in range(rows)]
+        db.execute(insert(models.Medicine), [
+            {"name": name, "price": 1.0, "expiry_date": date(2030, 1, 1), "user_id": user.id} for name in names
+        ])
+        db.commit()
+
+        start = time.perf_counter()
+        search_medicines(db, user.id, "warm up")
+        print(f"{rows} medicines, {backend}; first lookup (builds the index): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        for label, make_query in [
+            ("exact", lambda name: name),
+            ("first word", lambda name: name.split()[0]),
+            ("prefix", lambda name: name.split()[0][:5]),
+            ("misspelt", lambda name: _misspell(rng, name)),
+        ]:
+            latencies, hits = [], 0
+            for _ in range(lookups):
+                target = rng.choice(names)
+                query = make_query(target)
+                start = time.perf_counter()
+                results = search_medicines(db, user.id, query)
+                latencies.append(time.perf_counter() - start)
+                hits += any(result["name"].split()[0] == target.split()[0] for result in results)
+            print(f"{label:>10}: p50={_ms(latencies, 50)} ms p95={_ms(latencies, 95)} ms "
+                  f"max={_ms(latencies, 100)} ms, target medicine found {hits}/{lookups}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+    run(args.rows, args.lookups)
@@ -0,0 +1,344 @@
+# benchmarks/fake_llm_server.py
+"""
+Offline stand-in for Groq: an OpenAI-compatible /v1/chat/completions server with
+configurable latency, injected failures and canned or scripted answers, so the
+chatbot, OCR-text and voice paths can be exercised and load-tested without an API key.
+
+    python benchmarks/fake_llm_server.py [--port 8001] [--latency lognormal:400,0.5]
+                                         [--token-ms 15] [--error-rate 0.02]
+                                         [--rate-limit-rate 0.01] [--hang-rate 0]
+                                         [--script answers.json] [--seed 7]
+
+and start the API with USE_FAKE_LLM=true (or LLM_BASE_URL=http://127.0.0.1:8001/v1).
+
+What it answers:
+  - tools offered, last message from the user: a tool call chosen from the question
+    (expiry words -> find_expiring_medicines, otherwise get_stock_quantity when a
+    medicine is named), or plain text when no tool fits
+  - last message a tool result: a one-line summary of it
+  - response_format json_object: the medicine fields pulled out of the quoted OCR
+    text or voice transcription in the prompt with a few regexes
+  - stream=true: the same answer as SSE chunks, tool-call arguments split across chunks
+
+Latency specs (milliseconds): "0", "fixed:400", "uniform:200-800", "normal:400,100",
+"lognormal:400,0.5" (median, sigma). Streams wait one sample before the first chunk,
+then --token-ms per chunk.
+
+--script is a JSON list of rules tried in order against the last message's text:
+    [{"match": "paracetamol", "content": "..."},
+     {"match": "expir", "tool_calls": [{"name": "find_expiring_medicines", "arguments": {"days_limit": 7}}]},
+     {"match": "OCR extracted text", "json": {"name": "Dolo 650", ...}}]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+STOCK_STOPWORDS = {
+    "how", "many", "much", "do", "does", "we", "i", "have", "has", "got", "is", "are", "there", "left",
+    "in", "stock", "of", "the", "my", "our", "any", "units", "unit", "tablets", "strips", "what", "whats",
+    "what's", "quantity", "level", "for", "please", "tell", "me", "remaining", "available", "can", "you",
+    "check", "show", "current", "a", "an", "still", "on", "hand", "inventory",
+}
+
+
+def _parse_latency(spec: str):
+    """Returns a function drawing one latency in seconds from `spec`."""
+    kind, _, args = spec.partition(":")
+    if not args:
+        value = float(kind) / 1000
+        return lambda rng: value
+    if kind == "fixed":
+        value = float(args) / 1000
+        return lambda rng: value
+    if kind == "uniform":
+        low, high = (float(v) / 1000 for v in args.split("-"))
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal":
+        mean, sd = (float(v) / 1000 for v in args.split(","))
+        return lambda rng: max(rng.gauss(mean, sd), 0.0)
+    if kind == "lognormal":
+        median, sigma = args.split(",")
+        mu = math.log(float(median) / 1000)
+        return lambda rng: rng.lognormvariate(mu, float(sigma))
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def _quoted_input(prompt: str) -> str:
+    match = re.search(r'(?:transcribed text|extracted text):\s*"(.*)"', prompt, re.IGNORECASE | re.DOTALL)
+    return match.group(1) if match else prompt
+
+
+def extract_medicine(text: str, from_ocr: bool) -> Dict[str, Any]:
+    """Rough medicine fields from label or spoken text; always valid for SmartCreateRequest."""
+    lowered = text.lower()
+    strength = re.search(r"\b\d+(?:\.\d+)?\s?(?:mg|mcg|ml|g|iu)\b", lowered)
+    quantity = re.search(r"\b(\d+)\s*(?:units?|tablets?|tabs?|strips?|boxes|box|packs?|bottles?|vials?|capsules?)\b", lowered) \
+        or re.search(r"\b(?:quantity|qty)\s*:?\s*(\d+)", lowered)
+    price = re.search(r"(?:price|mrp|rs\.?|inr|₹|\$)\s*:?\s*(\d+(?:\.\d+)?)", lowered)
+    lot = re.search(r"\b(?:lot|batch)(?:\s*(?:number|no\.?))?\s*:?\s*([a-z0-9][a-z0-9-]*)", lowered)
+    barcode = re.search(r"\b\d{13}\b", text)
+
+    expiry = None
+    iso = re.search(r"\b(20\d\d)-(\d\d)-(\d\d)\b", text)
+    month_year = re.search(r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s*,?\s*(20\d\d)\b", lowered)
+    numeric = re.search(r"\b(\d{1,2})\s*[/-]\s*(20\d\d)\b", lowered)
+    if iso:
+        expiry = iso.group(0)
+    elif month_year:
+        expiry = f"{month_year.group(2)}-{MONTHS[month_year.group(1)]:02d}-01"
+    elif numeric and 1 <= int(numeric.group(1)) <= 12:
+        expiry = f"{numeric.group(2)}-{int(numeric.group(1)):02d}-01"
+
+    # The name: what follows "of" in "50 strips of Dolo 650", else the first words before the strength
+    name_match = re.search(r"\bof\s+([a-z][a-z0-9 ]*?)(?=\s+(?:expir\w*|exp|lot|batch|price|mrp|at|for|with)\b|[,.]|$)", lowered)
+    if name_match:
+        name = name_match.group(1)
+    else:
+        head = lowered[:strength.start()] if strength else lowered
+        words = [w for w in re.findall(r"[a-z][a-z-]+", head) if w not in {"add", "received", "new", "stock", "tablets", "tablet"}]
+        name = " ".join(words[-2:]) if words else "Unknown medicine"
+    name = re.sub(r"\b\d+(?:\.\d+)?\s?(?:mg|mcg|ml|g|iu)\b", "", name).strip().title() or "Unknown medicine"
+
+    result = {
+        "name": name,
+        "manufacturer": "Unknown",
+        "strength": strength.group(0).replace(" ", "") if strength else "N/A",
+        "price": float(price.group(1)) if price else 0.0,
+        "lot_number": lot.group(1).upper() if lot else f"LOT-{'OCR' if from_ocr else 'VOICE'}-{date.today():%Y%m%d}",
+        "quantity": int(quantity.group(1)) if quantity else 1,
+        "expiry_date": expiry or (date.today() + timedelta(days=365)).isoformat(),
+        "barcode": barcode.group(0) if barcode else None,
+    }
+    if from_ocr:
+        result.update({"category": None, "requires_prescription": False,
+                       "storage_instructions": None, "side_effects": None})
+    return result
+
+
+class FakeLLM:
+    """Answer generation, latency and fault injection, and request counters."""
+
+    def __init__(self, latency: str = "0", token_ms: float = 15, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, hang_rate: float = 0.0, hang_seconds: float = 60,
+                 script: Optional[List[Dict[str, Any]]] = None, seed: Optional[int] = None):
+        self.sample_latency = _parse_latency(latency)
+        self.token_seconds = token_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.script = [dict(rule, pattern=re.compile(rule["match"], re.IGNORECASE)) for rule in (script or [])]
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "streams": 0, "tool_calls": 0, "json": 0,
+                       "errors_500": 0, "errors_429": 0, "hangs": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+            if name == "in_flight":
+                self.counts["max_in_flight"] = max(self.counts["max_in_flight"], self.counts["in_flight"])
+
+    # --- answers ---
+
+    def _scripted(self, text: str) -> Optional[Dict[str, Any]]:
+        for rule in self.script:
+            if rule["pattern"].search(text):
+                return rule
+        return None
+
+    def _tool_call(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+    def _choose_tool(self, question: str, tool_names: List[str]) -> Optional[Dict[str, Any]]:
+        lowered = question.lower()
+        if "expir" in lowered and "find_expiring_medicines" in tool_names:
+            span = re.search(r"(\d+)\s*(day|week|month|year)", lowered)
+            days = int(span.group(1)) * {"day": 1, "week": 7, "month": 30, "year": 365}[span.group(2)] if span else 30
+            return self._tool_call("find_expiring_medicines", {"days_limit": days})
+        if "get_stock_quantity" in tool_names:
+            words = [w for w in re.findall(r"[a-z0-9']+", lowered) if w not in STOCK_STOPWORDS]
+            if words and re.search(r"\b(how many|how much|stock|quantity|left|have)\b", lowered):
+                return self._tool_call("get_stock_quantity", {"medicine_name": " ".join(words)})
+        return None
+
+    def answer(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """The assistant message for a chat.completions request: {content, tool_calls}."""
+        messages = body.get("messages") or []
+        last = messages[-1] if messages else {"role": "user", "content": ""}
+        text = last.get("content") or ""
+        rule = self._scripted(text)
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+
+        if rule is not None:
+            if "tool_calls" in rule:
+                return {"content": None, "tool_calls": [self._tool_call(c["name"], c.get("arguments", {})) for c in rule["tool_calls"]]}
+            if "json" in rule:
+                return {"content": json.dumps(rule["json"]), "tool_calls": None}
+            return {"content": rule.get("content", ""), "tool_calls": None}
+
+        if json_mode:
+            self._count("json")
+            from_ocr = "ocr" in text.lower()
+            return {"content": json.dumps(extract_medicine(_quoted_input(text), from_ocr)), "tool_calls": None}
+
+        if last.get("role") == "tool":
+            results = [m for m in messages if m.get("role") == "tool"]
+            summary = "; ".join(str(m.get("content"))[:200] for m in results)
+            return {"content": f"Here's what I found in your inventory: {summary}", "tool_calls": None}
+
+        tool_names = [t["function"]["name"] for t in body.get("tools") or [] if t.get("type") == "function"]
+        if tool_names and body.get("tool_choice") != "none":
+            call = self._choose_tool(text, tool_names)
+            if call:
+                self._count("tool_calls")
+                return {"content": None, "tool_calls": [call]}
+        return {"content": "I can help with stock levels and expiry dates for the medicines in your inventory.",
+                "tool_calls": None}
+
+    # --- responses ---
+
+    def completion(self, body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_tokens = sum(_tokens(str(m.get("content") or "")) for m in body.get("messages") or [])
+        completion_tokens = _tokens(message["content"] or json.dumps(message["tool_calls"]))
+        out = {"role": "assistant", "content": message["content"]}
+        if message["tool_calls"]:
+            out["tool_calls"] = message["tool_calls"]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:16]}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": out, "finish_reason": "tool_calls" if message["tool_calls"] else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    async def chunks(self, body: Dict[str, Any], message: Dict[str, Any]):
+        """SSE frames for a streamed answer, one word (or argument fragment) per chunk."""
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:16]}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "fake")}
+
+        def frame(delta, finish_reason=None):
+            return "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}) + "\n\n"
+
+        yield frame({"role": "assistant", "content": ""})
+        if message["tool_calls"]:
+            for index, call in enumerate(message["tool_calls"]):
+                arguments = call["function"]["arguments"]
+                yield frame({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                             "function": {"name": call["function"]["name"], "arguments": ""}}]})
+                for start in range(0, len(arguments), 8):
+                    await asyncio.sleep(self.token_seconds)
+                    yield frame({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + 8]}}]})
+            yield frame({}, "tool_calls")
+        else:
+            for word in re.findall(r"\S+\s*", message["content"] or ""):
+                await asyncio.sleep(self.token_seconds)
+                yield frame({"content": word})
+            yield frame({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    async def handle(self, body: Dict[str, Any]):
+        self._count("requests")
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            self._count("errors_500")
+            return JSONResponse({"error": {"message": "injected server error", "type": "server_error"}}, status_code=500)
+        roll -= self.error_rate
+        if roll < self.rate_limit_rate:
+            self._count("errors_429")
+            return JSONResponse({"error": {"message": "injected rate limit", "type": "rate_limit"}},
+                                status_code=429, headers={"Retry-After": "1"})
+        roll -= self.rate_limit_rate
+        delay = self.sample_latency(self.rng)
+        if roll < self.hang_rate:
+            self._count("hangs")
+            delay = self.hang_seconds
+
+        self._count("in_flight")
+        try:
+            await asyncio.sleep(delay)
+            message = self.answer(body)
+        finally:
+            self._count("in_flight", -1)
+        if body.get("stream"):
+            self._count("streams")
+            return StreamingResponse(self.chunks(body, message), media_type="text/event-stream")
+        return JSONResponse(self.completion(body, message))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def create_app(fake: FakeLLM) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+
+    # Groq's path as well, so a base URL copied from production settings also works
+    @app.post("/v1/chat/completions")
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        return await fake.handle(await request.json())
+
+    @app.get("/v1/models")
+    def list_models():
+        return {"object": "list", "data": [{"id": "llama-3.1-8b-instant", "object": "model", "owned_by": "fake"}]}
+
+    @app.get("/stats")
+    def stats():
+        return fake.stats()
+
+    return app
+
+
+def start_in_thread(fake: FakeLLM, host: str = "127.0.0.1", port: int = 8001):
+    """Serves `fake` from a daemon thread (for benchmarks running the API in-process); returns the server."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(create_app(fake), host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="fake-llm", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_LLM_PORT", "8001")))
+    parser.add_argument("--latency", default=os.getenv("FAKE_LLM_LATENCY", "0"))
+    parser.add_argument("--token-ms", type=float, default=15)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60)
+    parser.add_argument("--script")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    fake = FakeLLM(args.latency, args.token_ms, args.error_rate, args.rate_limit_rate,
+                   args.hang_rate, args.hang_seconds, script, args.seed)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
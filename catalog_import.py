@@ -0,0 +1,192 @@
+# catalog_import.py
+import csv
+import io
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from catalog_names import resolve_names
+from stock import add_stock
+
+# --- CONFIGURATION ---
+# Rows inserted per transaction; a failing chunk is retried row by row
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "50000"))
+
+# CSV list columns use the same separator as /export/inventory
+LIST_SEPARATOR = ";"
+
+
+# --- PARSING ---
+
+def parse_import_file(filename: str, content_type: Optional[str], raw: bytes) -> List[Dict[str, Any]]:
+    """
+    Reads an uploaded catalog as a list of row dicts. JSON must be an array of
+    SmartCreateRequest objects; CSV uses the same field names as headers, with
+    category_names separated by ';'.
+    """
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Catalog file must be UTF-8 encoded.")
+
+    is_json = (filename or "").lower().endswith(".json") or "json" in (content_type or "") \
+        or text.lstrip().startswith("[")
+    if is_json:
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="JSON catalog must be an array of rows.")
+    else:
+        rows = []
+        for row in csv.DictReader(io.StringIO(text)):
+            # Empty cells mean "not given", so the schema defaults apply
+            row = {key.strip(): value.strip() for key, value in row.items() if key and value not in (None, "")}
+            if "category_names" in row:
+                row["category_names"] = [name for name in row["category_names"].split(LIST_SEPARATOR)]
+            rows.append(row)
+
+    if len(rows) > IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {IMPORT_MAX_ROWS} rows per import.")
+    return rows
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+
+# --- IMPORT ---
+
+def _medicine_values(row: schemas.SmartCreateRequest, user_id: int, manufacturer_ids: Dict[str, int]) -> dict:
+    return {
+        "barcode": row.barcode,
+        "name": row.name,
+        "strength": row.strength,
+        "price": row.price,
+        "expiry_date": row.expiry_date,
+        "user_id": user_id,
+        "manufacturer_id": manufacturer_ids.get(row.manufacturer_name) if row.manufacturer_name else None,
+        "requires_prescription": row.requires_prescription,
+        "storage_instructions": row.storage_instructions,
+        "side_effects": row.side_effects,
+    }
+
+
+def _insert_rows(db: Session, rows: List[schemas.SmartCreateRequest], user_id: int,
+                 manufacturer_ids: Dict[str, int], category_ids: Dict[str, int]):
+    """Bulk-inserts medicines (ids returned in input order), their category links, lots and stock totals."""
+    medicine_ids = db.execute(
+        insert(models.Medicine).returning(models.Medicine.id, sort_by_parameter_order=True),
+        [_medicine_values(row, user_id, manufacturer_ids) for row in rows],
+    ).scalars().all()
+
+    links = [
+        {"medicine_id": medicine_id, "category_id": category_ids[name]}
+        for medicine_id, row in zip(medicine_ids, rows)
+        for name in dict.fromkeys(row.category_names)
+    ]
+    if links:
+        db.execute(insert(models.medicine_category), links)
+
+    db.execute(insert(models.InventoryItem), [
+        {
+            "medicine_id": medicine_id,
+            "lot_number": row.lot_number,
+            "quantity": row.quantity,
+            "expiry_date": row.expiry_date,
+        }
+        for medicine_id, row in zip(medicine_ids, rows)
+    ])
+    add_stock(db, {medicine_id: row.quantity for medicine_id, row in zip(medicine_ids, rows)})
+
+
+def import_catalog(db: Session, user_id: int, raw_rows: List[Any]) -> dict:
+    """
+    Creates a medicine + inventory lot per row, like /medicines/smart-create, but with
+    set-based name resolution and chunked bulk inserts. Bad rows are reported and
+    skipped; they never abort the rest of the import.
+    """
+    errors: List[dict] = []
+    valid: List[Tuple[int, schemas.SmartCreateRequest]] = []
+    for index, raw in enumerate(raw_rows, start=1):
+        try:
+            row = schemas.SmartCreateRequest.model_validate(raw)
+        except ValidationError as e:
+            errors.append({"row": index, "error": _validation_message(e)})
+            continue
+        row.category_names = [name.strip() for name in row.category_names if name and name.strip()]
+        if row.manufacturer_name is not None:
+            row.manufacturer_name = row.manufacturer_name.strip() or None
+        valid.append((index, row))
+
+    # Barcodes are unique across all users: reject repeats within the file and ones already taken
+    barcodes = {row.barcode for _, row in valid if row.barcode}
+    taken = set()
+    if barcodes:
+        taken = set(db.execute(
+            select(models.Medicine.barcode).where(models.Medicine.barcode.in_(barcodes))
+        ).scalars())
+    seen = set()
+    accepted: List[Tuple[int, schemas.SmartCreateRequest]] = []
+    for index, row in valid:
+        if row.barcode and (row.barcode in taken or row.barcode in seen):
+            errors.append({"row": index, "error": f"Barcode {row.barcode} already exists."})
+            continue
+        if row.barcode:
+            seen.add(row.barcode)
+        accepted.append((index, row))
+
+    created_manufacturers: List[str] = []
+    created_categories: List[str] = []
+    manufacturers = resolve_names(
+        db, models.Manufacturer, (row.manufacturer_name for _, row in accepted if row.manufacturer_name),
+        created_manufacturers,
+    )
+    categories = resolve_names(
+        db, models.Category, (name for _, row in accepted for name in row.category_names), created_categories,
+    )
+    db.commit()
+    manufacturer_ids = {name: snapshot["id"] for name, snapshot in manufacturers.items()}
+    category_ids = {name: snapshot["id"] for name, snapshot in categories.items()}
+
+    created = 0
+    chunk_size = max(IMPORT_CHUNK_SIZE, 1)
+    for start in range(0, len(accepted), chunk_size):
+        chunk = accepted[start:start + chunk_size]
+        try:
+            _insert_rows(db, [row for _, row in chunk], user_id, manufacturer_ids, category_ids)
+            db.commit()
+            created += len(chunk)
+        except IntegrityError:
+            db.rollback()
+            # Find the offending rows one at a time, keeping the rest of the chunk
+            for index, row in chunk:
+                try:
+                    with db.begin_nested():
+                        _insert_rows(db, [row], user_id, manufacturer_ids, category_ids)
+                    created += 1
+                except IntegrityError as e:
+                    errors.append({"row": index, "error": f"Database constraint violated: {e.orig}"})
+            db.commit()
+
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "total": len(raw_rows),
+        "created": created,
+        "failed": len(raw_rows) - created,
+        "created_manufacturers": len(created_manufacturers),
+        "created_categories": len(created_categories),
+        "errors": errors,
+    }
@@ -0,0 +1,142 @@
+# catalog_names.py
+import os
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from result_cache import ResultCache
+
+# --- CONFIGURATION ---
+CATALOG_NAME_CACHE_SIZE = int(os.getenv("CATALOG_NAME_CACHE_SIZE", "4096"))
+CATALOG_NAME_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_NAME_CACHE_TTL_SECONDS", "600"))
+
+# --- NAME -> ROW CACHE ---
+# Category and manufacturer rows are shared by every user and never renamed, so a
+# process-wide cache of name -> row snapshot (a plain dict of the columns) lets
+# smart-create skip those lookups entirely. Rows found or created inside a transaction
+# only become visible in the cache once that transaction commits.
+
+_caches = {
+    models.Category: ResultCache("category_names", CATALOG_NAME_CACHE_SIZE,
+                                 ttl_seconds=CATALOG_NAME_CACHE_TTL_SECONDS, use_disk=False),
+    models.Manufacturer: ResultCache("manufacturer_names", CATALOG_NAME_CACHE_SIZE,
+                                     ttl_seconds=CATALOG_NAME_CACHE_TTL_SECONDS, use_disk=False),
+}
+
+_PENDING_KEY = "catalog_names_pending"
+
+
+def _snapshot(model, row) -> dict:
+    return {column.name: row._mapping[column] for column in model.__table__.columns}
+
+
+def _stage(db: Session, model, snapshots: Iterable[dict]):
+    pending = db.info.setdefault(_PENDING_KEY, [])
+    pending.extend((model, snapshot) for snapshot in snapshots)
+
+
+@event.listens_for(Session, "after_commit")
+def _promote_pending(session):
+    for model, snapshot in session.info.pop(_PENDING_KEY, ()):
+        _caches[model].set(snapshot["name"], snapshot)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def invalidate_names(model=None):
+    """Empties the name cache for one model (or all), e.g. after rows were deleted out of band."""
+    for cached_model, cache in _caches.items():
+        if model is None or cached_model is model:
+            cache.clear()
+
+
+# --- UPSERT ---
+
+def _insert_missing(db: Session, model, names: List[str]) -> List[dict]:
+    """
+    INSERT ... ON CONFLICT (name) DO NOTHING RETURNING <row> in one statement; names that
+    already existed (or were inserted concurrently) are simply not returned.
+    """
+    values = [{"name": name} for name in names]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = (
+            dialect_insert(model)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=[model.name])
+            .returning(*model.__table__.columns)
+        )
+        return [_snapshot(model, row) for row in db.execute(stmt)]
+
+    # Other backends: insert only the names not there yet, each under its own savepoint so
+    # a name inserted concurrently loses just that row; resolve_names re-reads the rest
+    present = set(db.scalars(select(model.name).where(model.name.in_(names))))
+    created = []
+    for value in values:
+        if value["name"] in present:
+            continue
+        try:
+            with db.begin_nested():
+                row = db.execute(insert(model).values(**value).returning(*model.__table__.columns)).one()
+            created.append(_snapshot(model, row))
+        except IntegrityError:
+            pass
+    return created
+
+
+def resolve_names(db: Session, model, names: Iterable[str], created_names: Optional[List[str]] = None) -> Dict[str, dict]:
+    """
+    Maps each name to its row snapshot, creating missing rows. Cached names cost no
+    queries; new names cost one INSERT ... RETURNING; names that already existed but
+    weren't cached cost one SELECT on top. Names this call created are appended to
+    `created_names` when given.
+    """
+    cache = _caches[model]
+    resolved: Dict[str, dict] = {}
+    unknown = []
+    for name in dict.fromkeys(names):
+        snapshot = cache.get(name)
+        if snapshot is None:
+            unknown.append(name)
+        else:
+            resolved[name] = snapshot
+    if not unknown:
+        return resolved
+
+    created = _insert_missing(db, model, unknown)
+    found = {snapshot["name"]: snapshot for snapshot in created}
+    existing = [name for name in unknown if name not in found]
+    if existing:
+        rows = db.execute(select(*model.__table__.columns).where(model.name.in_(existing)))
+        for row in rows:
+            snapshot = _snapshot(model, row)
+            found[snapshot["name"]] = snapshot
+    for snapshot in created:
+        print(f"Created new {model.__name__.lower()}: {snapshot['name']}")
+        if created_names is not None:
+            created_names.append(snapshot["name"])
+
+    _stage(db, model, found.values())
+    resolved.update(found)
+    return resolved
+
+
+def get_or_create_category(db: Session, category_name: str) -> dict:
+    """Category row snapshot for the name, created if needed (see resolve_names)."""
+    return resolve_names(db, models.Category, [category_name])[category_name]
+
+
+def get_or_create_manufacturer(db: Session, manufacturer_name: str) -> Optional[dict]:
+    """Manufacturer row snapshot for the name, created if needed (see resolve_names)."""
+    if not manufacturer_name:
+        return None
+    return resolve_names(db, models.Manufacturer, [manufacturer_name])[manufacturer_name]
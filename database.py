@@ -1,6 +1,8 @@
 # database.py
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -25,4 +27,53 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def ensure_indexes(metadata):
+    """create_all skips tables that already exist, so add any indexes declared since then."""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+# --- ASYNC ENGINE ---
+# Same database through an async driver (asyncpg for Postgres, aiosqlite for SQLite),
+# used by the hot endpoints so they don't tie up a threadpool thread per request.
+
+def to_async_url(url: str):
+    """Maps a sync DATABASE_URL onto its async driver, translating libpq-only options for asyncpg."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    if backend == "postgresql":
+        query = dict(parsed.query)
+        # asyncpg takes "ssl" instead of libpq's "sslmode" and doesn't know channel_binding (Neon adds both)
+        sslmode = query.pop("sslmode", None)
+        if sslmode and sslmode != "disable":
+            query["ssl"] = sslmode
+        query.pop("channel_binding", None)
+        return parsed.set(drivername="postgresql+asyncpg", query=query)
+    return parsed
+
+def _async_connect_args(url) -> dict:
+    # PgBouncer-style poolers (e.g. Neon's "-pooler" hosts) can't keep asyncpg's named
+    # prepared statements across transactions, so its statement cache has to be off
+    if url.get_backend_name() == "postgresql" and url.host and "-pooler" in url.host:
+        return {"statement_cache_size": 0}
+    return {}
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    connect_args=_async_connect_args(ASYNC_DATABASE_URL),
+)
+
+# expire_on_commit=False: objects stay readable after commit without an implicit (and,
+# under asyncio, illegal) lazy reload
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,165 @@
+# dispensing.py
+import os
+from datetime import date
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, exists, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from stock import add_stock_async, delete_stock_statement
+
+# --- CONFIGURATION ---
+# A FEFO dispense that loses a race re-reads the lots and tries again, up to this many
+# times, before answering 409. PostgreSQL locks the lots so only SQLite ever retries.
+DISPENSE_MAX_ATTEMPTS = int(os.getenv("DISPENSE_MAX_ATTEMPTS", "5"))
+
+
+class _StockChanged(Exception):
+    """A lot changed between reading and writing it; the allocation is redone."""
+
+
+# --- SINGLE LOT ---
+
+async def take_from_lot(db: AsyncSession, item_id: int, quantity: int) -> Optional[int]:
+    """
+    Removes `quantity` from one lot in a single conditional UPDATE ... RETURNING, so
+    concurrent dispenses can never oversell it. Returns what is left, or None when the
+    lot doesn't hold enough.
+    """
+    result = await db.execute(
+        update(models.InventoryItem)
+        .where(models.InventoryItem.id == item_id, models.InventoryItem.quantity >= quantity)
+        .values(quantity=models.InventoryItem.quantity - quantity)
+        .returning(models.InventoryItem.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar()
+
+
+async def delete_empty_lots(db: AsyncSession, item_ids: List[int]) -> int:
+    """Deletes the given lots that are (still) at zero, in one statement."""
+    result = await db.execute(
+        delete(models.InventoryItem)
+        .where(models.InventoryItem.id.in_(item_ids), models.InventoryItem.quantity == 0)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def remove_medicine_if_empty(db: AsyncSession, medicine_id: int, user_id: int) -> bool:
+    """Drops the catalog entry (and its category links and stock total) once its last lot is gone."""
+    no_lots = ~exists().where(models.InventoryItem.medicine_id == medicine_id)
+    await db.execute(delete_stock_statement(medicine_id).where(no_lots))
+    await db.execute(
+        delete(models.medicine_category)
+        .where(models.medicine_category.c.medicine_id == medicine_id, no_lots)
+    )
+    result = await db.execute(
+        delete(models.Medicine)
+        .where(models.Medicine.id == medicine_id, models.Medicine.user_id == user_id, no_lots)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+# --- FIRST-EXPIRY-FIRST-OUT ---
+
+async def _allocate(db: AsyncSession, medicine_id: int, user_id: int, quantity: int, today: date) -> dict:
+    # FOR UPDATE (a no-op on SQLite) locks the lots in expiry order, so concurrent
+    # dispenses of the same medicine queue up instead of deadlocking
+    lots = (await db.execute(
+        select(
+            models.InventoryItem.id,
+            models.InventoryItem.lot_number,
+            models.InventoryItem.expiry_date,
+            models.InventoryItem.quantity,
+        )
+        .where(
+            models.InventoryItem.medicine_id == medicine_id,
+            models.InventoryItem.quantity > 0,
+            models.InventoryItem.expiry_date >= today,
+        )
+        .order_by(models.InventoryItem.expiry_date, models.InventoryItem.id)
+        .with_for_update()
+    )).all()
+
+    available = sum(lot.quantity for lot in lots)
+    if available < quantity:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insufficient stock: {available} unexpired unit(s) available, {quantity} requested.",
+        )
+
+    allocations = []
+    emptied = []
+    partial = None
+    needed = quantity
+    for lot in lots:
+        if needed == 0:
+            break
+        take = min(lot.quantity, needed)
+        needed -= take
+        allocations.append({
+            "item_id": lot.id,
+            "lot_number": lot.lot_number,
+            "expiry_date": lot.expiry_date,
+            "quantity": take,
+            "remaining": lot.quantity - take,
+        })
+        if take == lot.quantity:
+            emptied.append((lot.id, lot.quantity))
+        else:
+            partial = allocations[-1]
+
+    # Every write is conditional on the quantity read above; without row locks another
+    # dispense may have got there first, and then the whole allocation is redone
+    if emptied:
+        result = await db.execute(
+            delete(models.InventoryItem)
+            .where(tuple_(models.InventoryItem.id, models.InventoryItem.quantity).in_(emptied))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(emptied):
+            raise _StockChanged()
+    if partial:
+        left = await take_from_lot(db, partial["item_id"], partial["quantity"])
+        if left is None:
+            raise _StockChanged()
+        partial["remaining"] = left
+        if left == 0:
+            # Another dispense drew the same lot down concurrently and left it empty
+            await delete_empty_lots(db, [partial["item_id"]])
+
+    await add_stock_async(db, {medicine_id: -quantity})
+
+    medicine_removed = False
+    if available == quantity:
+        medicine_removed = await remove_medicine_if_empty(db, medicine_id, user_id)
+
+    return {
+        "medicine_id": medicine_id,
+        "dispensed": quantity,
+        "allocations": allocations,
+        "remaining_stock": available - quantity,
+        "medicine_removed": medicine_removed,
+    }
+
+
+async def dispense_fefo(db: AsyncSession, medicine_id: int, user_id: int, quantity: int,
+                        today: Optional[date] = None) -> dict:
+    """
+    Dispenses `quantity` of a medicine across its unexpired lots, earliest expiry first,
+    in one transaction. Emptied lots are deleted in bulk and the catalog entry goes with
+    the last one, as with /inventory/dispense. Returns the per-lot allocation.
+    """
+    today = today or date.today()
+    for _ in range(max(DISPENSE_MAX_ATTEMPTS, 1)):
+        try:
+            result = await _allocate(db, medicine_id, user_id, quantity, today)
+            await db.commit()
+            return result
+        except _StockChanged:
+            await db.rollback()
+    raise HTTPException(status_code=409, detail="Stock changed while dispensing, please retry.")
@@ -0,0 +1,92 @@
+# expiry.py
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, func, or_, select
+
+import models
+
+# --- CONFIGURATION ---
+# Upper edges, in days from today, of the buckets after "expired": 30,60,90 gives
+# expired / 0-30 / 31-60 / 61-90 days
+EXPIRY_BUCKET_DAYS = sorted(int(days) for days in os.getenv("EXPIRY_BUCKET_DAYS", "30,60,90").split(","))
+
+# --- QUERIES ---
+# Both go medicines (ix_medicines_user_id) -> inventory_items
+# (ix_inventory_items_medicine_id_expiry_date), so only the user's lots in the expiry
+# range are read, and the medicine name comes from the same join rather than a lazy load.
+
+
+def expiry_buckets_query(user_id: int, today: date):
+    """Lot and unit counts per expiry bucket for one user, as a single GROUP BY."""
+    edges = [today + timedelta(days=days) for days in EXPIRY_BUCKET_DAYS]
+    bucket = case(
+        (models.InventoryItem.expiry_date < today, 0),
+        *[(models.InventoryItem.expiry_date <= edge, i + 1) for i, edge in enumerate(edges)],
+    ).label("bucket")
+    return (
+        select(bucket, func.count(), func.coalesce(func.sum(models.InventoryItem.quantity), 0))
+        .join(models.Medicine, models.Medicine.id == models.InventoryItem.medicine_id)
+        .where(
+            models.Medicine.user_id == user_id,
+            models.InventoryItem.expiry_date <= edges[-1],
+            models.InventoryItem.quantity > 0,
+        )
+        .group_by(bucket)
+    )
+
+
+def summarize_buckets(rows: Sequence[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+    """Turns expiry_buckets_query rows into the full, zero-filled bucket list."""
+    counts = {bucket: (lots, units) for bucket, lots, units in rows}
+    buckets = [{"label": "expired", "max_days": None}]
+    buckets += [{"label": f"{days}_days", "max_days": days} for days in EXPIRY_BUCKET_DAYS]
+    for i, bucket in enumerate(buckets):
+        bucket["lots"], bucket["units"] = counts.get(i, (0, 0))
+    return buckets
+
+
+def expiring_lots_query(user_id: int, before: date, today: date, include_expired: bool = True,
+                        after: Optional[Tuple[date, int]] = None):
+    """
+    The user's lots expiring on or before `before`, soonest first, each with its
+    medicine's name. `after` is the (expiry_date, item id) of the last lot already seen.
+    """
+    query = (
+        select(
+            models.InventoryItem.id,
+            models.InventoryItem.lot_number,
+            models.InventoryItem.expiry_date,
+            models.InventoryItem.quantity,
+            models.Medicine.id.label("medicine_id"),
+            models.Medicine.name.label("medicine_name"),
+        )
+        .join(models.Medicine, models.Medicine.id == models.InventoryItem.medicine_id)
+        .where(
+            models.Medicine.user_id == user_id,
+            models.InventoryItem.expiry_date <= before,
+            models.InventoryItem.quantity > 0,
+        )
+    )
+    if not include_expired:
+        query = query.where(models.InventoryItem.expiry_date >= today)
+    if after:
+        last_expiry, last_id = after
+        query = query.where(or_(
+            models.InventoryItem.expiry_date > last_expiry,
+            and_(models.InventoryItem.expiry_date == last_expiry, models.InventoryItem.id > last_id),
+        ))
+    return query.order_by(models.InventoryItem.expiry_date, models.InventoryItem.id)
+
+
+def lot_dict(row, today: date) -> Dict[str, Any]:
+    return {
+        "item_id": row.id,
+        "medicine_id": row.medicine_id,
+        "medicine_name": row.medicine_name,
+        "lot_number": row.lot_number,
+        "expiry_date": row.expiry_date,
+        "quantity": row.quantity,
+        "days_left": (row.expiry_date - today).days,
+    }
@@ -0,0 +1,221 @@
+# gs1.py
+import calendar
+import os
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# --- CONFIGURATION ---
+# Most scans accepted by one /inventory/receive-gs1/batch request
+GS1_MAX_BATCH_SCANS = int(os.getenv("GS1_MAX_BATCH_SCANS", "1000"))
+
+# --- APPLICATION IDENTIFIER TABLE ---
+# GS1 element strings come either human-readable, "(01)0890...(17)270331(10)AB12", or
+# raw from a 2D scanner, "]d2" + "010890123456789017270331" "10AB12" with variable-length
+# fields terminated by FNC1 (transmitted as ASCII GS, \x1d). Each AI below says how long
+# its value is (fixed) or its maximum (variable), how to decode it, and the key it gets.
+
+class AI(NamedTuple):
+    key: str
+    length: int            # exact length when fixed, maximum length when variable
+    fixed: bool
+    kind: str              # "numeric", "alnum", "date", "decimal", "datetime"
+    decimals: int = 0      # for "decimal": implied decimal places
+
+_TABLE: Dict[str, AI] = {
+    "00": AI("sscc", 18, True, "numeric"),
+    "01": AI("gtin", 14, True, "numeric"),
+    "02": AI("content_gtin", 14, True, "numeric"),
+    "10": AI("lot_number", 20, False, "alnum"),
+    "11": AI("production_date", 6, True, "date"),
+    "12": AI("due_date", 6, True, "date"),
+    "13": AI("packaging_date", 6, True, "date"),
+    "15": AI("best_before_date", 6, True, "date"),
+    "16": AI("sell_by_date", 6, True, "date"),
+    "17": AI("expiry_date", 6, True, "date"),
+    "20": AI("variant", 2, True, "numeric"),
+    "21": AI("serial_number", 20, False, "alnum"),
+    "22": AI("consumer_product_variant", 20, False, "alnum"),
+    "240": AI("additional_product_id", 30, False, "alnum"),
+    "241": AI("customer_part_number", 30, False, "alnum"),
+    "250": AI("secondary_serial_number", 30, False, "alnum"),
+    "30": AI("count", 8, False, "numeric"),
+    "37": AI("trade_item_count", 8, False, "numeric"),
+    "400": AI("order_number", 30, False, "alnum"),
+    "410": AI("ship_to_gln", 13, True, "numeric"),
+    "414": AI("location_gln", 13, True, "numeric"),
+    "422": AI("country_of_origin", 3, True, "numeric"),
+    "7003": AI("expiry_datetime", 10, True, "datetime"),
+    "710": AI("nhrn_de", 20, False, "alnum"),
+    "711": AI("nhrn_fr", 20, False, "alnum"),
+    "712": AI("nhrn_es", 20, False, "alnum"),
+    "713": AI("nhrn_br", 20, False, "alnum"),
+    "714": AI("nhrn_pt", 20, False, "alnum"),
+    "8008": AI("production_datetime", 12, False, "numeric"),
+    "90": AI("internal_90", 30, False, "alnum"),
+}
+# Net weight in kg, 310n: the fourth digit is the number of implied decimals
+for _decimals in range(6):
+    _TABLE[f"310{_decimals}"] = AI("net_weight_kg", 6, True, "decimal", _decimals)
+# Company internal information
+for _ai in range(91, 100):
+    _TABLE[str(_ai)] = AI(f"internal_{_ai}", 90, False, "alnum")
+
+GROUP_SEPARATOR = "\x1d"
+# Symbology identifiers scanners prepend: GS1 DataMatrix, GS1-128, GS1 QR, GS1 DataBar
+_SYMBOLOGY_PREFIXES = ("]d2", "]C1", "]Q3", "]e0", "]J1")
+# Some scanners/keyboard wedges spell GS out instead of sending the control character
+_GS_ALIASES = re.compile(r'<GS>|\{GS\}|\[GS\]|\\x1d|\^\]', re.IGNORECASE)
+_BRACKETED = re.compile(r'\((\d{2,4})\)\s*([^(]*)')
+
+
+class GS1ParseError(ValueError):
+    pass
+
+
+def gtin_check_digit_valid(gtin: str) -> bool:
+    """Mod-10 check for GTIN-8/12/13/14 (weights 3,1,3,... from the right, excluding the check digit)."""
+    if not gtin.isdigit() or len(gtin) not in (8, 12, 13, 14):
+        return False
+    digits = [int(d) for d in gtin]
+    body = digits[:-1][::-1]
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(body))
+    return (10 - total % 10) % 10 == digits[-1]
+
+
+@lru_cache(maxsize=8192)
+def _decode_date(value: str) -> date:
+    year, month, day = int(value[0:2]), int(value[2:4]), int(value[4:6])
+    # GS1 century rule: pick the century that puts the year within -50..+49 of today
+    current = datetime.now().year
+    century = current // 100 * 100
+    delta = year - current % 100
+    if delta >= 51:
+        century -= 100
+    elif delta <= -50:
+        century += 100
+    year += century
+    # Day "00" means the last day of the month
+    if day == 0:
+        day = calendar.monthrange(year, month)[1]
+    return date(year, month, day)
+
+
+def _decode(ai: str, spec: AI, value: str):
+    if spec.kind == "alnum":
+        return value
+    if not value.isdigit():
+        raise GS1ParseError(f"AI ({ai}) must be numeric, got '{value}'")
+    if spec.kind == "date":
+        try:
+            return _decode_date(value)
+        except ValueError:
+            raise GS1ParseError(f"AI ({ai}) has an invalid date '{value}'")
+    if spec.kind == "datetime":
+        try:
+            day = _decode_date(value[:6])
+            return datetime(day.year, day.month, day.day, int(value[6:8]), int(value[8:10]))
+        except ValueError:
+            raise GS1ParseError(f"AI ({ai}) has an invalid date/time '{value}'")
+    if spec.kind == "decimal":
+        return int(value) / (10 ** spec.decimals)
+    if spec.key in ("count", "trade_item_count"):
+        return int(value)
+    return value
+
+
+def _lookup_ai(data: str, pos: int) -> Tuple[str, AI]:
+    # AIs are prefix-free, so the longest table hit is the right one
+    for size in (4, 3, 2):
+        ai = data[pos:pos + size]
+        if len(ai) == size and ai in _TABLE:
+            return ai, _TABLE[ai]
+    raise GS1ParseError(f"Unknown application identifier at position {pos}: '{data[pos:pos + 4]}'")
+
+
+def _split_raw(data: str) -> List[Tuple[str, str]]:
+    elements = []
+    pos = 0
+    while pos < len(data):
+        if data[pos] == GROUP_SEPARATOR:
+            pos += 1
+            continue
+        ai, spec = _lookup_ai(data, pos)
+        start = pos + len(ai)
+        if spec.fixed:
+            end = start + spec.length
+            if end > len(data):
+                raise GS1ParseError(f"AI ({ai}) needs {spec.length} characters")
+        else:
+            separator = data.find(GROUP_SEPARATOR, start)
+            end = separator if separator != -1 else len(data)
+            if end - start > spec.length:
+                raise GS1ParseError(f"AI ({ai}) is longer than {spec.length} characters (missing FNC1 separator?)")
+        elements.append((ai, data[start:end]))
+        pos = end
+    return elements
+
+
+def _split_bracketed(data: str) -> List[Tuple[str, str]]:
+    elements = []
+    for ai, value in _BRACKETED.findall(data):
+        if ai not in _TABLE:
+            raise GS1ParseError(f"Unknown application identifier ({ai})")
+        elements.append((ai, value.strip().rstrip(GROUP_SEPARATOR)))
+    return elements
+
+
+def parse_gs1(data: str, strict: bool = True) -> dict:
+    """
+    Parses a GS1 element string into named fields (gtin, lot_number, expiry_date,
+    serial_number, production_date, count, ...) plus the raw values under "elements".
+    In strict mode malformed data and bad GTIN check digits raise GS1ParseError;
+    otherwise whatever was parsed before the problem is returned.
+    """
+    text = data.strip()
+    for prefix in _SYMBOLOGY_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    text = _GS_ALIASES.sub(GROUP_SEPARATOR, text)
+
+    parsed: dict = {"elements": {}}
+    try:
+        elements = _split_bracketed(text) if text.startswith("(") else _split_raw(text)
+        if not elements:
+            raise GS1ParseError("No GS1 application identifiers found")
+        for ai, value in elements:
+            spec = _TABLE[ai]
+            if spec.fixed and len(value) != spec.length:
+                raise GS1ParseError(f"AI ({ai}) must be {spec.length} characters, got '{value}'")
+            if not spec.fixed and not 0 < len(value) <= spec.length:
+                raise GS1ParseError(f"AI ({ai}) must be 1-{spec.length} characters")
+            parsed[spec.key] = _decode(ai, spec, value)
+            parsed["elements"][ai] = value
+        for key in ("gtin", "content_gtin"):
+            if key in parsed and not gtin_check_digit_valid(parsed[key]):
+                raise GS1ParseError(f"Invalid GTIN check digit: {parsed[key]}")
+    except GS1ParseError:
+        if strict:
+            raise
+    return parsed
+
+
+def parse_gs1_batch(scans: Iterable[str], strict: bool = True) -> List[Tuple[Optional[dict], Optional[str]]]:
+    """
+    Parses many scans in one call, returning (parsed, error) per scan in input order.
+    Identical scan strings (re-scans of the same label) are only parsed once.
+    """
+    memo: Dict[str, Tuple[Optional[dict], Optional[str]]] = {}
+    results = []
+    for scan in scans:
+        outcome = memo.get(scan)
+        if outcome is None:
+            try:
+                outcome = (parse_gs1(scan, strict=strict), None)
+            except GS1ParseError as e:
+                outcome = (None, str(e))
+            memo[scan] = outcome
+        results.append(outcome)
+    return results
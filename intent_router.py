@@ -0,0 +1,205 @@
+# intent_router.py
+import json
+import os
+import re
+import threading
+from datetime import date
+from typing import Any, Dict, NamedTuple, Optional
+
+from search import names_agree
+
+# --- CONFIGURATION ---
+# Answer recognisable stock / expiry questions locally instead of via the LLM
+CHATBOT_LOCAL_INTENTS = os.getenv("CHATBOT_LOCAL_INTENTS", "true").lower() in ("1", "true", "yes")
+# Window used for "what's expiring soon" when the question gives none
+CHATBOT_DEFAULT_EXPIRY_DAYS = int(os.getenv("CHATBOT_DEFAULT_EXPIRY_DAYS", "30"))
+# Lots listed in a templated expiry answer before it is summarised as "... and N more"
+CHATBOT_EXPIRY_LIST_LIMIT = int(os.getenv("CHATBOT_EXPIRY_LIST_LIMIT", "20"))
+
+
+class Intent(NamedTuple):
+    tool: str  # one of the chatbot's tool functions
+    args: Dict[str, Any]
+
+
+# --- PATTERNS ---
+# Anchored on the whole (normalised) message, so anything with more to it than a plain
+# stock or expiry lookup ("... and should I reorder?") is left to the LLM.
+
+_POLITE = re.compile(r"^(?:(?:hi|hey|hello|ok|okay|please|pls|so)\b[\s,]*|(?:can|could|would) you (?:please )?(?:tell me|check|show me|let me know)\s+|tell me\s+|i want to know\s+)+")
+_UNITS = r"(?:units?|tablets?|tabs?|capsules?|caps|strips?|boxes|box|packs?|packets?|bottles?|vials?|pieces?)"
+_HOLDING = r"(?:left|in stock|remaining|available|on hand|in inventory|in my inventory)"
+_LOTS = r"(?:medicines?|meds|medications?|drugs?|items?|batch(?:es)?|lots?|stock|products?|inventory)"
+
+_STOCK_PATTERNS = [re.compile(p) for p in (
+    rf"^how (?:many|much) (?P<name>.+?) (?:do|does|did) (?:i|we) (?:have|got)(?: {_HOLDING})?$",
+    rf"^how (?:many|much) (?P<name>.+?) (?:is|are) (?:there )?(?:still )?{_HOLDING}$",
+    rf"^how (?:many|much) (?P<name>.+?) {_HOLDING}$",
+    r"^(?:(?:what is|what's|whats|show|check|get) )?(?:me )?(?:the )?(?:current )?(?:stock|quantity|qty|count|inventory)(?: level| count)? (?:of|for) (?P<name>.+)$",
+    rf"^(?:do|have) (?:i|we) (?:have|got) (?:any )?(?P<name>.+?)(?: {_HOLDING})?$",
+    r"^(?P<name>.+?) (?:stock|quantity|qty)(?: level| count)?$",
+)]
+
+_EXPIRY_PATTERNS = [re.compile(p) for p in (
+    rf"^(?:what|which)(?: {_LOTS})?(?: (?:is|are|will))? (?:be )?expir(?:es|e|ing)\b(?P<period>.*)$",
+    rf"^(?:what is|what's|whats|anything|is anything|are any {_LOTS}) expiring\b(?P<period>.*)$",
+    rf"^(?:show|list|find|get)(?: me)?(?: all| the| my)?(?: {_LOTS})?(?: that (?:are|will))?(?: be)? expir(?:es|e|ing)\b(?P<period>.*)$",
+    rf"^(?:show|list|find|get)(?: me)?(?: all| the| my)? (?:expiring|expiry)(?: {_LOTS})?\b(?P<period>.*)$",
+    rf"^(?:expiring|expiry|expiries)(?: {_LOTS})?\b(?P<period>.*)$",
+)]
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+_UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+_SPAN = re.compile(
+    r"^(?:in|within|over|during|before|for)?(?: the)? ?(?:next|coming)? ?(?P<count>\d+|"
+    + "|".join(_NUMBER_WORDS) + r") (?P<unit>day|week|month|year)s?$"
+)
+_NAMED_SPANS = {
+    "": None, "soon": None, "shortly": None,
+    "today": 0, "tomorrow": 1,
+    "this week": 7, "next week": 14,
+    "this month": 30, "next month": 60,
+    "this year": 365,
+}
+
+
+def _normalize(message: str) -> str:
+    text = re.sub(r"\s+", " ", message.lower()).strip()
+    text = text.rstrip("?!. ")
+    text = text.replace("’", "'")
+    return _POLITE.sub("", text).strip()
+
+
+def _clean_name(name: str) -> Optional[str]:
+    name = re.sub(rf"^(?:(?:any|the|my|our|of)\s+|{_UNITS}\s+of\s+)+", "", name.strip())
+    name = re.sub(rf"\s+{_UNITS}$", "", name)
+    # Pronouns, question words and whole-inventory words mean the question isn't about
+    # one named medicine ("low stock", "what's the total stock")
+    if not name or re.search(
+        r"\b(?:it|them|that|those|these|expir\w*|medicines?|everything|all|total|low|out|what|which|how)\b", name
+    ):
+        return None
+    return name
+
+
+def _parse_days(period: str) -> Optional[int]:
+    period = period.strip()
+    if period in _NAMED_SPANS:
+        days = _NAMED_SPANS[period]
+        return CHATBOT_DEFAULT_EXPIRY_DAYS if days is None else days
+    match = _SPAN.match(period)
+    if not match:
+        return None
+    count = match.group("count")
+    count = int(count) if count.isdigit() else _NUMBER_WORDS[count]
+    return count * _UNIT_DAYS[match.group("unit")]
+
+
+def classify(message: str) -> Optional[Intent]:
+    """The tool call that answers `message` on its own, or None to ask the LLM."""
+    text = _normalize(message or "")
+    if not text:
+        return None
+    if "expir" in text:
+        for pattern in _EXPIRY_PATTERNS:
+            match = pattern.match(text)
+            days = _parse_days(match.group("period")) if match else None
+            if days is not None:
+                return Intent("find_expiring_medicines", {"days_limit": days})
+        return None
+    for pattern in _STOCK_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            name = _clean_name(match.group("name"))
+            return Intent("get_stock_quantity", {"medicine_name": name}) if name else None
+    return None
+
+
+# --- TEMPLATES ---
+
+def _plural(count: int, word: str) -> str:
+    return f"{count} {word}" if count == 1 else f"{count} {word}s"
+
+
+def _window(days: int) -> str:
+    if days == 0:
+        return "today"
+    return "within the next day" if days == 1 else f"within the next {days} days"
+
+
+def render(intent: Intent, tool_output: str) -> Optional[str]:
+    """
+    A templated answer from the tool's output, or None when the output needs the LLM's
+    judgement (e.g. no medicine matched the name the pattern picked out, or the one
+    matched isn't plainly that name).
+    """
+    try:
+        data = json.loads(tool_output)
+    except ValueError:
+        data = None
+
+    if intent.tool == "get_stock_quantity":
+        if not isinstance(data, dict):
+            return None
+        # The tool tolerates typos; a templated answer is only given for the medicine
+        # actually asked about, so a different product (or strength) goes to the LLM
+        if not names_agree(intent.args["medicine_name"], data["medicine_name"]):
+            return None
+        quantity = data["total_quantity"]
+        if quantity <= 0:
+            return f"You're out of {data['medicine_name']}: there are no units in stock."
+        return f"You have {_plural(quantity, 'unit')} of {data['medicine_name']} in stock."
+
+    if intent.tool == "find_expiring_medicines":
+        days = intent.args["days_limit"]
+        if data is None:
+            return f"Nothing in your inventory expires {_window(days)}."
+        today = date.today().isoformat()
+        lines = [f"{_plural(len(data), 'batch')} expire{'s' if len(data) == 1 else ''} {_window(days)}:"]
+        for lot in data[:CHATBOT_EXPIRY_LIST_LIMIT]:
+            when = "expired" if lot["expiry_date"] < today else "expires"
+            lines.append(f"- {lot['medicine_name']} (lot {lot['lot_number']}) {when} {lot['expiry_date']}")
+        if len(data) > CHATBOT_EXPIRY_LIST_LIMIT:
+            lines.append(f"... and {len(data) - CHATBOT_EXPIRY_LIST_LIMIT} more.")
+        return "\n".join(lines)
+
+    return None
+
+
+# --- COUNTERS ---
+
+_stats_lock = threading.Lock()
+_stats = {
+    "local": {"count": 0, "seconds": 0.0},
+    "llm": {"count": 0, "seconds": 0.0, "calls": 0},
+}
+
+def record_route(source: str, seconds: float, llm_calls: int = 0):
+    with _stats_lock:
+        entry = _stats[source]
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        if llm_calls:
+            entry["calls"] += llm_calls
+
+def router_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        local, llm = _stats["local"], _stats["llm"]
+        total = local["count"] + llm["count"]
+        local_ms = local["seconds"] / local["count"] * 1000 if local["count"] else None
+        llm_ms = llm["seconds"] / llm["count"] * 1000 if llm["count"] else None
+        saved_ms = (llm_ms - local_ms) * local["count"] if local_ms is not None and llm_ms is not None else None
+        return {
+            "served_locally": local["count"],
+            "llm_answered": llm["count"],
+            "local_fraction": round(local["count"] / total, 3) if total else None,
+            "avg_local_ms": round(local_ms, 2) if local_ms is not None else None,
+            "avg_llm_ms": round(llm_ms, 2) if llm_ms is not None else None,
+            "llm_calls": llm["calls"],
+            # Every local answer skips the tool-selection call and the summarising call
+            "llm_calls_avoided": local["count"] * 2,
+            "estimated_ms_saved": round(saved_ms, 1) if saved_ms is not None else None,
+        }
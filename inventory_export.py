@@ -0,0 +1,131 @@
+# inventory_export.py
+import csv
+import io
+import json
+import os
+import zlib
+from typing import Dict, Iterator, List
+
+from sqlalchemy import select
+
+import models
+from database import SessionLocal
+
+# --- CONFIGURATION ---
+# Rows fetched per round trip from the server-side cursor (and per chunk written out)
+EXPORT_PARTITION_SIZE = int(os.getenv("EXPORT_PARTITION_SIZE", "1000"))
+
+# One row per lot; medicines without stock get a single row with empty lot columns
+EXPORT_COLUMNS = [
+    "medicine_id", "barcode", "name", "strength", "price", "medicine_expiry_date",
+    "manufacturer", "categories", "requires_prescription",
+    "item_id", "lot_number", "lot_expiry_date", "quantity",
+]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _export_query(user_id: int):
+    return (
+        select(
+            models.Medicine.id,
+            models.Medicine.barcode,
+            models.Medicine.name,
+            models.Medicine.strength,
+            models.Medicine.price,
+            models.Medicine.expiry_date,
+            models.Manufacturer.name,
+            models.Medicine.requires_prescription,
+            models.InventoryItem.id,
+            models.InventoryItem.lot_number,
+            models.InventoryItem.expiry_date,
+            models.InventoryItem.quantity,
+        )
+        .outerjoin(models.Manufacturer, models.Manufacturer.id == models.Medicine.manufacturer_id)
+        .outerjoin(models.InventoryItem, models.InventoryItem.medicine_id == models.Medicine.id)
+        .where(models.Medicine.user_id == user_id)
+        .order_by(models.Medicine.id, models.InventoryItem.id)
+    )
+
+
+def _categories_for(db, medicine_ids) -> Dict[int, List[str]]:
+    """Category names for one partition's medicines, in a single query."""
+    rows = db.execute(
+        select(models.medicine_category.c.medicine_id, models.Category.name)
+        .join(models.Category, models.Category.id == models.medicine_category.c.category_id)
+        .where(models.medicine_category.c.medicine_id.in_(medicine_ids))
+        .order_by(models.Category.name)
+    )
+    categories: Dict[int, List[str]] = {}
+    for medicine_id, name in rows:
+        categories.setdefault(medicine_id, []).append(name)
+    return categories
+
+
+def _iter_rows(user_id: int) -> Iterator[List[dict]]:
+    """Yields the export a partition at a time, streaming from a server-side cursor."""
+    db = SessionLocal()
+    try:
+        result = db.execute(_export_query(user_id).execution_options(yield_per=EXPORT_PARTITION_SIZE))
+        for partition in result.partitions():
+            categories = _categories_for(db, {row[0] for row in partition})
+            yield [
+                {
+                    "medicine_id": row[0],
+                    "barcode": row[1],
+                    "name": row[2],
+                    "strength": row[3],
+                    "price": row[4],
+                    "medicine_expiry_date": row[5].isoformat() if row[5] else None,
+                    "manufacturer": row[6],
+                    "categories": categories.get(row[0], []),
+                    "requires_prescription": bool(row[7]),
+                    "item_id": row[8],
+                    "lot_number": row[9],
+                    "lot_expiry_date": row[10].isoformat() if row[10] else None,
+                    "quantity": row[11],
+                }
+                for row in partition
+            ]
+    finally:
+        db.close()
+
+
+def _ndjson_chunks(user_id: int) -> Iterator[str]:
+    for rows in _iter_rows(user_id):
+        yield "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def _csv_chunks(user_id: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for rows in _iter_rows(user_id):
+        for row in rows:
+            row["categories"] = ";".join(row["categories"])
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty catalog
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_inventory_export(user_id: int, fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """
+    Encoded export body for StreamingResponse. Memory stays bounded by one partition
+    regardless of catalog size. With `compress`, the output is a gzip stream.
+    """
+    chunks = _csv_chunks(user_id) if fmt == "csv" else _ndjson_chunks(user_id)
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode("utf-8")
+        return
+    # wbits=31 writes a gzip header/trailer, so the result is a valid .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,362 @@
+# llm_gateway.py
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+import openai
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+
+from metrics import Gauge, observe_llm, register_collector
+
+# --- CONFIGURATION ---
+# Talk to benchmarks/fake_llm_server.py instead of Groq (no API key needed)
+USE_FAKE_LLM = os.getenv("USE_FAKE_LLM", "false").lower() in ("1", "true", "yes")
+FAKE_LLM_URL = os.getenv("FAKE_LLM_URL", "http://127.0.0.1:8001/v1")
+# Any OpenAI-compatible endpoint: Groq by default, or a local stand-in for tests/benchmarks
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", FAKE_LLM_URL if USE_FAKE_LLM else "https://api.groq.com/openai/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+# Limit for one upstream attempt (for a stream: until the first chunk, then between chunks)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "15"))
+# Limit for the whole call, including queueing for a slot, retries and backoff
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+# Retries after the first attempt, on timeouts, connection errors, 429 and 5xx only
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Backoff before retry n is uniform in [0, min(cap, base * 2**(n-1))] ("full jitter")
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "4"))
+# Send a second, identical request if the first hasn't answered after this long; 0 = off
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))
+# Upstream requests in flight at once (streams hold a slot until they finish)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_RETRY_AFTER_SECONDS = int(os.getenv("LLM_RETRY_AFTER_SECONDS", "2"))
+# Pooled keep-alive connections to the LLM host
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", str(max(LLM_MAX_CONCURRENCY * 2, 1))))
+
+# Worth another attempt; anything else (400, 401, bad JSON schema, ...) fails straight away
+_RETRYABLE = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def _percentile(sorted_values, pct: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 1)
+
+
+def _outcome(error: Exception) -> str:
+    """Metric label for a failed upstream request."""
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+        return "timeout"
+    if isinstance(error, openai.APIStatusError):
+        return f"http_{error.status_code}"
+    return "error"
+
+
+def _retry_after(error: Exception) -> float:
+    """Seconds a 429/503 asked us to wait, if it said."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
+class LLMGateway:
+    """
+    The one way the API talks to the LLM. Owns a pooled async HTTP client and bounds
+    every call: a per-attempt timeout inside an overall deadline, a few jittered
+    retries for transient failures, an optional hedged second request for slow
+    answers, and a global cap on concurrent upstream requests. Identical concurrent
+    requests share one upstream call.
+    """
+
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: Optional[str] = None,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY):
+        self.base_url = base_url
+        self.api_key = api_key if api_key is not None else os.getenv("GROQ_API_KEY")
+        if not self.api_key and USE_FAKE_LLM:
+            self.api_key = "fake"
+        self.max_concurrency = max(max_concurrency, 1)
+        # The client, semaphore and in-flight table belong to one event loop; they are
+        # created on first use and recreated if the loop changes (tests, reloads)
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._counts = {
+            "calls": 0, "streams": 0, "coalesced": 0, "upstream_requests": 0, "retries": 0,
+            "hedges": 0, "hedge_wins": 0, "timeouts": 0, "failed": 0, "rejected": 0,
+        }
+        self._active = 0
+        self._latencies = deque(maxlen=1000)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or "missing",
+                base_url=self.base_url,
+                # Retries and timeouts are ours; the SDK's own would multiply them
+                max_retries=0,
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=min(5.0, LLM_TIMEOUT_SECONDS)),
+                http_client=httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                )),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+        return self._client
+
+    async def close(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.close()
+        self._client = None
+        self._loop = None
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counts[name] += amount
+
+    # --- one upstream request ---
+
+    async def _acquire(self, deadline: float):
+        remaining = deadline - time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), max(remaining, 0.001))
+        except asyncio.TimeoutError:
+            self._count("rejected")
+            raise HTTPException(
+                status_code=503,
+                detail="The assistant is busy, please retry shortly.",
+                headers={"Retry-After": str(LLM_RETRY_AFTER_SECONDS)},
+            )
+        with self._lock:
+            self._active += 1
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+        self._semaphore.release()
+
+    async def _request(self, payload: Dict[str, Any], deadline: float):
+        await self._acquire(deadline)
+        try:
+            self._count("upstream_requests")
+            timeout = min(LLM_TIMEOUT_SECONDS, deadline - time.monotonic())
+            if timeout <= 0:
+                raise asyncio.TimeoutError()
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(self._client.chat.completions.create(**payload), timeout)
+            except BaseException as e:
+                observe_llm("chat", _outcome(e) if isinstance(e, Exception) else "cancelled", time.monotonic() - started)
+                raise
+            observe_llm("chat", "ok", time.monotonic() - started, getattr(result, "usage", None))
+            return result
+        finally:
+            self._release()
+
+    async def _hedged(self, payload: Dict[str, Any], deadline: float):
+        """One attempt, plus a duplicate request if the first is slower than LLM_HEDGE_AFTER_SECONDS."""
+        primary = asyncio.ensure_future(self._request(payload, deadline))
+        if LLM_HEDGE_AFTER_SECONDS <= 0 or deadline - time.monotonic() <= LLM_HEDGE_AFTER_SECONDS:
+            return await primary
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=LLM_HEDGE_AFTER_SECONDS)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        # Hedge only with spare capacity; when saturated it would just add load
+        if done or self._semaphore.locked():
+            return await primary
+        self._count("hedges")
+        hedge = asyncio.ensure_future(self._request(payload, deadline))
+        pending, error = {primary, hedge}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, payload: Dict[str, Any]):
+        """Attempts with jittered backoff until success, a non-retryable error or the deadline."""
+        started = time.monotonic()
+        deadline = started + LLM_DEADLINE_SECONDS
+        attempt = 0
+        while True:
+            try:
+                result = await self._hedged(payload, deadline)
+                with self._lock:
+                    self._latencies.append(time.monotonic() - started)
+                return result
+            except _RETRYABLE as e:
+                if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                    self._count("timeouts")
+                attempt += 1
+                delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+                delay = max(delay, _retry_after(e))
+                if attempt > LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                    self._count("failed")
+                    raise self._give_up(e, attempt)
+                print(f"LLM attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                self._count("retries")
+                await asyncio.sleep(delay)
+            except Exception:
+                self._count("failed")
+                raise
+
+    @staticmethod
+    def _give_up(error: Exception, attempts: int) -> HTTPException:
+        if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+            return HTTPException(status_code=504, detail=f"The LLM did not answer in time ({attempts} attempt(s)).")
+        return HTTPException(
+            status_code=503,
+            detail=f"The LLM is unavailable ({type(error).__name__} after {attempts} attempt(s)).",
+            headers={"Retry-After": str(LLM_RETRY_AFTER_SECONDS)},
+        )
+
+    # --- public API ---
+
+    async def chat(self, coalesce: bool = True, **payload):
+        """
+        chat.completions.create(**payload) through the gateway; `model` defaults to
+        LLM_MODEL. Concurrent calls with an identical payload share one upstream
+        request (and its result object) unless `coalesce` is False.
+        """
+        self._bind()
+        payload.setdefault("model", LLM_MODEL)
+        self._count("calls")
+        if not coalesce:
+            return await self._call(payload)
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call(payload))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._count("coalesced")
+        # Shielded so one caller going away doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so an unawaited failure isn't logged as lost
+
+    async def stream(self, **payload) -> AsyncIterator[Any]:
+        """
+        Streamed chat completion chunks. The call holds a concurrency slot until the
+        stream ends; it is retried like chat() only until the first chunk has arrived,
+        after which each chunk must follow the last within LLM_TIMEOUT_SECONDS.
+        """
+        self._bind()
+        payload.setdefault("model", LLM_MODEL)
+        payload["stream"] = True
+        self._count("streams")
+        started = time.monotonic()
+        deadline = started + LLM_DEADLINE_SECONDS
+        attempt = 0
+        while True:
+            await self._acquire(deadline)
+            received = False
+            usage, outcome = None, "cancelled"
+            attempt_started = time.monotonic()
+            try:
+                self._count("upstream_requests")
+                timeout = min(LLM_TIMEOUT_SECONDS, max(deadline - time.monotonic(), 0.001))
+                upstream = await asyncio.wait_for(self._client.chat.completions.create(**payload), timeout)
+                async with upstream:
+                    chunks = upstream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), LLM_TIMEOUT_SECONDS)
+                        except StopAsyncIteration:
+                            break
+                        if not received:
+                            received = True
+                            with self._lock:
+                                self._latencies.append(time.monotonic() - started)
+                        # Sent on the last chunk by servers that report streamed usage (Groq under x_groq)
+                        usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                        yield chunk
+                outcome = "ok"
+                return
+            except _RETRYABLE as e:
+                outcome = _outcome(e)
+                if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                    self._count("timeouts")
+                attempt += 1
+                delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+                delay = max(delay, _retry_after(e))
+                if received or attempt > LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                    self._count("failed")
+                    raise self._give_up(e, attempt)
+                self._count("retries")
+            except Exception as e:
+                outcome = _outcome(e)
+                self._count("failed")
+                raise
+            finally:
+                self._release()
+                observe_llm("stream", outcome, time.monotonic() - attempt_started, usage)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = sorted(self._latencies)
+            active = self._active
+        return {
+            "base_url": self.base_url,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": active,
+            "coalescing": len(self._inflight),
+            **counts,
+            # Whole call, retries included; for streams, until the first chunk
+            "latency_ms": {
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "max": _percentile(latencies, 100),
+            },
+        }
+
+
+llm_gateway = LLMGateway()
+
+_LLM_IN_FLIGHT = Gauge("pharmapal_llm_requests_in_flight", "Upstream LLM requests holding a concurrency slot.")
+
+def _collect_llm():
+    _LLM_IN_FLIGHT.set(llm_gateway.stats()["in_flight"])
+
+register_collector(_collect_llm)
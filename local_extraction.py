@@ -0,0 +1,250 @@
+# local_extraction.py
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+import models
+from result_cache import ResultCache
+from text_parsing import scan_label
+
+# --- CONFIGURATION ---
+# Fields at or above this confidence are trusted without asking the LLM
+LOCAL_EXTRACTION_MIN_CONFIDENCE = float(os.getenv("LOCAL_EXTRACTION_MIN_CONFIDENCE", "0.8"))
+# How long a user's name/strength/manufacturer dictionary is reused before being rebuilt
+CATALOG_DICTIONARY_TTL_SECONDS = int(os.getenv("CATALOG_DICTIONARY_TTL_SECONDS", "60"))
+
+# Without these the result can't become a SmartCreateRequest, so all must be confident to skip the LLM
+REQUIRED_FIELDS = ("name", "expiry_date", "price", "lot_number")
+
+# Keys and defaults of a /chatbot/parse-medicine-text result
+RESULT_DEFAULTS = {
+    "name": None,
+    "manufacturer": "Unknown",
+    "strength": "N/A",
+    "price": 0.0,
+    "lot_number": None,
+    "quantity": 1,
+    "expiry_date": None,
+    "barcode": None,
+    "category": None,
+    "requires_prescription": False,
+    "storage_instructions": None,
+    "side_effects": None,
+}
+
+# How the LLM prompt describes each required field; only the ones the local pass missed are
+# asked for (optional fields keep their local value or default and never trigger a call)
+FIELD_PROMPTS = {
+    "name": "name (string, required)",
+    "price": "price (float, never null: 0.0 if not mentioned)",
+    "lot_number": 'lot_number (string, never null: if not mentioned generate one like "LOT-OCR-YYYYMMDD")',
+    "expiry_date": 'expiry_date (string in "YYYY-MM-DD" format, null if not found)',
+}
+
+STRENGTH_PATTERN = re.compile(r'\b\d+(?:\.\d+)?\s?(?:mg|mcg|µg|g|ml|iu|%)(?:\s?/\s?\d*\s?(?:ml|g))?(?![a-z])', re.IGNORECASE)
+BARCODE_PATTERN = re.compile(r'\b\d{13}\b')
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^a-z0-9%.]+', ' ', text.lower()).strip()
+
+
+class CatalogDictionary:
+    """Known medicine and manufacturer names, normalised for whole-word matching in OCR text."""
+
+    def __init__(self, medicines: List[Dict[str, Any]], manufacturers: List[str]):
+        # normalised name -> catalog rows with that name (one per strength/pack)
+        self.medicines: Dict[str, List[Dict[str, Any]]] = {}
+        for medicine in medicines:
+            key = _normalize(medicine["name"])
+            if key:
+                self.medicines.setdefault(key, []).append(medicine)
+        self.manufacturers = {_normalize(name): name for name in manufacturers if name and name != "Unknown"}
+
+    @staticmethod
+    def _longest_match(haystack: str, names) -> Optional[str]:
+        best = None
+        for name in names:
+            if (best is None or len(name) > len(best)) and f" {name} " in haystack:
+                best = name
+        return best
+
+    def match_medicine(self, normalized_text: str) -> Optional[str]:
+        return self._longest_match(f" {normalized_text} ", self.medicines)
+
+    def match_manufacturer(self, normalized_text: str) -> Optional[str]:
+        key = self._longest_match(f" {normalized_text} ", self.manufacturers)
+        return self.manufacturers[key] if key else None
+
+
+_dictionaries = ResultCache("catalog_dictionary", max_entries=256,
+                            ttl_seconds=CATALOG_DICTIONARY_TTL_SECONDS, use_disk=False)
+
+def get_catalog_dictionary(db: Session, user_id: int) -> CatalogDictionary:
+    """Builds (or reuses) the dictionary from the user's medicines and the shared manufacturers table."""
+    cache_key = str(user_id)
+    dictionary = _dictionaries.get(cache_key)
+    if dictionary is not None:
+        return dictionary
+
+    # Plain columns, not ORM objects: the rest of a matched medicine is read by fill_catalog_details
+    rows = db.execute(
+        select(models.Medicine.id, models.Medicine.name, models.Medicine.strength, models.Manufacturer.name)
+        .outerjoin(models.Manufacturer, models.Manufacturer.id == models.Medicine.manufacturer_id)
+        .where(models.Medicine.user_id == user_id)
+    ).all()
+    medicines = [
+        {"id": medicine_id, "name": name, "strength": strength, "manufacturer": manufacturer}
+        for medicine_id, name, strength, manufacturer in rows
+    ]
+    manufacturers = [name for (name,) in db.query(models.Manufacturer.name).all()]
+    dictionary = CatalogDictionary(medicines, manufacturers)
+    _dictionaries.set(cache_key, dictionary)
+    return dictionary
+
+
+class LocalExtraction:
+    """Field values pulled from OCR text without the LLM, each with a confidence in [0, 1]."""
+
+    def __init__(self):
+        self.fields: Dict[str, Tuple[Any, float]] = {}
+        # Catalog medicine the label was matched to, if any
+        self.matched_medicine_id: Optional[int] = None
+
+    def put(self, field: str, value: Any, confidence: float):
+        if value is None:
+            return
+        current = self.fields.get(field)
+        if current is None or confidence > current[1]:
+            self.fields[field] = (value, confidence)
+
+    def confident(self, field: str) -> bool:
+        return field in self.fields and self.fields[field][1] >= LOCAL_EXTRACTION_MIN_CONFIDENCE
+
+    def is_complete(self) -> bool:
+        return not self.missing_fields()
+
+    def missing_fields(self) -> List[str]:
+        """Required fields the local pass couldn't resolve confidently; only these need the LLM."""
+        return [field for field in REQUIRED_FIELDS if not self.confident(field)]
+
+    def to_result(self) -> Dict[str, Any]:
+        result = dict(RESULT_DEFAULTS)
+        for field, (value, _) in self.fields.items():
+            result[field] = value
+        return result
+
+    def merge(self, llm_result: Dict[str, Any]) -> Dict[str, Any]:
+        """LLM output for the missing required fields; local values (or defaults) everywhere else."""
+        result = dict(RESULT_DEFAULTS)
+        result.update(llm_result)
+        for field, (value, _) in self.fields.items():
+            if self.confident(field) or result.get(field) in (None, "", RESULT_DEFAULTS.get(field)):
+                result[field] = value
+        return result
+
+
+def extract_local(text: str, dictionary: CatalogDictionary) -> LocalExtraction:
+    """Rule-based pass over OCR text using the label regexes and the user's catalog dictionary."""
+    extraction = LocalExtraction()
+    normalized = _normalize(text)
+
+    scan = scan_label(text)
+
+    # A date with an EXP / Use Before label is the expiry; a bare date might be MFG
+    expiry = scan.expiry_date()
+    if expiry is not None:
+        confidence = {"EXP": 0.95, None: 0.6}.get(expiry.label, 0.3)
+        extraction.put("expiry_date", expiry.value.isoformat(), confidence)
+
+    price = scan.price()
+    if price is not None:
+        is_mrp = price.raw.upper().replace(".", "").startswith("MRP")
+        extraction.put("price", price.value, 0.9 if is_mrp else 0.7)
+
+    lot = scan.lot_number()
+    if lot is not None:
+        extraction.put("lot_number", lot.value, 0.9)
+
+    strengths = [_normalize(m.group(0)).replace(" ", "") for m in STRENGTH_PATTERN.finditer(text)]
+    if strengths:
+        extraction.put("strength", strengths[0], 0.85)
+
+    barcode = BARCODE_PATTERN.search(text)
+    if barcode:
+        extraction.put("barcode", barcode.group(0), 0.8)
+
+    manufacturer = dictionary.match_manufacturer(normalized)
+    if manufacturer:
+        extraction.put("manufacturer", manufacturer, 0.9)
+
+    name_key = dictionary.match_medicine(normalized)
+    if name_key:
+        candidates = dictionary.medicines[name_key]
+        # Prefer the catalog row whose strength is printed on this label
+        printed = [c for c in candidates if c["strength"] and c["strength"].replace(" ", "").lower() in strengths]
+        known = printed[0] if printed else candidates[0]
+        extraction.put("name", known["name"], 0.95)
+        if known["strength"] and known["strength"] != "N/A":
+            extraction.put("strength", known["strength"], 0.95 if printed else 0.8)
+        if known["manufacturer"]:
+            extraction.put("manufacturer", known["manufacturer"], 0.9)
+        extraction.matched_medicine_id = known["id"]
+
+    return extraction
+
+
+def fill_catalog_details(db: Session, extraction: LocalExtraction):
+    """Copies category, prescription and storage details from the matched catalog medicine."""
+    if extraction.matched_medicine_id is None:
+        return
+    medicine = db.query(models.Medicine).options(selectinload(models.Medicine.categories)).filter(
+        models.Medicine.id == extraction.matched_medicine_id
+    ).first()
+    if medicine is None:
+        return
+    extraction.put("category", medicine.categories[0].name if medicine.categories else None, 0.9)
+    extraction.put("requires_prescription", bool(medicine.requires_prescription), 0.9)
+    extraction.put("storage_instructions", medicine.storage_instructions, 0.9)
+    extraction.put("side_effects", medicine.side_effects, 0.9)
+
+
+def build_llm_prompt(text: str, extraction: LocalExtraction) -> str:
+    """Asks the LLM only for the required fields the local pass missed, with what it did read as context."""
+    missing = extraction.missing_fields()
+    known = {field: value for field, (value, _) in extraction.fields.items() if extraction.confident(field)}
+    fields = "\n".join(f"- {FIELD_PROMPTS[field]}" for field in missing)
+    context = f"\nAlready read from the label (for context, do not repeat): {json.dumps(known)}\n" if known else ""
+    return f"""
+You are an expert AI assistant for pharmaceutical inventory. Your task is to extract structured data from OCR-extracted text from medicine packaging.
+Extract ONLY these fields:
+{fields}
+{context}
+You MUST respond ONLY with a single, valid JSON object containing exactly these fields. Do not add any explanation or conversational text.
+
+OCR extracted text: "{text}"
+"""
+
+
+# --- COUNTERS ---
+
+_stats_lock = threading.Lock()
+_stats = {"local": 0, "hybrid": 0}
+
+def record_outcome(source: str):
+    with _stats_lock:
+        _stats[source] = _stats.get(source, 0) + 1
+
+def extraction_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        total = sum(_stats.values())
+        return {
+            "served_locally": _stats["local"],
+            "llm_assisted": _stats["hybrid"],
+            "local_fraction": round(_stats["local"] / total, 3) if total else None,
+        }
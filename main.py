@@ -1,55 +1,91 @@
 # main.py
 from dotenv import load_dotenv
-from sqlalchemy.orm import joinedload
 load_dotenv()
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status
 from sqlalchemy.orm import Session
 from typing import List
 import re
 from datetime import datetime, date, timedelta
-from dateutil.parser import parse as parse_date
 import models, schemas
-from database import SessionLocal, engine
-from fastapi.responses import JSONResponse
-import easyocr
+from database import SessionLocal, engine, async_engine, get_async_db, ensure_indexes
+from fastapi import Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
 import json
-import whisper
-from transformers import pipeline
-import torch
+import asyncio
+import tempfile
+import time
+from contextlib import asynccontextmanager
 from sqlalchemy.exc import IntegrityError
-from openai import OpenAI
+from sqlalchemy import select, insert, update, delete, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from fastapi.security import OAuth2PasswordRequestForm
 import auth
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status
 from fastapi.middleware.cors import CORSMiddleware  # Add this import
 from sqlalchemy.orm import Session
+from model_registry import model_registry, PRELOAD_MODELS, NOT_LOADED, LOADING, READY
+from ocr_executor import ocr_executor, OCR_MAX_BATCH_FILES
+from text_parsing import scan_label
+from gs1 import parse_gs1, parse_gs1_batch, GS1ParseError, GS1_MAX_BATCH_SCANS
+from local_extraction import (
+    extract_local, get_catalog_dictionary, fill_catalog_details, build_llm_prompt, record_outcome, extraction_stats,
+)
+from result_cache import ocr_cache, parse_cache, hash_bytes, hash_text, all_cache_stats
+from inventory_export import iter_inventory_export, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from catalog_names import get_or_create_manufacturer, resolve_names
+from catalog_import import parse_import_file, import_catalog
+from dispensing import take_from_lot, delete_empty_lots, remove_medicine_if_empty, dispense_fefo
+from stock import (
+    add_stock, add_stock_async, stock_quantity, delete_stock_statement, reconcile_stock,
+    reconcile_periodically, LOW_STOCK_THRESHOLD,
+)
+from expiry import EXPIRY_BUCKET_DAYS, expiry_buckets_query, summarize_buckets, expiring_lots_query, lot_dict
+from intent_router import CHATBOT_LOCAL_INTENTS, classify, render, record_route, router_stats
+from llm_gateway import llm_gateway
+from search import ensure_search_index, search_medicines, resolve_medicine, canonical_name, SEARCH_RESULT_LIMIT
+from pagination import MEDICINES_PAGE_SIZE, MEDICINES_MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+from metrics import METRICS_ENABLED, CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, instrument_engine, render_metrics, timed_call
 
 print(f"--- Loaded groq API Key: {os.getenv('GROQ_API_KEY')} ---")
 
-# Initialize the client to point to Groq's API endpoint
-client = OpenAI(
-    api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1"
-)
+# Every LLM call goes through llm_gateway (pooled async client, timeouts, retries,
+# concurrency cap); LLM_BASE_URL points it at Groq or any OpenAI-compatible server,
+# and USE_FAKE_LLM=true at benchmarks/fake_llm_server.py for offline load tests.
 
 # --- INITIALIZATIONS (Done once on startup) ---
+# EasyOCR and Whisper are owned by model_registry: they load lazily on first use,
+# or in a background warm-up thread when PRELOAD_MODELS is enabled, so importing
+# this module and serving CRUD routes never waits on the ML models.
+# When OCR_WORKERS > 0, EasyOCR lives in the ocr_executor worker processes instead
+# and is never loaded into the API process itself.
 
-models.Base.metadata.create_all(bind=engine)
-
-# Initialize EasyOCR reader
-print("Loading EasyOCR model...")
-reader = easyocr.Reader(['en']) 
-
-# Initialize Whisper model for speech-to-text
-print("Loading Whisper model...")
-whisper_model = whisper.load_model("tiny.en")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    models.Base.metadata.create_all(bind=engine)
+    ensure_indexes(models.Base.metadata)
+    ensure_search_index(engine)
+    # Backfills medicine_stock on first run and repairs any drift since the last one, in
+    # the background so startup never waits on the aggregate over every user's lots
+    reconcile_task = asyncio.create_task(reconcile_periodically())
+    if PRELOAD_MODELS:
+        ocr_executor.start()
+        in_process = [name for name in model_registry.names() if name != "ocr" or not ocr_executor.uses_processes]
+        model_registry.warm_in_background(in_process)
+    yield
+    reconcile_task.cancel()
+    ocr_executor.shutdown()
+    await llm_gateway.close()
+    await async_engine.dispose()
 
 app = FastAPI(
     title="PharmPal API",
     description="API for Pharmaceutical Inventory Management",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -58,8 +94,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Per-route latency, in-flight requests and per-request SQL counts, scraped from GET /metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # --- HELPER & DATABASE FUNCTIONS ---
 
 def get_db():
@@ -69,6 +112,13 @@ def get_db():
     finally:
         db.close()
 
+def get_model_or_503(name: str):
+    """Returns a loaded model from the registry, or 503 if it could not be loaded"""
+    try:
+        return model_registry.get(name)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 def verify_medicine_ownership(medicine_id: int, user_id: int, db: Session):
     """Helper function to verify medicine ownership"""
     medicine = db.query(models.Medicine).filter(
@@ -93,6 +143,40 @@ def verify_inventory_ownership(item_id: int, user_id: int, db: Session):
         raise HTTPException(status_code=404, detail="You don't have permission to access this inventory item")
     return item
 
+# Relationships serialized by schemas.Medicine; async sessions can't lazy-load them
+MEDICINE_RESPONSE_OPTIONS = (
+    selectinload(models.Medicine.manufacturer_details),
+    selectinload(models.Medicine.categories),
+    selectinload(models.Medicine.inventory_items),
+)
+
+async def verify_medicine_ownership_async(medicine_id: int, user_id: int, db: AsyncSession, *options):
+    """Async variant of verify_medicine_ownership; extra loader options are applied to the query"""
+    result = await db.execute(
+        select(models.Medicine).where(
+            models.Medicine.id == medicine_id,
+            models.Medicine.user_id == user_id
+        ).options(*options)
+    )
+    medicine = result.scalars().first()
+    if not medicine:
+        raise HTTPException(status_code=404, detail="Medicine not found or you don't have permission to access it")
+    return medicine
+
+async def verify_inventory_ownership_async(item_id: int, user_id: int, db: AsyncSession):
+    """Async variant of verify_inventory_ownership, checking the owner in the same query"""
+    result = await db.execute(
+        select(models.InventoryItem, models.Medicine.user_id)
+        .join(models.Medicine, models.Medicine.id == models.InventoryItem.medicine_id)
+        .where(models.InventoryItem.id == item_id)
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Inventory item not found")
+    if row.user_id != user_id:
+        raise HTTPException(status_code=404, detail="You don't have permission to access this inventory item")
+    return row.InventoryItem
+
 # In main.py - Update the _smart_create_db_entry function
 # In main.py - Update the smart create function
 def _smart_create_db_entry(data: schemas.SmartCreateRequest, db: Session, user_id: int):
@@ -105,17 +189,11 @@ def _smart_create_db_entry(data: schemas.SmartCreateRequest, db: Session, user_i
     print(f"Categories: {data.category_names}")
     
     try:
-        # --- HANDLE MANUFACTURER ---
-        manufacturer = None
-        if data.manufacturer_name:
-            manufacturer = get_or_create_manufacturer(db, data.manufacturer_name)
-        
-        # --- HANDLE CATEGORIES ---
-        categories = []
-        for category_name in data.category_names:
-            if category_name and category_name.strip():  # Skip empty category names
-                category = get_or_create_category(db, category_name.strip())
-                categories.append(category)
+        # --- HANDLE MANUFACTURER & CATEGORIES ---
+        # Served from the name cache, or one INSERT ... ON CONFLICT DO NOTHING RETURNING each
+        manufacturer = get_or_create_manufacturer(db, data.manufacturer_name)
+        category_names = [name.strip() for name in data.category_names if name and name.strip()]  # Skip empty category names
+        categories = list(resolve_names(db, models.Category, category_names).values())
         
         # --- CREATE MEDICINE ---
         new_medicine = models.Medicine(
@@ -125,18 +203,19 @@ def _smart_create_db_entry(data: schemas.SmartCreateRequest, db: Session, user_i
             price=data.price,
             expiry_date=data.expiry_date,
             user_id=user_id,
-            manufacturer_id=manufacturer.id if manufacturer else None,
+            manufacturer_id=manufacturer["id"] if manufacturer else None,
             requires_prescription=data.requires_prescription,
             storage_instructions=data.storage_instructions,
             side_effects=data.side_effects
         )
-        
-        # Add categories to medicine (many-to-many)
-        new_medicine.categories = categories
-        
         db.add(new_medicine)
-        db.commit()
-        db.refresh(new_medicine)
+        db.flush()
+
+        # Add categories to medicine (many-to-many)
+        if categories:
+            db.execute(insert(models.medicine_category), [
+                {"medicine_id": new_medicine.id, "category_id": category["id"]} for category in categories
+            ])
 
         # --- CREATE INVENTORY ITEM ---
         new_inventory_item = models.InventoryItem(
@@ -146,92 +225,48 @@ def _smart_create_db_entry(data: schemas.SmartCreateRequest, db: Session, user_i
             expiry_date=data.expiry_date
         )
         db.add(new_inventory_item)
+        db.flush()
+        add_stock(db, {new_medicine.id: data.quantity})
+
+        # Built from what we just wrote, so the response needs no reload after commit
+        response = schemas.Medicine(
+            id=new_medicine.id,
+            barcode=new_medicine.barcode,
+            name=new_medicine.name,
+            strength=new_medicine.strength,
+            price=new_medicine.price,
+            expiry_date=new_medicine.expiry_date,
+            manufacturer_id=new_medicine.manufacturer_id,
+            inventory_items=[schemas.InventoryItem.model_validate(new_inventory_item)],
+            manufacturer_details=schemas.Manufacturer(**manufacturer) if manufacturer else None,
+            categories=[schemas.Category(**category) for category in categories],
+        )
         db.commit()
-        db.refresh(new_medicine)
         
         print("--- RELATIONAL DATA SAVED SUCCESSFULLY ---")
-        print(f"Medicine ID: {new_medicine.id}")
-        print(f"Manufacturer ID: {manufacturer.id if manufacturer else 'None'}")
-        print(f"Category IDs: {[c.id for c in categories]}")
+        print(f"Medicine ID: {response.id}")
+        print(f"Manufacturer ID: {manufacturer['id'] if manufacturer else 'None'}")
+        print(f"Category IDs: {[c['id'] for c in categories]}")
         
-        return new_medicine
+        return response
 
     except Exception as e:
         print(f"!!! ERROR: {e} !!!")
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-def find_and_parse_date(text_block: str):
-    date_pattern = r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}[/-]\d{1,2}[/-]\d{1,2}|\d{1,2}[ -](?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*[ -]\d{2,4})'
-    match = re.search(date_pattern, text_block, re.IGNORECASE)
-    if match:
-        try:
-            return parse_date(match.group(0)).date()
-        except (ValueError, OverflowError):
-            return None
-    return None
-
-def find_and_parse_price(text_block: str):
-    price_pattern = r'(?:MRP|Rs\.?|\$)\s*[:\- ]?\s*(\d+\.?\d*)'
-    match = re.search(price_pattern, text_block, re.IGNORECASE)
-    if match:
-        try:
-            return float(match.group(1))
-        except ValueError:
-            return None
-    return None
-
-def find_lot_number(text_block: str):
-    lot_pattern = r'(?:Batch|Lot|B\.?No)\.?\s*:?\s*([\w\-]+)'
-    match = re.search(lot_pattern, text_block, re.IGNORECASE)
-    if match:
-        return match.group(1)
-    return None
-
-def parse_gs1_string(data: str) -> dict:
-    parsed_data = {}
-    gtin_match = re.search(r'\(01\)(\d+)', data)
-    if gtin_match: parsed_data['gtin'] = gtin_match.group(1)
-    lot_match = re.search(r'\(10\)([\w-]+)', data)
-    if lot_match: parsed_data['lot_number'] = lot_match.group(1)
-    expiry_match = re.search(r'\(17\)(\d{6})', data)
-    if expiry_match:
-        try:
-            parsed_data['expiry_date'] = datetime.strptime(expiry_match.group(1), '%y%m%d').date()
-        except ValueError: pass
-    return parsed_data
-
-def get_or_create_category(db: Session, category_name: str) -> models.Category:
-    """Get existing category or create new one"""
-    category = db.query(models.Category).filter(
-        models.Category.name == category_name
-    ).first()
-    
-    if not category:
-        category = models.Category(name=category_name)
-        db.add(category)
-        db.commit()
-        db.refresh(category)
-        print(f"Created new category: {category_name}")
-    
-    return category
 
-def get_or_create_manufacturer(db: Session, manufacturer_name: str) -> Optional[models.Manufacturer]:
-    """Get existing manufacturer or create new one"""
-    if not manufacturer_name:
-        return None
-        
-    manufacturer = db.query(models.Manufacturer).filter(
-        models.Manufacturer.name == manufacturer_name
-    ).first()
-    
-    if not manufacturer:
-        manufacturer = models.Manufacturer(name=manufacturer_name)
-        db.add(manufacturer)
-        db.commit()
-        db.refresh(manufacturer)
-        print(f"Created new manufacturer: {manufacturer_name}")
-    
-    return manufacturer
+def _parse_ocr_text(full_text: str) -> dict:
+    """Scans OCR output once for expiry, price and lot (shared by single and batch OCR)"""
+    scan = scan_label(full_text)
+    found_date = scan.expiry_date()
+    found_price = scan.price()
+    found_lot = scan.lot_number()
+    return {
+        "found_text": full_text, 
+        "parsed_date": found_date.value.isoformat() if found_date else None, 
+        "parsed_price": found_price.value if found_price else None, 
+        "parsed_lot": found_lot.value if found_lot else None
+    }
 
 # --- API ENDPOINTS ---
 
@@ -242,128 +277,253 @@ async def root():
         "status": "active",
         "docs": "Visit /docs for API documentation"
     }
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Reports per-model load state; returns 503 until every model is loaded and warmed.
+    With PRELOAD_MODELS off, models load on first use instead, so only a failed load
+    makes the instance unready.
+    """
+    model_status = model_registry.status()
+    if ocr_executor.uses_processes:
+        model_status["ocr"] = ocr_executor.model_status()
+    ready_states = {READY} if PRELOAD_MODELS else {READY, NOT_LOADED, LOADING}
+    ready = all(m["state"] in ready_states for m in model_status.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "models": model_status},
+    )
     
     
 @app.get("/medicines/", response_model=List[schemas.Medicine])
-def get_all_medicines(
+async def get_all_medicines(
+    response: Response,
+    limit: int = Query(MEDICINES_PAGE_SIZE, ge=1, le=MEDICINES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["id", "name"] = "id",
+    category: Optional[str] = None,
+    manufacturer: Optional[str] = None,
+    expiring_before: Optional[date] = None,
+    low_stock: Optional[int] = Query(None, ge=0, description="Only medicines with total stock below this"),
+    name_prefix: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    One page of the current user's medicines with relationships, keyset-paginated on
+    id or (name, id). Pass the X-Next-Cursor response header back as `cursor` to get
+    the next page; the header is absent on the last page.
+    """
+    query = select(models.Medicine).where(models.Medicine.user_id == current_user.id)
+
+    if category:
+        query = query.where(models.Medicine.categories.any(
+            func.lower(models.Category.name) == category.lower()
+        ))
+    if manufacturer:
+        query = query.where(models.Medicine.manufacturer_details.has(
+            func.lower(models.Manufacturer.name) == manufacturer.lower()
+        ))
+    if expiring_before:
+        query = query.where(models.Medicine.inventory_items.any(
+            models.InventoryItem.expiry_date <= expiring_before
+        ))
+    if low_stock is not None:
+        query = query.outerjoin(
+            models.MedicineStock, models.MedicineStock.medicine_id == models.Medicine.id
+        ).where(stock_quantity() < low_stock)
+    if name_prefix:
+        escaped = name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(models.Medicine.name.ilike(f"{escaped}%", escape="\\"))
+
+    after = decode_cursor(cursor, sort)
+    if sort == "name":
+        if after:
+            last_name, last_id = after
+            query = query.where(or_(
+                models.Medicine.name > last_name,
+                and_(models.Medicine.name == last_name, models.Medicine.id > last_id),
+            ))
+        query = query.order_by(models.Medicine.name, models.Medicine.id)
+    else:
+        if after:
+            query = query.where(models.Medicine.id > after[1])
+        query = query.order_by(models.Medicine.id)
+
+    # One extra row tells us whether there is a next page
+    result = await db.execute(query.limit(limit + 1).options(*MEDICINE_RESPONSE_OPTIONS))
+    medicines = result.scalars().all()
+    if len(medicines) > limit:
+        medicines = medicines[:limit]
+        last = medicines[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort, last.name if sort == "name" else last.id, last.id)
+    return medicines
+
+@app.get("/medicines/stock", response_model=List[schemas.MedicineStockLevel])
+async def get_stock_levels(
+    response: Response,
+    threshold: int = Query(LOW_STOCK_THRESHOLD, ge=0, description="Stock below this counts as low"),
+    low_only: bool = False,
+    limit: int = Query(MEDICINES_PAGE_SIZE, ge=1, le=MEDICINES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Total stock per medicine from the maintained medicine_stock totals (one row per
+    medicine, no lot scans), flagged against `threshold`. Paginated like /medicines/.
+    """
+    quantity = stock_quantity()
+    query = (
+        select(models.Medicine.id, models.Medicine.name, models.Medicine.barcode, quantity)
+        .outerjoin(models.MedicineStock, models.MedicineStock.medicine_id == models.Medicine.id)
+        .where(models.Medicine.user_id == current_user.id)
+    )
+    if low_only:
+        query = query.where(quantity < threshold)
+    after = decode_cursor(cursor, "id")
+    if after:
+        query = query.where(models.Medicine.id > after[1])
+
+    rows = (await db.execute(query.order_by(models.Medicine.id).limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor("id", rows[-1].id, rows[-1].id)
+    return [
+        schemas.MedicineStockLevel(
+            medicine_id=row.id, name=row.name, barcode=row.barcode,
+            quantity=row[3], low_stock=row[3] < threshold,
+        )
+        for row in rows
+    ]
+
+@app.post("/medicines/stock/reconcile", response_model=schemas.StockReconcileResult)
+def reconcile_stock_levels(
+    fix: bool = True,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    """Get all medicines for the current user with relationships"""
-    medicines = db.query(models.Medicine).filter(
-        models.Medicine.user_id == current_user.id
-    ).options(
-        joinedload(models.Medicine.manufacturer_details),
-        joinedload(models.Medicine.categories),
-        joinedload(models.Medicine.inventory_items)
-    ).all()
-    return medicines    
+    """Checks the current user's stock totals against their lots and repairs any drift"""
+    return reconcile_stock(db, user_id=current_user.id, fix=fix)
+
+@app.get("/medicines/search", response_model=List[schemas.MedicineSearchResult])
+def search_medicine_names(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(SEARCH_RESULT_LIMIT, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Fuzzy name search over the current user's medicines, best match first. Tolerates
+    partial words and misspellings ("paracetmol"); `score` is 0..1.
+    """
+    return search_medicines(db, current_user.id, q, limit=limit)
 
 @app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
-    db_user = auth.get_user_by_username(db, username=user.username)
+    db_user = await auth.get_user_by_username_async(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    
-    hashed_password = auth.get_password_hash(user.password)
+    await db.close()
+
+    hashed_password = await auth.hash_password(user.password)
     new_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Someone registered the same name while we were hashing
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username already registered")
+    await db.refresh(new_user)
     return new_user
 
 @app.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login to get access token"""
-    user = auth.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    user = await auth.get_user_by_username_async(db, username=form_data.username)
+    user_id, username, hashed_password = (user.id, user.username, user.hashed_password) if user else (None, None, None)
+    # Hand the connection back to the pool while argon2 runs, so a login storm can't exhaust it
+    await db.close()
+
+    verified, new_hash = False, None
+    if hashed_password:
+        verified, new_hash = await auth.verify_and_update_password(form_data.password, hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash used older argon2 parameters; upgrade it now that we know the password
+        await db.execute(
+            models.User.__table__.update().where(models.User.id == user_id).values(hashed_password=new_hash)
+        )
+        await db.commit()
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": username, "uid": user_id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/medicines/", response_model=List[schemas.Medicine])
-def get_all_medicines(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
-):
-    """Get all medicines for the current user"""
-    medicines = db.query(models.Medicine).filter(
-        models.Medicine.user_id == current_user.id
-    ).all()
-    return medicines
 # In main.py - Update the update_medicine_details endpoint
 @app.put("/medicines/{medicine_id}", response_model=schemas.Medicine)
-def update_medicine_details(
+async def update_medicine_details(
     medicine_id: int, 
     medicine_update: schemas.MedicineCreate,  # This now includes the new fields
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Update medicine details (only if owned by current user)"""
-    db_medicine = verify_medicine_ownership(medicine_id, current_user.id, db)
+    db_medicine = await verify_medicine_ownership_async(medicine_id, current_user.id, db, *MEDICINE_RESPONSE_OPTIONS)
     
     update_data = medicine_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_medicine, key, value)
-    db.commit()
-    db.refresh(db_medicine)
+    await db.commit()
+    if "manufacturer_id" in update_data:
+        await db.refresh(db_medicine, ["manufacturer_details"])
     return db_medicine
 
 @app.get("/medicines/barcode/{barcode}", response_model=schemas.Medicine)
-def read_medicine_by_barcode(
+async def read_medicine_by_barcode(
     barcode: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Get a medicine by barcode (only if owned by current user)"""
-    db_medicine = db.query(models.Medicine).filter(
-        models.Medicine.barcode == barcode,
-        models.Medicine.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(models.Medicine).where(
+            models.Medicine.barcode == barcode,
+            models.Medicine.user_id == current_user.id
+        ).options(*MEDICINE_RESPONSE_OPTIONS)
+    )
+    db_medicine = result.scalars().first()
     if db_medicine is None:
         raise HTTPException(status_code=404, detail="Medicine with this barcode not found")
     return db_medicine
 
-@app.put("/medicines/{medicine_id}", response_model=schemas.Medicine)
-def update_medicine_details(
-    medicine_id: int, 
-    medicine_update: schemas.MedicineCreate, 
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
-):
-    """Update medicine details (only if owned by current user)"""
-    db_medicine = verify_medicine_ownership(medicine_id, current_user.id, db)
-    
-    update_data = medicine_update.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_medicine, key, value)
-    db.commit()
-    db.refresh(db_medicine)
-    return db_medicine
-
 @app.delete("/medicines/{medicine_id}", status_code=200)
-def delete_medicine(
+async def delete_medicine(
     medicine_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Delete a medicine and all its inventory items (only if owned by current user)"""
-    db_medicine = verify_medicine_ownership(medicine_id, current_user.id, db)
+    db_medicine = await verify_medicine_ownership_async(
+        medicine_id, current_user.id, db, selectinload(models.Medicine.categories)
+    )
     
-    db.query(models.InventoryItem).filter(models.InventoryItem.medicine_id == medicine_id).delete()
-    db.delete(db_medicine)
-    db.commit()
+    await db.execute(delete(models.InventoryItem).where(models.InventoryItem.medicine_id == medicine_id))
+    await db.execute(delete_stock_statement(medicine_id))
+    await db.delete(db_medicine)
+    await db.commit()
     return {"message": "Medicine deleted successfully."}
 
 @app.post("/medicines/smart-create", response_model=schemas.Medicine)
@@ -375,19 +535,34 @@ def smart_create_medicine_and_inventory(
     """Smart create medicine with inventory (secured to current user)"""
     return _smart_create_db_entry(request, db, user_id=current_user.id)
 
+@app.post("/medicines/import", response_model=schemas.CatalogImportResult)
+async def import_medicines(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Bulk smart-create from a CSV or JSON file of SmartCreateRequest rows. Each valid row
+    becomes a medicine with one inventory lot; invalid rows are listed in `errors`.
+    """
+    content = await file.read()
+    # Parsing up to IMPORT_MAX_ROWS rows is CPU-bound, so it runs off the event loop too
+    raw_rows = await run_in_threadpool(parse_import_file, file.filename, file.content_type, content)
+    return await run_in_threadpool(import_catalog, db, current_user.id, raw_rows)
+
 @app.post("/inventory/receive", response_model=schemas.InventoryItem, status_code=201)
-def receive_inventory_item(
+async def receive_inventory_item(
     item: schemas.InventoryItemCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Receive new inventory item (only for medicines owned by current user)"""
-    db_medicine = verify_medicine_ownership(item.medicine_id, current_user.id, db)
+    db_medicine = await verify_medicine_ownership_async(item.medicine_id, current_user.id, db)
     
     db_item = models.InventoryItem(**item.dict())
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await add_stock_async(db, {item.medicine_id: item.quantity})
+    await db.commit()
     return db_item
 
 @app.post("/inventory/receive-gs1", response_model=schemas.InventoryItem)
@@ -397,7 +572,10 @@ def receive_inventory_from_gs1_scan(
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Receive inventory from GS1 barcode scan (secured to current user)"""
-    parsed_data = parse_gs1_string(scan_data.gs1_data)
+    try:
+        parsed_data = parse_gs1(scan_data.gs1_data)
+    except GS1ParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid GS1 data: {e}")
     if not all(k in parsed_data for k in ['gtin', 'lot_number', 'expiry_date']):
         raise HTTPException(status_code=400, detail="Incomplete GS1 data.")
     
@@ -411,7 +589,6 @@ def receive_inventory_from_gs1_scan(
         medicine = models.Medicine(
             barcode=gtin, 
             name=f"New Medicine - GTIN {gtin}", 
-            manufacturer="Unknown", 
             strength="N/A", 
             price=0.0, 
             expiry_date=parsed_data['expiry_date'],
@@ -428,82 +605,382 @@ def receive_inventory_from_gs1_scan(
         quantity=scan_data.quantity
     )
     db.add(new_item)
+    add_stock(db, {medicine.id: scan_data.quantity})
     db.commit()
     db.refresh(new_item)
     return new_item
 
+@app.post("/inventory/receive-gs1/batch", response_model=schemas.GS1BatchReceiveResponse)
+def receive_inventory_from_gs1_batch(
+    batch: schemas.GS1BatchScanRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Receive a whole delivery of GS1 scans in one transaction. Every GTIN is resolved
+    with a single query, unknown GTINs get one placeholder medicine each, and the
+    result lists an outcome per scan (bad scans don't block the rest).
+    """
+    if not batch.scans:
+        raise HTTPException(status_code=400, detail="No scans provided.")
+    if len(batch.scans) > GS1_MAX_BATCH_SCANS:
+        raise HTTPException(status_code=413, detail=f"At most {GS1_MAX_BATCH_SCANS} scans per batch.")
+
+    results = [schemas.GS1ScanResult(index=i, status="error") for i in range(len(batch.scans))]
+    valid = []  # (index, parsed) for scans that can be received
+    parsed_scans = parse_gs1_batch([scan.gs1_data for scan in batch.scans])
+    for i, (scan, (parsed_data, error)) in enumerate(zip(batch.scans, parsed_scans)):
+        if error:
+            results[i].error = f"Invalid GS1 data: {error}"
+        elif not all(k in parsed_data for k in ['gtin', 'lot_number', 'expiry_date']):
+            results[i].error = "Incomplete GS1 data."
+        elif scan.quantity <= 0:
+            results[i].error = "Quantity must be positive."
+        else:
+            results[i].gtin = parsed_data['gtin']
+            valid.append((i, parsed_data))
+
+    # Barcodes are unique across all users, so look them up without the owner filter
+    # and report GTINs that belong to someone else instead of failing on insert
+    gtins = {parsed_data['gtin'] for _, parsed_data in valid}
+    existing = {}
+    if gtins:
+        existing = {
+            medicine.barcode: medicine
+            for medicine in db.query(models.Medicine).filter(models.Medicine.barcode.in_(gtins))
+        }
+
+    # One placeholder per new GTIN; its expiry is the earliest lot seen in this batch
+    placeholders = {}
+    for i, parsed_data in valid:
+        gtin = parsed_data['gtin']
+        if gtin in existing:
+            continue
+        placeholder = placeholders.get(gtin)
+        if placeholder is None:
+            placeholders[gtin] = models.Medicine(
+                barcode=gtin,
+                name=f"New Medicine - GTIN {gtin}",
+                strength="N/A",
+                price=0.0,
+                expiry_date=parsed_data['expiry_date'],
+                user_id=current_user.id
+            )
+        elif parsed_data['expiry_date'] < placeholder.expiry_date:
+            placeholder.expiry_date = parsed_data['expiry_date']
+
+    try:
+        if placeholders:
+            db.add_all(placeholders.values())
+            db.flush()
+
+        new_items = []
+        for i, parsed_data in valid:
+            gtin = parsed_data['gtin']
+            medicine = existing.get(gtin) or placeholders[gtin]
+            if medicine.user_id != current_user.id:
+                results[i].gtin = gtin
+                results[i].error = "GTIN is registered to another account."
+                continue
+            item = models.InventoryItem(
+                medicine_id=medicine.id,
+                lot_number=parsed_data['lot_number'],
+                expiry_date=parsed_data['expiry_date'],
+                quantity=batch.scans[i].quantity
+            )
+            new_items.append((i, gtin, item))
+
+        db.add_all([item for _, _, item in new_items])
+        db.flush()
+        received_by_medicine = {}
+        for _, _, item in new_items:
+            received_by_medicine[item.medicine_id] = received_by_medicine.get(item.medicine_id, 0) + item.quantity
+        add_stock(db, received_by_medicine)
+        # Build the response from the flushed rows; after commit they'd be expired and reloaded one by one
+        for i, gtin, item in new_items:
+            results[i].status = "received"
+            results[i].created_medicine = gtin in placeholders
+            results[i].item = schemas.InventoryItem.model_validate(item)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # Another request registered one of these GTINs between our lookup and insert
+        raise HTTPException(status_code=409, detail="A GTIN in this batch was registered concurrently; please retry.")
+
+    received = len(new_items)
+    return schemas.GS1BatchReceiveResponse(
+        received=received,
+        failed=len(results) - received,
+        created_medicines=len(placeholders),
+        results=results,
+    )
+
 @app.post("/inventory/dispense")
-def dispense_inventory_item(
+async def dispense_inventory_item(
     dispense_request: schemas.DispenseRequest, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Dispense inventory item (only if owned by current user)"""
-    db_item = verify_inventory_ownership(dispense_request.item_id, current_user.id, db)
+    if dispense_request.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive.")
+    db_item = await verify_inventory_ownership_async(dispense_request.item_id, current_user.id, db)
     
-    if db_item.quantity < dispense_request.quantity:
+    # Conditional decrement, so two counters dispensing the same lot can't oversell it
+    remaining = await take_from_lot(db, db_item.id, dispense_request.quantity)
+    if remaining is None:
         raise HTTPException(status_code=400, detail="Insufficient stock.")
+    await add_stock_async(db, {db_item.medicine_id: -dispense_request.quantity})
     
-    db_item.quantity -= dispense_request.quantity
-    if db_item.quantity == 0:
-        medicine_id_to_check = db_item.medicine_id
-        db.delete(db_item)
-        db.commit()
-        remaining_items = db.query(models.InventoryItem).filter(
-            models.InventoryItem.medicine_id == medicine_id_to_check
-        ).count()
-        if remaining_items == 0:
-            medicine_to_delete = db.query(models.Medicine).filter(
-                models.Medicine.id == medicine_id_to_check,
-                models.Medicine.user_id == current_user.id
-            ).first()
-            if medicine_to_delete:
-                db.delete(medicine_to_delete)
-                db.commit()
+    if remaining == 0:
+        await delete_empty_lots(db, [db_item.id])
+        medicine_removed = await remove_medicine_if_empty(db, db_item.medicine_id, current_user.id)
+        await db.commit()
+        if medicine_removed:
             return JSONResponse(status_code=200, content={"message": "Item dispensed and catalog entry removed."})
         return JSONResponse(status_code=200, content={"message": "Item dispensed and batch removed."})
-    else:
-        db.commit()
-        db.refresh(db_item)
-        return db_item
+    await db.commit()
+    return schemas.InventoryItem(
+        id=db_item.id,
+        medicine_id=db_item.medicine_id,
+        lot_number=db_item.lot_number,
+        expiry_date=db_item.expiry_date,
+        quantity=remaining,
+    )
+
+@app.post("/inventory/dispense-by-medicine", response_model=schemas.DispenseByMedicineResponse)
+async def dispense_by_medicine(
+    dispense_request: schemas.DispenseByMedicineRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Dispense a quantity of a medicine without picking the lot: stock is taken from the
+    unexpired lots that expire first (FEFO), atomically, and the allocation is returned.
+    """
+    if dispense_request.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive.")
+    await verify_medicine_ownership_async(dispense_request.medicine_id, current_user.id, db)
+    return await dispense_fefo(db, dispense_request.medicine_id, current_user.id, dispense_request.quantity)
 
 @app.post("/inventory/restock", response_model=schemas.InventoryItem)
-def restock_inventory_item(
+async def restock_inventory_item(
     restock_request: schemas.RestockRequest, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Restock inventory item (only if owned by current user)"""
-    db_item = verify_inventory_ownership(restock_request.item_id, current_user.id, db)
+    if restock_request.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive.")
+    db_item = await verify_inventory_ownership_async(restock_request.item_id, current_user.id, db)
     
-    db_item.quantity += restock_request.quantity
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+    # Incremented in the database so a concurrent dispense of the same lot isn't lost
+    new_quantity = await db.scalar(
+        update(models.InventoryItem)
+        .where(models.InventoryItem.id == db_item.id)
+        .values(quantity=models.InventoryItem.quantity + restock_request.quantity)
+        .returning(models.InventoryItem.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if new_quantity is None:
+        raise HTTPException(status_code=404, detail="Inventory item not found")
+    await add_stock_async(db, {db_item.medicine_id: restock_request.quantity})
+    await db.commit()
+    return schemas.InventoryItem(
+        id=db_item.id,
+        medicine_id=db_item.medicine_id,
+        lot_number=db_item.lot_number,
+        expiry_date=db_item.expiry_date,
+        quantity=new_quantity,
+    )
+
+@app.get("/inventory/expiring", response_model=schemas.ExpiringInventoryResponse)
+async def get_expiring_inventory(
+    response: Response,
+    days: int = Query(EXPIRY_BUCKET_DAYS[-1], ge=0, le=3650, description="List lots expiring within this many days"),
+    include_expired: bool = True,
+    limit: int = Query(MEDICINES_PAGE_SIZE, ge=1, le=MEDICINES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Expiry calendar for the current user: lot/unit counts per bucket (expired, then
+    EXPIRY_BUCKET_DAYS) plus one page of the lots expiring within `days`, soonest first.
+    Pass the X-Next-Cursor header back as `cursor` for the next page of lots.
+    """
+    today = date.today()
+    buckets = (await db.execute(expiry_buckets_query(current_user.id, today))).all()
+
+    after = decode_cursor(cursor, "expiry")
+    query = expiring_lots_query(current_user.id, today + timedelta(days=days), today, include_expired, after)
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor("expiry", rows[-1].expiry_date.isoformat(), rows[-1].id)
+    return {
+        "as_of": today,
+        "buckets": summarize_buckets(buckets),
+        "lots": [lot_dict(row, today) for row in rows],
+    }
 
 @app.post("/ocr/extract-text")
-def extract_text_from_image(
+async def extract_text_from_image(
     file: UploadFile = File(...),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
     """Extract text from medicine package image using OCR (authenticated users only)"""
-    image_bytes = file.file.read()
-    result = reader.readtext(image_bytes)
-    full_text = " ".join([text for bbox, text, conf in result])
+    image_bytes = await file.read()
+    image_key = hash_bytes(image_bytes)
+    result = await ocr_cache.aget(image_key)
+    if result is None:
+        result = await ocr_executor.readtext(image_bytes)
+        await ocr_cache.aset(image_key, result)
+    full_text = " ".join([text for text, conf in result])
     if not full_text:
         raise HTTPException(status_code=400, detail="No text detected.")
-    found_date = find_and_parse_date(full_text)
-    found_price = find_and_parse_price(full_text)
-    found_lot = find_lot_number(full_text)
-    return {
-        "found_text": full_text, 
-        "parsed_date": found_date.isoformat() if found_date else None, 
-        "parsed_price": found_price, 
-        "parsed_lot": found_lot
-    }
+    return _parse_ocr_text(full_text)
+
+@app.post("/ocr/extract-text/batch")
+async def extract_text_from_images(
+    files: List[UploadFile] = File(...),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    OCR many package images in one authenticated request. Results are streamed back as
+    NDJSON, one line per image (tagged with its upload index) as soon as it finishes.
+    """
+    if len(files) > OCR_MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {OCR_MAX_BATCH_FILES} images per batch.")
+    images = [await f.read() for f in files]
+    filenames = [f.filename for f in files]
+    # Identical uploads (the same carton photographed twice) are OCR'd once and the
+    # result is fanned out to every index that carries them
+    indexes_by_key: Dict[str, List[int]] = {}
+    for index, image in enumerate(images):
+        indexes_by_key.setdefault(hash_bytes(image), []).append(index)
+
+    # Previously seen artwork is answered from the cache; only the rest goes to OCR
+    cached = {}
+    for key in indexes_by_key:
+        result = await ocr_cache.aget(key)
+        if result is not None:
+            cached[key] = result
+    to_ocr = [key for key in indexes_by_key if key not in cached]
+    # A full queue still gets a real 503 here, but the slots are only taken inside the
+    # stream, so a client that disconnects before (or without) reading the body can't leak them
+    if to_ocr:
+        ocr_executor.check_capacity(ocr_executor.batch_jobs(len(to_ocr)))
+
+    async def all_results():
+        batch, busy = None, None
+        if to_ocr:
+            try:
+                batch = ocr_executor.submit_batch([images[indexes_by_key[key][0]] for key in to_ocr])
+            except HTTPException as e:
+                busy = e.detail  # filled up since the check above
+        try:
+            for key, result in cached.items():
+                for index in indexes_by_key[key]:
+                    yield index, result, None
+            if busy is not None:
+                for key in to_ocr:
+                    for index in indexes_by_key[key]:
+                        yield index, None, busy
+            if batch is not None:
+                async for position, result, error in batch.results():
+                    key = to_ocr[position]
+                    if error is None:
+                        await ocr_cache.aset(key, result)
+                    for index in indexes_by_key[key]:
+                        yield index, result, error
+        finally:
+            if batch is not None:
+                batch.close()
+
+    async def stream_results():
+        async for index, result, error in all_results():
+            line = {"index": index, "filename": filenames[index]}
+            if error is None:
+                full_text = " ".join([text for text, conf in result])
+                if full_text:
+                    line.update(_parse_ocr_text(full_text))
+                else:
+                    line["error"] = "No text detected."
+            else:
+                line["error"] = error
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.get("/export/inventory")
+def export_inventory(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    Streams every medicine and lot owned by the current user (one row per lot) as NDJSON
+    or CSV, optionally gzip-compressed. Rows come from a server-side cursor, so memory
+    use doesn't grow with the catalog.
+    """
+    filename = f"inventory-{date.today().isoformat()}.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        iter_inventory_export(current_user.id, format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/cache/stats")
+def cache_stats(current_user: models.User = Depends(auth.get_current_active_user)):
+    """Hit/miss counters and sizes of the result caches (OCR, LLM parses, principals, ...)"""
+    return all_cache_stats()
+
+@app.get("/extraction/stats")
+def local_extraction_stats(current_user: models.User = Depends(auth.get_current_active_user)):
+    """How many label parses were answered locally versus with LLM help"""
+    return extraction_stats()
+
+@app.get("/chatbot/stats")
+def chatbot_stats(current_user: models.User = Depends(auth.get_current_active_user)):
+    """How many chatbot queries were answered locally versus by the LLM, and the time saved"""
+    return router_stats()
+
+@app.get("/llm/metrics")
+def llm_metrics(current_user: models.User = Depends(auth.get_current_active_user)):
+    """Calls, retries, hedges, coalesced requests and latency of the LLM gateway"""
+    return llm_gateway.stats()
+
+@app.get("/ocr/metrics")
+def ocr_metrics(current_user: models.User = Depends(auth.get_current_active_user)):
+    """Queue depth, rejection counts and per-job latency of the OCR executor"""
+    return ocr_executor.stats()
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus text exposition: request latency, SQL per request, pool waits, model and LLM timings"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+def _transcribe_audio(audio: bytes, filename: Optional[str]) -> str:
+    """Writes the upload to a temp file and transcribes it with Whisper (blocking)."""
+    model = get_model_or_503("whisper")
+    suffix = os.path.splitext(filename or "")[1]
+    with tempfile.NamedTemporaryFile(prefix="voice_", suffix=suffix, delete=False) as buffer:
+        buffer.write(audio)
+        temp_audio_path = buffer.name
+    try:
+        return timed_call("whisper_transcribe", model.transcribe, temp_audio_path)["text"]
+    finally:
+        os.remove(temp_audio_path)
 
 @app.post("/voice/process-audio", response_model=schemas.Medicine)
-def process_voice_audio(
+async def process_voice_audio(
     db: Session = Depends(get_db), 
     file: UploadFile = File(...), 
     current_user: models.User = Depends(auth.get_current_active_user)
@@ -513,15 +990,10 @@ def process_voice_audio(
     to parse the text, and creates a new medicine and inventory item.
     """
     # --- STEP 1: Transcribe audio to text with Whisper ---
-    temp_audio_path = f"./temp_{file.filename}"
-    with open(temp_audio_path, "wb") as buffer:
-        buffer.write(file.file.read())
-    try:
-        result = whisper_model.transcribe(temp_audio_path)
-        transcribed_text = result["text"]
-        print(f"Whisper transcribed: '{transcribed_text}'")
-    finally:
-        os.remove(temp_audio_path)
+    audio = await file.read()
+    # Model lookup (a cold Whisper load), temp file write and transcription all stay off the event loop
+    transcribed_text = await run_in_threadpool(_transcribe_audio, audio, file.filename)
+    print(f"Whisper transcribed: '{transcribed_text}'")
 
     if not transcribed_text or not transcribed_text.strip():
         raise HTTPException(status_code=400, detail="Could not understand the audio or speech was empty.")
@@ -552,8 +1024,7 @@ def process_voice_audio(
     """
     
     try:
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        response = await llm_gateway.chat(
             messages=[{"role": "user", "content": parsing_prompt}],
             temperature=0.0,
             response_format={"type": "json_object"},
@@ -589,12 +1060,20 @@ def process_voice_audio(
         except (ValueError, TypeError):
             raise HTTPException(status_code=400, detail="Quantity must be a valid number")
 
+        # Whisper often misspells drug names; file the stock under the catalog's spelling
+        # when the spoken name clearly refers to a medicine the user already has
+        if parsed_data.get("name"):
+            catalog_name = await run_in_threadpool(canonical_name, db, current_user.id, parsed_data["name"])
+            if catalog_name and catalog_name != parsed_data["name"]:
+                print(f"Voice name '{parsed_data['name']}' matched catalog name '{catalog_name}'")
+                parsed_data["name"] = catalog_name
+
         print(f"Cleaned data: {parsed_data}")
         
         smart_request = schemas.SmartCreateRequest(**parsed_data)
 
         # --- STEP 3: Call our reusable helper to save to the database ---
-        return _smart_create_db_entry(smart_request, db, user_id=current_user.id)
+        return await run_in_threadpool(_smart_create_db_entry, smart_request, db, user_id=current_user.id)
 
     except HTTPException:
         raise
@@ -604,48 +1083,69 @@ def process_voice_audio(
         if 'parsed_json_str' in locals():
             error_detail += f" | Raw Model Output: {parsed_json_str}"
         raise HTTPException(status_code=400, detail=f"Could not parse the voice input. Please be more specific. Details: {error_detail}")
-@app.post("/chatbot/query")
-def chatbot_query(
-    request: dict, 
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_active_user)
-):
-    """Handles chatbot queries using the Groq API with function calling (user-specific data only)"""
-    user_message = request.get("message")
-    if not user_message:
-        raise HTTPException(status_code=400, detail="Message is required.")
-    
-    if not client.api_key:
-        print("!!! GROQ API KEY NOT LOADED. CHECK .ENV FILE. !!!")
-        raise HTTPException(status_code=500, detail="API key not configured.")
-    
-    messages = [{"role": "user", "content": user_message}]
-    
-    # Define available tool functions - scoped to current user
+
+# --- CHATBOT ---
+
+CHATBOT_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_stock_quantity",
+            "description": "Get the total stock quantity for a specific medicine in the user's inventory.",
+            "parameters": {
+                "type": "object",
+                "properties": { 
+                    "medicine_name": {
+                        "type": "string", 
+                        "description": "The name of the medicine, e.g., 'Paracetamol'"
+                    }
+                },
+                "required": ["medicine_name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_expiring_medicines",
+            "description": "Find all medicine batches in the user's inventory that are expiring within a given number of days.",
+            "parameters": {
+                "type": "object",
+                "properties": { 
+                    "days_limit": {
+                        "type": "integer", 
+                        "description": "Number of days from today to check for expiry, e.g., 30"
+                    }
+                },
+                "required": ["days_limit"],
+            },
+        },
+    }
+]
+
+def _chatbot_functions(user_id: int):
+    """The chatbot's tool functions, scoped to one user; each takes its arguments plus `db`."""
     def get_stock_quantity_wrapper(medicine_name: str, db: Session):
-        medicine = db.query(models.Medicine).filter(
-            models.Medicine.name.ilike(f"%{medicine_name}%"),
-            models.Medicine.user_id == current_user.id
-        ).first()
-        if not medicine: 
+        # Only the product asked about: a similar-looking one would report the wrong stock
+        match = resolve_medicine(db, user_id, medicine_name)
+        if not match: 
             return f"Medicine '{medicine_name}' not found in your inventory."
-        total_quantity = sum(item.quantity for item in medicine.inventory_items)
-        return json.dumps({"medicine_name": medicine.name, "total_quantity": total_quantity})
+        total_quantity = db.query(stock_quantity()).select_from(models.Medicine).outerjoin(
+            models.MedicineStock, models.MedicineStock.medicine_id == models.Medicine.id
+        ).filter(models.Medicine.id == match["id"]).scalar()
+        return json.dumps({"medicine_name": match["name"], "total_quantity": total_quantity or 0})
     
     def find_expiring_medicines_wrapper(days_limit: int, db: Session):
-        expiry_threshold = date.today() + timedelta(days=days_limit)
-        expiring_items = db.query(models.InventoryItem).join(
-            models.Medicine
-        ).filter(
-            models.InventoryItem.expiry_date <= expiry_threshold,
-            models.Medicine.user_id == current_user.id
+        today = date.today()
+        expiring_items = db.execute(
+            expiring_lots_query(user_id, today + timedelta(days=days_limit), today)
         ).all()
         
         if not expiring_items: 
             return "No medicines are expiring soon in your inventory."
         results = [
             {
-                "medicine_name": item.medicine.name, 
+                "medicine_name": item.medicine_name, 
                 "lot_number": item.lot_number, 
                 "expiry_date": item.expiry_date.isoformat()
             } 
@@ -653,54 +1153,43 @@ def chatbot_query(
         ]
         return json.dumps(results)
     
-    available_functions = {
+    return {
         "get_stock_quantity": get_stock_quantity_wrapper,
         "find_expiring_medicines": find_expiring_medicines_wrapper,
     }
+
+@app.post("/chatbot/query")
+async def chatbot_query(
+    request: dict, 
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """Handles chatbot queries using the Groq API with function calling (user-specific data only)"""
+    user_message = request.get("message")
+    if not user_message:
+        raise HTTPException(status_code=400, detail="Message is required.")
+    started = time.perf_counter()
+    available_functions = _chatbot_functions(current_user.id)
+
+    # --- Fast path: plain stock / expiry questions are answered from a template ---
+    intent = classify(user_message) if CHATBOT_LOCAL_INTENTS else None
+    if intent:
+        answer = render(intent, await run_in_threadpool(available_functions[intent.tool], **intent.args, db=db))
+        if answer:
+            record_route("local", time.perf_counter() - started)
+            return {"response": answer, "response_source": "local"}
+
+    if not llm_gateway.configured:
+        print("!!! GROQ API KEY NOT LOADED. CHECK .ENV FILE. !!!")
+        raise HTTPException(status_code=500, detail="API key not configured.")
     
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_stock_quantity",
-                "description": "Get the total stock quantity for a specific medicine in the user's inventory.",
-                "parameters": {
-                    "type": "object",
-                    "properties": { 
-                        "medicine_name": {
-                            "type": "string", 
-                            "description": "The name of the medicine, e.g., 'Paracetamol'"
-                        }
-                    },
-                    "required": ["medicine_name"],
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "find_expiring_medicines",
-                "description": "Find all medicine batches in the user's inventory that are expiring within a given number of days.",
-                "parameters": {
-                    "type": "object",
-                    "properties": { 
-                        "days_limit": {
-                            "type": "integer", 
-                            "description": "Number of days from today to check for expiry, e.g., 30"
-                        }
-                    },
-                    "required": ["days_limit"],
-                },
-            },
-        }
-    ]
+    messages = [{"role": "user", "content": user_message}]
 
     try:
         # --- Step 1: Send initial message to Groq ---
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        response = await llm_gateway.chat(
             messages=messages,
-            tools=tools,
+            tools=CHATBOT_TOOLS,
             tool_choice="auto",
         )
         
@@ -725,7 +1214,7 @@ def chatbot_query(
                 function_to_call = available_functions[function_name]
                 function_args["db"] = db
                 
-                function_response = function_to_call(**function_args)
+                function_response = await run_in_threadpool(function_to_call, **function_args)
                 
                 messages.append({
                     "tool_call_id": tool_call.id,
@@ -735,64 +1224,180 @@ def chatbot_query(
                 })
             
             # --- Step 3: Ask the model to summarize the function output ---
-            second_response = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=messages,
-            )
+            second_response = await llm_gateway.chat(messages=messages)
             final_response = second_response.choices[0].message.content
         else:
             final_response = response_message.content
 
-        return {"response": final_response}
+        record_route("llm", time.perf_counter() - started, llm_calls=2 if tool_calls else 1)
+        return {"response": final_response, "response_source": "llm"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error communicating with Groq or database: {e}")
         raise HTTPException(status_code=500, detail=f"Chatbot internal error: {str(e)}")
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _run_chatbot_tool(user_id: int, name: str, args: dict) -> str:
+    """Runs one chatbot tool on its own session; a stream outlives the request's get_db session."""
+    db = SessionLocal()
+    try:
+        return _chatbot_functions(user_id)[name](**args, db=db)
+    finally:
+        db.close()
+
+@app.post("/chatbot/query/stream")
+async def chatbot_query_stream(
+    request: dict,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    """
+    /chatbot/query over Server-Sent Events: `status` and `tool` events while the question
+    is being worked on, the answer as `token` events while Groq generates it, then a
+    `done` event with the whole response (or an `error` event).
+    """
+    user_message = request.get("message")
+    if not user_message:
+        raise HTTPException(status_code=400, detail="Message is required.")
+    user_id = current_user.id
+    intent = classify(user_message) if CHATBOT_LOCAL_INTENTS else None
+    if not intent and not llm_gateway.configured:
+        print("!!! GROQ API KEY NOT LOADED. CHECK .ENV FILE. !!!")
+        raise HTTPException(status_code=500, detail="API key not configured.")
+
+    async def events():
+        started = time.perf_counter()
+        first_token_at = None
+
+        def ttft_ms():
+            return round(((first_token_at or time.perf_counter()) - started) * 1000, 1)
+
+        # --- Fast path: same templated answers as /chatbot/query, as a single token ---
+        if intent:
+            answer = render(intent, await run_in_threadpool(_run_chatbot_tool, user_id, intent.tool, intent.args))
+            if answer:
+                record_route("local", time.perf_counter() - started)
+                yield _sse("token", {"text": answer})
+                yield _sse("done", {"response": answer, "response_source": "local", "ttft_ms": ttft_ms()})
+                return
+            if not llm_gateway.configured:
+                yield _sse("error", {"detail": "API key not configured."})
+                return
+
+        messages = [{"role": "user", "content": user_message}]
+        answer_parts = []
+        try:
+            yield _sse("status", {"stage": "thinking"})
+            # --- Step 1: streamed too, so an answer that needs no tool reaches the user as it's generated ---
+            tool_calls = {}
+            async for chunk in llm_gateway.stream(messages=messages, tools=CHATBOT_TOOLS, tool_choice="auto"):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                # Tool calls arrive in fragments keyed by index; the arguments are JSON split across chunks
+                for fragment in delta.tool_calls or ():
+                    call = tool_calls.setdefault(fragment.index, {"id": None, "name": "", "arguments": ""})
+                    call["id"] = fragment.id or call["id"]
+                    if fragment.function:
+                        call["name"] += fragment.function.name or ""
+                        call["arguments"] += fragment.function.arguments or ""
+                if delta.content:
+                    first_token_at = first_token_at or time.perf_counter()
+                    answer_parts.append(delta.content)
+                    yield _sse("token", {"text": delta.content})
+
+            # --- Step 2: run the tools, reporting progress ---
+            llm_calls = 1
+            if tool_calls:
+                calls = [tool_calls[index] for index in sorted(tool_calls)]
+                messages.append({
+                    "role": "assistant",
+                    "content": "".join(answer_parts) or None,
+                    "tool_calls": [
+                        {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+                        for call in calls
+                    ],
+                })
+                available_functions = _chatbot_functions(user_id)
+                for call in calls:
+                    function_args = json.loads(call["arguments"] or "{}")
+                    if call["name"] not in available_functions:
+                        yield _sse("error", {"detail": f"Unknown function: {call['name']}"})
+                        return
+                    yield _sse("tool", {"name": call["name"], "arguments": function_args, "status": "running"})
+                    function_response = await run_in_threadpool(_run_chatbot_tool, user_id, call["name"], function_args)
+                    messages.append({
+                        "tool_call_id": call["id"],
+                        "role": "tool",
+                        "name": call["name"],
+                        "content": str(function_response),
+                    })
+                    yield _sse("tool", {"name": call["name"], "status": "done"})
+
+                # --- Step 3: stream the summary of the tool output ---
+                yield _sse("status", {"stage": "answering"})
+                answer_parts = []
+                async for chunk in llm_gateway.stream(messages=messages):
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        first_token_at = first_token_at or time.perf_counter()
+                        answer_parts.append(chunk.choices[0].delta.content)
+                        yield _sse("token", {"text": chunk.choices[0].delta.content})
+                llm_calls = 2
+
+            record_route("llm", time.perf_counter() - started, llm_calls=llm_calls)
+            yield _sse("done", {"response": "".join(answer_parts), "response_source": "llm", "ttft_ms": ttft_ms()})
+
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail, "status_code": e.status_code})
+        except Exception as e:
+            print(f"Error streaming from Groq or database: {e}")
+            yield _sse("error", {"detail": f"Chatbot internal error: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Proxies (nginx) must not buffer the stream, or the tokens arrive all at once
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
     
 @app.post("/chatbot/parse-medicine-text")
-def parse_medicine_text(
+async def parse_medicine_text(
     request: dict,
+    db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    """Parse OCR-extracted text to extract medicine information using Groq"""
+    """
+    Parse OCR-extracted text to extract medicine information. A local rule-based pass
+    (label regexes + the user's catalog) answers on its own when it is confident about
+    every required field; otherwise Groq fills in whatever the local pass couldn't.
+    """
     extracted_text = request.get("extracted_text")
     if not extracted_text:
         raise HTTPException(status_code=400, detail="Extracted text is required.")
-    
-    # Parsing prompt to extract medicine information from OCR text
-    parsing_prompt = f"""
-You are an expert AI assistant for pharmaceutical inventory. Your task is to extract structured data from OCR-extracted text from medicine packaging.
-You must parse this text to extract the following fields:
-- name (string, required)
-- manufacturer (string, optional, default to "Unknown" if not mentioned)
-- strength (string, optional, default to "N/A" if not mentioned)
-- price (float, required, if not mentioned use 0.0)
-- lot_number (string, required, if not mentioned generate one like "LOT-OCR-[timestamp]")
-- quantity (integer, optional, default to 1 if not mentioned)
-- expiry_date (string, in "YYYY-MM-DD" format, required if found, otherwise use null)
-- barcode (string, optional, can be null)
-- category (string, optional, can be null)
-- requires_prescription (boolean, optional, default to false)
-- storage_instructions (string, optional, can be null)
-- side_effects (string, optional, can be null)
-
-IMPORTANT RULES:
-- DO NOT use null for price or lot_number
-- If price is not mentioned, use 0.0
-- If lot_number is not mentioned, generate a unique one with format "LOT-OCR-YYYYMMDD"
-- If manufacturer is not mentioned, use "Unknown"
-- If strength is not mentioned, use "N/A" 
-- If requires_prescription is not mentioned, use false
-- For category, storage_instructions, and side_effects, use null if not mentioned
-
-You MUST respond ONLY with a single, valid JSON object containing these fields. Do not add any explanation or conversational text.
-
-OCR extracted text: "{extracted_text}"
-"""
-    
+
+    # --- Fast path: deterministic extraction, no LLM round-trip ---
+    local = extract_local(extracted_text, await run_in_threadpool(get_catalog_dictionary, db, current_user.id))
+    await run_in_threadpool(fill_catalog_details, db, local)
+    missing = local.missing_fields()
+    if not missing:
+        record_outcome("local")
+        return {**local.to_result(), "extraction_source": "local"}
+
+    # Identical label text (modulo whitespace) with the same fields missing always parses the same way
+    text_key = hash_text(extracted_text + "\x00" + ",".join(missing))
+    cached_result = await parse_cache.aget(text_key)
+    if cached_result is not None:
+        record_outcome("hybrid")
+        return {**local.merge(cached_result), "extraction_source": "llm"}
+
+    # The LLM is asked only for what the local pass missed
+    parsing_prompt = build_llm_prompt(extracted_text, local)
+
     try:
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
+        response = await llm_gateway.chat(
             messages=[{"role": "user", "content": parsing_prompt}],
             temperature=0.1,
             response_format={"type": "json_object"},
@@ -801,9 +1406,13 @@ OCR extracted text: "{extracted_text}"
         parsed_json_str = response.choices[0].message.content
         print(f"Groq parsed medicine data: {parsed_json_str}")
         parsed_data = json.loads(parsed_json_str)
+        await parse_cache.aset(text_key, parsed_data)
+        record_outcome("hybrid")
         
-        return parsed_data
+        return {**local.merge(parsed_data), "extraction_source": "llm"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error parsing medicine text with Groq: {e}")
         raise HTTPException(status_code=400, detail=f"Could not parse the medicine text: {str(e)}")
\ No newline at end of file
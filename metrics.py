@@ -0,0 +1,291 @@
+# metrics.py
+import contextvars
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+# --- CONFIGURATION ---
+# Serve GET /metrics and time every request (the engine hooks are cheap and always on)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Requests that run more SQL statements than this are logged, so N+1 regressions show up
+QUERY_COUNT_LOG_THRESHOLD = int(os.getenv("QUERY_COUNT_LOG_THRESHOLD", "25"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+# --- METRIC TYPES ---
+# A minimal Prometheus text-format implementation, so the backend needs no client library.
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._samples(items))
+        return lines
+
+    def _samples(self, items) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self, items) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+# Called before each scrape to refresh gauges that mirror other components' state
+_collectors: List[Callable[[], None]] = []
+
+def register_collector(collector: Callable[[], None]):
+    _collectors.append(collector)
+
+def render_metrics() -> str:
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            print(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- METRICS ---
+
+HTTP_REQUESTS = Counter("pharmapal_http_requests_total", "HTTP requests by route and status.",
+                        ("method", "route", "status"))
+HTTP_LATENCY = Histogram("pharmapal_http_request_duration_seconds",
+                         "Time from request start until the response (or stream) finished.", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("pharmapal_http_requests_in_flight", "Requests currently being handled.", ("method",))
+
+DB_QUERIES = Histogram("pharmapal_db_queries_per_request", "SQL statements executed per request.",
+                       ("route",), buckets=QUERY_COUNT_BUCKETS)
+DB_QUERY_TIME = Histogram("pharmapal_db_query_seconds_per_request", "Total SQL execution time per request.",
+                          ("route",))
+DB_STATEMENTS = Counter("pharmapal_db_statements_total", "SQL statements executed, in or out of a request.",
+                        ("engine",))
+DB_POOL_CHECKOUT = Histogram("pharmapal_db_pool_checkout_seconds",
+                             "Wait for a pooled connection (including opening a new one).", ("engine",))
+DB_POOL_CHECKED_OUT = Gauge("pharmapal_db_pool_checked_out", "Connections currently checked out.", ("engine",))
+
+MODEL_LATENCY = Histogram("pharmapal_model_inference_seconds",
+                          "Model call time: EasyOCR readtext, Whisper transcribe.", ("model",))
+
+LLM_LATENCY = Histogram("pharmapal_llm_request_duration_seconds",
+                        "One upstream LLM request (per attempt; streams until the last chunk).", ("kind", "outcome"))
+LLM_TOKENS = Counter("pharmapal_llm_tokens_total", "Tokens reported by the LLM's usage field.", ("type",))
+
+
+# --- MODEL AND LLM TIMINGS ---
+
+def observe_model(model: str, seconds: float):
+    MODEL_LATENCY.observe(seconds, model=model)
+
+def timed_call(model: str, function: Callable, *args, **kwargs):
+    """Calls function(*args, **kwargs) and records its duration under `model`."""
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        observe_model(model, time.perf_counter() - start)
+
+def observe_llm(kind: str, outcome: str, seconds: float, usage=None):
+    LLM_LATENCY.observe(seconds, kind=kind, outcome=outcome)
+    if usage is not None:
+        LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, type="prompt")
+        LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, type="completion")
+
+
+# --- PER-REQUEST QUERY ACCOUNTING ---
+
+class _QueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+# Set by the middleware for the duration of a request. Threadpool calls and SQLAlchemy's
+# async greenlets copy the context, so they all add to the same request's object.
+_request_queries: contextvars.ContextVar[Optional[_QueryStats]] = contextvars.ContextVar(
+    "request_queries", default=None
+)
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_execute(label: str):
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+        DB_STATEMENTS.inc(engine=label)
+        stats = _request_queries.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+    return listener
+
+def instrument_engine(engine, label: str):
+    """
+    Counts and times statements on a sync Engine (pass async_engine.sync_engine for the
+    async one) and times pool checkouts by wrapping Engine.raw_connection, which every
+    new Connection goes through (and which, unlike the pool, survives dispose()).
+    """
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute(label))
+
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        start = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - start, engine=label)
+
+    engine.raw_connection = timed_raw_connection
+
+    def collect_pool():
+        checked_out = getattr(engine.pool, "checkedout", None)
+        if checked_out is not None:
+            DB_POOL_CHECKED_OUT.set(checked_out(), engine=label)
+
+    register_collector(collect_pool)
+
+
+# --- MIDDLEWARE ---
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (so the endpoint runs in the same context and sees the query
+    counter): times each HTTP request, counts it by route template and status, and
+    records its SQL statement count and time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = _QueryStats()
+        token = _request_queries.set(stats)
+        HTTP_IN_FLIGHT.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_queries.reset(token)
+            HTTP_IN_FLIGHT.dec(method=method)
+            # The route template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status["code"]))
+            HTTP_LATENCY.observe(elapsed, method=method, route=route)
+            DB_QUERIES.observe(stats.count, route=route)
+            DB_QUERY_TIME.observe(stats.seconds, route=route)
+            if stats.count > QUERY_COUNT_LOG_THRESHOLD:
+                print(f"!!! {method} {route} ran {stats.count} SQL statements "
+                      f"({stats.seconds * 1000:.1f} ms in the database, {elapsed * 1000:.1f} ms total) !!!")
@@ -0,0 +1,142 @@
+# model_registry.py
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# --- CONFIGURATION ---
+# When enabled, models are loaded and warmed in a background thread right after startup.
+# When disabled, each model is loaded on the first request that needs it.
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() in ("1", "true", "yes")
+OCR_LANGUAGES = [lang.strip() for lang in os.getenv("OCR_LANGUAGES", "en").split(",") if lang.strip()]
+WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "tiny.en")
+
+# Model states reported by the readiness endpoint
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class _ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]]):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.model = None
+        self.state = NOT_LOADED
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Keeps heavy ML models out of module import. Each model is loaded at most once,
+    either lazily on first use or by a background warm-up thread, and its state is
+    tracked so a readiness endpoint can report it.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _ModelEntry] = {}
+
+    def register(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None):
+        """Registers (or replaces) the loader for a model. Replacing resets its state."""
+        self._entries[name] = _ModelEntry(name, loader, warmup)
+
+    def names(self):
+        return list(self._entries)
+
+    def get(self, name: str) -> Any:
+        """Returns the loaded model, loading it first if needed (blocks while another thread loads it)."""
+        entry = self._entries[name]
+        if entry.state == READY:
+            return entry.model
+        self._load(entry)
+        if entry.state != READY:
+            raise RuntimeError(f"Model '{name}' failed to load: {entry.error}")
+        return entry.model
+
+    def is_ready(self, name: str) -> bool:
+        return self._entries[name].state == READY
+
+    def _load(self, entry: _ModelEntry):
+        with entry.lock:
+            if entry.state == READY:
+                return
+            entry.state = LOADING
+            entry.error = None
+            print(f"Loading {entry.name} model...")
+            try:
+                start = time.perf_counter()
+                model = entry.loader()
+                entry.load_seconds = round(time.perf_counter() - start, 3)
+
+                # Run one throwaway inference so the first real request doesn't pay for
+                # lazy kernel/graph initialisation inside the library.
+                if entry.warmup is not None:
+                    start = time.perf_counter()
+                    entry.warmup(model)
+                    entry.warmup_seconds = round(time.perf_counter() - start, 3)
+
+                entry.model = model
+                entry.state = READY
+                print(f"{entry.name} model ready (load {entry.load_seconds}s, warm-up {entry.warmup_seconds}s)")
+            except Exception as e:
+                entry.state = FAILED
+                entry.error = str(e)
+                print(f"!!! ERROR loading {entry.name} model: {e} !!!")
+
+    def warm_in_background(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """Loads and warms the given models (default: all) one after another in a daemon thread."""
+        targets = list(names) if names is not None else self.names()
+
+        def _run():
+            for name in targets:
+                self._load(self._entries[name])
+
+        thread = threading.Thread(target=_run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "state": entry.state,
+                "load_seconds": entry.load_seconds,
+                "warmup_seconds": entry.warmup_seconds,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+# --- DEFAULT MODEL LOADERS ---
+# Library imports live inside the loaders so importing this module stays cheap.
+
+def load_easyocr_reader():
+    import easyocr
+    return easyocr.Reader(OCR_LANGUAGES)
+
+def warm_easyocr_reader(reader):
+    import cv2
+    import numpy as np
+    # A small white strip with printed text exercises both detection and recognition
+    image = np.full((64, 320, 3), 255, dtype=np.uint8)
+    cv2.putText(image, "MRP Rs 10.50", (8, 44), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+    reader.readtext(image)
+
+def load_whisper_model():
+    import whisper
+    return whisper.load_model(WHISPER_MODEL_NAME)
+
+def warm_whisper_model(model):
+    import numpy as np
+    # One second of silence at Whisper's 16 kHz sample rate
+    model.transcribe(np.zeros(16000, dtype=np.float32), fp16=False)
+
+
+model_registry = ModelRegistry()
+model_registry.register("ocr", load_easyocr_reader, warm_easyocr_reader)
+model_registry.register("whisper", load_whisper_model, warm_whisper_model)
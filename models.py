@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, Text, Table
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Boolean, Text, Table, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -48,7 +48,7 @@ class Medicine(Base):
     expiry_date = Column(Date, nullable=False)
     
     # Foreign keys for relationships
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     manufacturer_id = Column(Integer, ForeignKey("manufacturers.id"), nullable=True)
     
     # Keep these for backward compatibility during migration
@@ -64,9 +64,21 @@ class Medicine(Base):
 
 class InventoryItem(Base):
     __tablename__ = "inventory_items"
+    # (medicine_id, expiry_date) serves both "lots of this medicine" and "this user's lots
+    # expiring before X" (medicines by user_id, then an expiry range per medicine)
+    __table_args__ = (
+        Index("ix_inventory_items_medicine_id_expiry_date", "medicine_id", "expiry_date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     lot_number = Column(String, nullable=False, index=True)
     expiry_date = Column(Date, nullable=False)
     quantity = Column(Integer, nullable=False)
     medicine_id = Column(Integer, ForeignKey("medicines.id"))
-    medicine = relationship("Medicine", back_populates="inventory_items")
\ No newline at end of file
+    medicine = relationship("Medicine", back_populates="inventory_items")
+
+class MedicineStock(Base):
+    # Total quantity across a medicine's inventory items, kept up to date by stock.py
+    # in the same transaction as every lot change so totals are a single-row read
+    __tablename__ = "medicine_stock"
+    medicine_id = Column(Integer, ForeignKey("medicines.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
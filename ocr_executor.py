@@ -0,0 +1,333 @@
+# ocr_executor.py
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from metrics import Gauge, observe_model, register_collector
+from model_registry import model_registry, load_easyocr_reader, warm_easyocr_reader
+
+# --- CONFIGURATION ---
+# Number of OCR worker processes, each holding its own EasyOCR reader.
+# 0 runs OCR on a single background thread using the in-process model registry.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+# How many jobs may wait for a free worker before new requests are turned away with 503
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "8"))
+OCR_RETRY_AFTER_SECONDS = int(os.getenv("OCR_RETRY_AFTER_SECONDS", "2"))
+# Most images accepted by a single /ocr/extract-text/batch upload
+OCR_MAX_BATCH_FILES = int(os.getenv("OCR_MAX_BATCH_FILES", "32"))
+# Batch uploads are split into chunks of this many images; each chunk is one job on one worker
+OCR_BATCH_CHUNK_SIZE = int(os.getenv("OCR_BATCH_CHUNK_SIZE", "4"))
+# Recognizer batch size passed to EasyOCR (text crops recognised per forward pass)
+OCR_RECOGNIZER_BATCH_SIZE = int(os.getenv("OCR_RECOGNIZER_BATCH_SIZE", "16"))
+
+# (text, confidence) pairs; bounding boxes are dropped to keep results cheap to pickle
+OCRResult = List[Tuple[str, float]]
+
+# --- WORKER SIDE (runs inside the OCR worker processes) ---
+
+_worker_reader = None
+
+def _init_worker():
+    global _worker_reader
+    _worker_reader = load_easyocr_reader()
+    warm_easyocr_reader(_worker_reader)
+
+def _ping_worker():
+    return os.getpid()
+
+def _to_result(raw) -> OCRResult:
+    return [(text, float(conf)) for _bbox, text, conf in raw]
+
+def _readtext_in_worker(image_bytes: bytes):
+    start = time.perf_counter()
+    result = _to_result(_worker_reader.readtext(image_bytes))
+    return result, time.perf_counter() - start
+
+def _readtext_in_process(image_bytes: bytes):
+    start = time.perf_counter()
+    result = _to_result(model_registry.get("ocr").readtext(image_bytes))
+    return result, time.perf_counter() - start
+
+def _readtext_many(reader, images: List[bytes]):
+    """
+    OCRs a chunk of images with one reader. Images are decoded up front; when they all
+    share a shape (typical for one camera) detection and recognition run batched via
+    readtext_batched, otherwise each image goes through readtext with batched recognition.
+    Returns one (result, error) pair per image.
+    """
+    import cv2
+    import numpy as np
+
+    decoded = []
+    for image_bytes in images:
+        array = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR) if image_bytes else None
+        decoded.append(array)
+
+    outcomes: List[Tuple[Optional[OCRResult], Optional[str]]] = [(None, "Could not decode image.")] * len(images)
+    valid = [i for i, array in enumerate(decoded) if array is not None]
+    if len(valid) > 1 and len({decoded[i].shape for i in valid}) == 1:
+        raw_results = reader.readtext_batched([decoded[i] for i in valid], batch_size=OCR_RECOGNIZER_BATCH_SIZE)
+        for i, raw in zip(valid, raw_results):
+            outcomes[i] = (_to_result(raw), None)
+    else:
+        for i in valid:
+            outcomes[i] = (_to_result(reader.readtext(decoded[i], batch_size=OCR_RECOGNIZER_BATCH_SIZE)), None)
+    return outcomes
+
+def _readtext_chunk_in_worker(images: List[bytes]):
+    start = time.perf_counter()
+    outcomes = _readtext_many(_worker_reader, images)
+    return outcomes, time.perf_counter() - start
+
+def _readtext_chunk_in_process(images: List[bytes]):
+    start = time.perf_counter()
+    outcomes = _readtext_many(model_registry.get("ocr"), images)
+    return outcomes, time.perf_counter() - start
+
+
+def _percentile(sorted_values, pct: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 1)
+
+
+class OCRExecutor:
+    """
+    Runs EasyOCR jobs off the API's threadpool. Admission is bounded: at most
+    `workers + queue_size` jobs are accepted at once and anything beyond that is
+    rejected with 503 + Retry-After instead of piling up behind the workers.
+    """
+
+    def __init__(self, workers: int = OCR_WORKERS, queue_size: int = OCR_QUEUE_SIZE):
+        self.workers = max(workers, 0)
+        self.queue_size = max(queue_size, 0)
+        self.capacity = max(self.workers, 1) + self.queue_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # Recent (total, queue_wait) latencies in seconds
+        self._latencies = deque(maxlen=1000)
+        self._state = "not_loaded"
+        self._error = None
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.workers > 0
+
+    def start(self):
+        """Creates the pool and warms every worker process in the background."""
+        if self._pool is not None:
+            return
+        if not self.uses_processes:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+            return
+
+        # "spawn" keeps the workers from inheriting the server's threads and sockets
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._state = "loading"
+        pings = [self._pool.submit(_ping_worker) for _ in range(self.workers)]
+
+        def _watch():
+            try:
+                for ping in pings:
+                    ping.result()
+                self._state = "ready"
+                print(f"OCR worker pool ready ({self.workers} processes)")
+            except Exception as e:
+                self._state = "failed"
+                self._error = str(e)
+                print(f"!!! ERROR starting OCR workers: {e} !!!")
+
+        threading.Thread(target=_watch, name="ocr-pool-warmup", daemon=True).start()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def batch_jobs(self, images: int) -> int:
+        """Jobs (chunks) a batch of `images` images is split into."""
+        return -(-images // max(OCR_BATCH_CHUNK_SIZE, 1))
+
+    def check_capacity(self, jobs: int = 1):
+        """Raises 503 now if `jobs` couldn't be admitted, without reserving anything."""
+        with self._lock:
+            self._reject_if_full(jobs)
+
+    def _admit(self, jobs: int = 1):
+        with self._lock:
+            self._reject_if_full(jobs)
+            self._in_flight += jobs
+
+    def _reject_if_full(self, jobs: int):
+        # Caller holds self._lock
+        if self._in_flight + jobs > self.capacity:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="OCR service is busy, please retry shortly.",
+                headers={"Retry-After": str(OCR_RETRY_AFTER_SECONDS)},
+            )
+
+    def _release(self, jobs: int = 1):
+        with self._lock:
+            self._in_flight -= jobs
+
+    def _record(self, ok: bool, total: float, run: float):
+        with self._lock:
+            if ok:
+                self._completed += 1
+                self._latencies.append((total, max(total - run, 0.0)))
+            else:
+                self._failed += 1
+
+    async def readtext(self, image_bytes: bytes) -> OCRResult:
+        """Runs OCR on one image, raising 503 if the admission queue is full."""
+        if self._pool is None:
+            self.start()
+        self._admit()
+        submitted = time.perf_counter()
+        try:
+            target = _readtext_in_worker if self.uses_processes else _readtext_in_process
+            result, run_seconds = await asyncio.wrap_future(self._pool.submit(target, image_bytes))
+            self._record(True, time.perf_counter() - submitted, run_seconds)
+            observe_model("easyocr_readtext", run_seconds)
+            return result
+        except BrokenProcessPool as e:
+            self._record(False, 0.0, 0.0)
+            raise HTTPException(status_code=503, detail=f"OCR workers are unavailable: {e}")
+        except Exception:
+            self._record(False, 0.0, 0.0)
+            raise
+        finally:
+            self._release()
+
+    def submit_batch(self, images: List[bytes]) -> "OCRBatch":
+        """
+        Admits a multi-image upload as chunked jobs (all-or-nothing, raising 503 if the
+        queue can't take every chunk) and submits them. Results are consumed from the
+        returned OCRBatch as each chunk finishes.
+        """
+        if self._pool is None:
+            self.start()
+        chunk_size = max(OCR_BATCH_CHUNK_SIZE, 1)
+        chunks = [list(range(i, min(i + chunk_size, len(images)))) for i in range(0, len(images), chunk_size)]
+        self._admit(len(chunks))
+        target = _readtext_chunk_in_worker if self.uses_processes else _readtext_chunk_in_process
+        submitted = time.perf_counter()
+        jobs = []
+        try:
+            for indexes in chunks:
+                jobs.append((indexes, self._pool.submit(target, [images[i] for i in indexes])))
+        except Exception:
+            for _, future in jobs:
+                future.cancel()
+            self._release(len(chunks))
+            raise
+        return OCRBatch(self, jobs, submitted)
+
+    def model_status(self) -> dict:
+        """Readiness entry for the process pool (the in-process reader reports via model_registry)."""
+        return {"state": self._state, "workers": self.workers, "error": self._error}
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+            totals = sorted(total for total, _ in self._latencies)
+            waits = sorted(wait for _, wait in self._latencies)
+            completed, failed, rejected = self._completed, self._failed, self._rejected
+        running = min(in_flight, max(self.workers, 1))
+        return {
+            "mode": "process" if self.uses_processes else "thread",
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": in_flight,
+            "queue_depth": in_flight - running,
+            "completed": completed,
+            "failed": failed,
+            "rejected": rejected,
+            "latency_ms": {
+                "p50": _percentile(totals, 50),
+                "p95": _percentile(totals, 95),
+                "max": _percentile(totals, 100),
+            },
+            "queue_wait_ms": {
+                "p50": _percentile(waits, 50),
+                "p95": _percentile(waits, 95),
+                "max": _percentile(waits, 100),
+            },
+        }
+
+
+class OCRBatch:
+    """Chunked OCR jobs for one batch upload, yielded back in completion order."""
+
+    def __init__(self, executor: OCRExecutor, jobs, submitted: float):
+        self._executor = executor
+        # Chunks whose admission slot is still held, until collected or closed
+        self._pending = {future: indexes for indexes, future in jobs}
+        self._submitted = submitted
+
+    async def results(self) -> AsyncIterator[Tuple[int, Optional[OCRResult], Optional[str]]]:
+        """Yields (image index, result, error) for every image as its chunk completes."""
+        waiting = {asyncio.wrap_future(future): future for future in self._pending}
+        try:
+            while waiting:
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    indexes = self._pending.pop(waiting.pop(task), None)
+                    if indexes is None:
+                        continue  # closed while this chunk was finishing
+                    self._executor._release()
+                    try:
+                        outcomes, run_seconds = task.result()
+                        self._executor._record(True, time.perf_counter() - self._submitted, run_seconds)
+                        # One chunk of OCR_BATCH_CHUNK_SIZE images per observation
+                        observe_model("easyocr_readtext_batch", run_seconds)
+                    except Exception as e:
+                        self._executor._record(False, 0.0, 0.0)
+                        outcomes = [(None, f"OCR failed: {e}")] * len(indexes)
+                    for index, (result, error) in zip(indexes, outcomes):
+                        yield index, result, error
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Drops chunks not collected yet and frees their admission slots (client went away
+        mid-stream, or the stream was never read). Safe to call more than once.
+        """
+        pending, self._pending = self._pending, {}
+        for future in pending:
+            future.cancel()
+        if pending:
+            self._executor._release(len(pending))
+
+
+ocr_executor = OCRExecutor()
+
+_OCR_IN_FLIGHT = Gauge("pharmapal_ocr_jobs_in_flight", "OCR jobs admitted and not yet finished.")
+_OCR_QUEUE_DEPTH = Gauge("pharmapal_ocr_queue_depth", "OCR jobs waiting for a free worker.")
+
+def _collect_ocr():
+    stats = ocr_executor.stats()
+    _OCR_IN_FLIGHT.set(stats["in_flight"])
+    _OCR_QUEUE_DEPTH.set(stats["queue_depth"])
+
+register_collector(_collect_ocr)
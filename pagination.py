@@ -0,0 +1,69 @@
+# pagination.py
+import base64
+import json
+import os
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+# --- CONFIGURATION ---
+MEDICINES_PAGE_SIZE = int(os.getenv("MEDICINES_PAGE_SIZE", "100"))
+MEDICINES_MAX_PAGE_SIZE = int(os.getenv("MEDICINES_MAX_PAGE_SIZE", "500"))
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _id_value(value: Any) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(f"expected an integer id, got {value!r}")
+    return value
+
+def _name_value(value: Any) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"expected a name, got {value!r}")
+    return value
+
+def _date_value(value: Any) -> date:
+    if not isinstance(value, str):
+        raise TypeError(f"expected an ISO date, got {value!r}")
+    return date.fromisoformat(value)
+
+# Sort key -> check/coercion for the cursor's sort value, so a tampered or stale cursor is a
+# 400 here rather than a type error in the keyset comparison
+CURSOR_SORT_VALUES: Dict[str, Callable[[Any], Any]] = {
+    "id": _id_value,
+    "name": _name_value,
+    "expiry": _date_value,
+}
+
+
+def encode_cursor(sort: str, sort_value: Any, row_id: int) -> str:
+    """Opaque keyset cursor: the sort key and id of the last row on the page."""
+    payload = json.dumps([sort, sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], sort: str) -> Optional[Tuple[Any, int]]:
+    """
+    Returns (sort_value, id) from a cursor, or None for the first page; the sort value is
+    coerced to the sort key's type (a date for "expiry"). Raises 400 if it's unusable.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        row_id = _id_value(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort order.")
+    coerce = CURSOR_SORT_VALUES.get(sort)
+    if coerce is not None:
+        try:
+            sort_value = coerce(sort_value)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return sort_value, row_id
@@ -79,32 +79,30 @@ class ApiService {
 
   // --- REST OF YOUR METHODS (keep them as they are) ---
   // In your fetchAllMedicines method or wherever you get the data
-Future<List<Medicine>> fetchAllMedicines() async {
-  final url = Uri.parse('$_baseUrl/medicines/');
-  print('🔍 Fetching medicines from: $url');
-  
-  final response = await http.get(url, headers: _authHeaderOnly);
-  
-  print('📡 Response status: ${response.statusCode}');
-  
-  if (response.statusCode == 200) {
-    // Debug: print the raw response to see what's included
-    print('📦 Raw response: ${response.body}');
-    
-    final medicines = medicineListFromJson(response.body);
-    
-    // Debug: print each medicine's relational data
-    for (var medicine in medicines) {
-      print('💊 Medicine: ${medicine.name}');
-      print('   Manufacturer: ${medicine.manufacturerDetails?.name}');
-      print('   Categories: ${medicine.categories.map((c) => c.name).toList()}');
-      print('   Inventory items: ${medicine.inventoryItems.length}');
+Future<List<Medicine>> fetchAllMedicines({int pageSize = 200}) async {
+  // The backend returns one page at a time; follow X-Next-Cursor until the last page
+  final medicines = <Medicine>[];
+  String? cursor;
+  do {
+    final url = Uri.parse('$_baseUrl/medicines/').replace(queryParameters: {
+      'limit': '$pageSize',
+      if (cursor != null) 'cursor': cursor,
+    });
+    print('🔍 Fetching medicines from: $url');
+
+    final response = await http.get(url, headers: _authHeaderOnly);
+
+    print('📡 Response status: ${response.statusCode}');
+
+    if (response.statusCode != 200) {
+      throw Exception('Failed to load medicine list. Status: ${response.statusCode}');
     }
-    
-    return medicines;
-  } else {
-    throw Exception('Failed to load medicine list. Status: ${response.statusCode}');
-  }
+    medicines.addAll(medicineListFromJson(response.body));
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor != null);
+
+  print('💊 Loaded ${medicines.length} medicines');
+  return medicines;
 }
 
   Future<Map<String, dynamic>> parseMedicineText(String extractedText) async {
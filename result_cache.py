@@ -0,0 +1,241 @@
+# result_cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+# --- CONFIGURATION ---
+# Path of the optional SQLite file backing the on-disk tier (empty = memory only).
+# The file can be shared by several uvicorn workers on the same host.
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_CACHE_DISK_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_DISK_MAX_ENTRIES", "50000"))
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "512"))
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "2048"))
+
+_MISSING = object()
+
+# --- CACHE KEYS ---
+
+def hash_bytes(data: bytes) -> str:
+    """Content address for raw uploads (e.g. image bytes)."""
+    return hashlib.sha256(data).hexdigest()
+
+def hash_text(text: str) -> str:
+    """Content address for text, ignoring differences in whitespace."""
+    normalized = re.sub(r"\s+", " ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite store shared by every cache namespace; values are stored as JSON."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (namespace, accessed_at)")
+        self._conn.commit()
+
+    def get(self, namespace: str, key: str, ttl: Optional[int]):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                return _MISSING
+            if ttl is not None and now - row[1] > ttl:
+                self._conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+                self._conn.commit()
+                return _MISSING
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[int]):
+        now = time.time()
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, payload, now, now),
+            )
+            self._writes += 1
+            # Evicting on every write would double the cost of a set; every 100 writes is plenty
+            if self._writes % 100 == 0:
+                self._evict(namespace, ttl, now)
+            self._conn.commit()
+
+    def delete(self, namespace: str, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+            else:
+                self._conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+
+    def _evict(self, namespace: str, ttl: Optional[int], now: float):
+        if ttl is not None:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?", (namespace, now - ttl)
+            )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (namespace,)).fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache_entries WHERE namespace = ? ORDER BY accessed_at LIMIT ?)",
+                (namespace, namespace, overflow),
+            )
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (namespace,)
+            ).fetchone()
+        return count
+
+
+_disk_tier: Optional[_DiskTier] = None
+
+def _get_disk_tier() -> Optional[_DiskTier]:
+    global _disk_tier
+    if RESULT_CACHE_PATH and _disk_tier is None:
+        _disk_tier = _DiskTier(RESULT_CACHE_PATH, RESULT_CACHE_DISK_MAX_ENTRIES)
+    return _disk_tier
+
+
+class ResultCache:
+    """
+    Two-tier result cache: a bounded in-memory LRU in front of an optional SQLite
+    store. Entries expire after `ttl_seconds`. Values must be JSON-serialisable when
+    the disk tier is enabled, and callers must treat returned values as read-only.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: Optional[int] = RESULT_CACHE_TTL_SECONDS,
+                 use_disk: bool = True):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._disk = _get_disk_tier() if use_disk else None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        _caches[name] = self
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._memory_get(key)
+        if value is _MISSING:
+            value = self._disk_get(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any):
+        self._remember(key, value)
+        if self._disk is not None:
+            self._disk.set(self.name, key, value, self.ttl_seconds)
+
+    # Async variants for request handlers: memory hits are answered inline, while the disk
+    # tier's blocking SQLite I/O runs in the threadpool instead of on the event loop.
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        value = self._memory_get(key)
+        if value is _MISSING:
+            value = await run_in_threadpool(self._disk_get, key) if self._disk is not None else self._disk_get(key)
+        return default if value is _MISSING else value
+
+    async def aset(self, key: str, value: Any):
+        self._remember(key, value)
+        if self._disk is not None:
+            await run_in_threadpool(self._disk.set, self.name, key, value, self.ttl_seconds)
+
+    def _memory_get(self, key: str) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+        return _MISSING
+
+    def _disk_get(self, key: str) -> Any:
+        """Disk-tier lookup after a memory miss; counts the miss when that misses too."""
+        if self._disk is not None:
+            value = self._disk.get(self.name, key, self.ttl_seconds)
+            if value is not _MISSING:
+                self._remember(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return _MISSING
+
+    def _remember(self, key: str, value: Any):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._disk is not None:
+            self._disk.delete(self.name, key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.delete(self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            stats = {
+                "memory_entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+            }
+        if self._disk is not None:
+            stats["disk_entries"] = self._disk.count(self.name)
+        return stats
+
+
+_caches: Dict[str, ResultCache] = {}
+
+def all_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+# OCR results keyed by hash_bytes(image); LLM parses keyed by hash_text(extracted text)
+ocr_cache = ResultCache("ocr", OCR_CACHE_SIZE)
+parse_cache = ResultCache("parse_medicine_text", PARSE_CACHE_SIZE)
@@ -97,6 +97,69 @@ class DispenseRequest(BaseModel):
     item_id: int
     quantity: int    
 
+class DispenseByMedicineRequest(BaseModel):
+    medicine_id: int
+    quantity: int
+
+class DispenseAllocation(BaseModel):
+    item_id: int
+    lot_number: str
+    expiry_date: date
+    quantity: int   # taken from this lot
+    remaining: int  # left in the lot afterwards (0 = lot deleted)
+
+class DispenseByMedicineResponse(BaseModel):
+    medicine_id: int
+    dispensed: int
+    allocations: List[DispenseAllocation]
+    remaining_stock: int  # unexpired units left across all lots
+    medicine_removed: bool = False
+
+class MedicineStockLevel(BaseModel):
+    medicine_id: int
+    name: str
+    barcode: Optional[str] = None
+    quantity: int
+    low_stock: bool
+
+class StockDrift(BaseModel):
+    medicine_id: int
+    stored: Optional[int] = None  # None = no total recorded yet
+    actual: int
+
+class StockReconcileResult(BaseModel):
+    drifted: int
+    orphaned: int
+    fixed: bool
+    details: List[StockDrift]
+
+class ExpiryBucket(BaseModel):
+    label: str                       # "expired", "30_days", "60_days", ...
+    max_days: Optional[int] = None   # upper edge in days from today; None for expired
+    lots: int
+    units: int
+
+class ExpiringLot(BaseModel):
+    item_id: int
+    medicine_id: int
+    medicine_name: str
+    lot_number: str
+    expiry_date: date
+    quantity: int
+    days_left: int  # negative once expired
+
+class ExpiringInventoryResponse(BaseModel):
+    as_of: date
+    buckets: List[ExpiryBucket]
+    lots: List[ExpiringLot]
+
+class MedicineSearchResult(BaseModel):
+    id: int
+    name: str
+    barcode: Optional[str] = None
+    strength: Optional[str] = None
+    score: float  # 0..1; 1 = every query word found exactly
+
 class RestockRequest(BaseModel):
     item_id: int
     quantity: int
@@ -106,6 +169,35 @@ class GS1ScanRequest(BaseModel):
     quantity: int
     class Config:
         from_attributes = True
+
+class CatalogImportError(BaseModel):
+    row: int  # 1-based position in the uploaded file (excluding the CSV header)
+    error: str
+
+class CatalogImportResult(BaseModel):
+    total: int
+    created: int
+    failed: int
+    created_manufacturers: int
+    created_categories: int
+    errors: List[CatalogImportError]
+
+class GS1BatchScanRequest(BaseModel):
+    scans: List[GS1ScanRequest]
+
+class GS1ScanResult(BaseModel):
+    index: int
+    status: str  # "received" or "error"
+    error: Optional[str] = None
+    gtin: Optional[str] = None
+    created_medicine: bool = False
+    item: Optional[InventoryItem] = None
+
+class GS1BatchReceiveResponse(BaseModel):
+    received: int
+    failed: int
+    created_medicines: int
+    results: List[GS1ScanResult]
         
 # Updated SmartCreateRequest to use relational data
 class SmartCreateRequest(BaseModel):
@@ -0,0 +1,313 @@
+# search.py
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, literal, or_, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import models
+from result_cache import ResultCache
+
+# --- CONFIGURATION ---
+SEARCH_RESULT_LIMIT = int(os.getenv("SEARCH_RESULT_LIMIT", "10"))
+# Results scoring below this (0..1) are dropped
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", "0.3"))
+# A spoken or typed name scoring at least this is taken to mean that catalog entry
+SEARCH_SNAP_MIN_SCORE = float(os.getenv("SEARCH_SNAP_MIN_SCORE", "0.75"))
+# Best trigram matches re-ranked with edit distance per lookup
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "20"))
+# Share of the query's trigrams a name must contain to be considered at all
+SEARCH_MIN_OVERLAP = float(os.getenv("SEARCH_MIN_OVERLAP", "0.4"))
+# Users whose in-process index is kept (SQLite / no pg_trgm)
+SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", "64"))
+SEARCH_INDEX_TTL_SECONDS = int(os.getenv("SEARCH_INDEX_TTL_SECONDS", "3600"))
+# New medicines are picked up on the next lookup; deleted ones within this many seconds
+SEARCH_INDEX_RECOUNT_SECONDS = float(os.getenv("SEARCH_INDEX_RECOUNT_SECONDS", "5"))
+
+# --- TRIGRAMS ---
+# Same scheme as pg_trgm (lower-cased alphanumeric words, each padded with two spaces in
+# front and one behind), so both backends find the same candidates.
+
+
+def _words(value: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", value.lower())
+
+
+def trigrams(value: str) -> FrozenSet[str]:
+    grams = set()
+    for word in _words(value):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+@lru_cache(maxsize=65536)
+def _word_similarity(a: str, b: str) -> float:
+    """1 - Levenshtein distance / longer length, for two words."""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return 1 - previous[-1] / max(len(a), len(b))
+
+
+def trigram_score(query_grams: FrozenSet[str], name_grams: FrozenSet[str]) -> float:
+    """The better of whole-name similarity and how much of the query the name covers."""
+    shared = len(query_grams & name_grams)
+    if not shared:
+        return 0.0
+    return max(shared / (len(query_grams) + len(name_grams) - shared), shared / len(query_grams))
+
+
+def score_name(query_words: List[str], query_grams: FrozenSet[str], name: str,
+               name_grams: Optional[FrozenSet[str]] = None) -> float:
+    """
+    0..1 relevance of a catalog name to the query: trigram overlap blended with
+    per-word edit distance, so near-misspellings ("paracetmol") still rank first.
+    """
+    name_words = _words(name)
+    if not name_words or not query_grams:
+        return 0.0
+    if name_words == query_words:
+        return 1.0
+    name_grams = name_grams if name_grams is not None else trigrams(name)
+    edit = sum(max(_word_similarity(q, w) for w in name_words) for q in query_words) / len(query_words)
+    return round(0.6 * trigram_score(query_grams, name_grams) + 0.4 * edit, 4)
+
+
+# --- POSTGRES (pg_trgm) ---
+
+_pg_trgm_ready = False
+
+
+def ensure_search_index(engine) -> bool:
+    """
+    On PostgreSQL, enables pg_trgm and a GIN trigram index on medicines.name. Other
+    backends (or a database where the extension can't be created) use the in-process
+    index instead.
+    """
+    global _pg_trgm_ready
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_medicines_name_trgm ON medicines USING gin (name gin_trgm_ops)"
+            ))
+        _pg_trgm_ready = True
+    except SQLAlchemyError as e:
+        print(f"!!! pg_trgm unavailable, using the in-process search index: {e} !!!")
+        _pg_trgm_ready = False
+    return _pg_trgm_ready
+
+
+def _pg_candidates(db: Session, user_id: int, query: str, limit: int) -> List[Dict[str, Any]]:
+    # `%` (similarity) and `<%` (word similarity) are the operators the GIN index serves
+    score = func.greatest(func.similarity(models.Medicine.name, query), func.word_similarity(query, models.Medicine.name))
+    rows = db.execute(
+        select(models.Medicine.id, models.Medicine.name, models.Medicine.barcode, models.Medicine.strength)
+        .where(
+            models.Medicine.user_id == user_id,
+            or_(models.Medicine.name.op("%")(query), literal(query).op("<%")(models.Medicine.name)),
+        )
+        .order_by(score.desc())
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+# --- IN-PROCESS INDEX ---
+
+class NameIndex:
+    """
+    One user's medicine names as trigram posting lists, updated incrementally: rows
+    above the highest known id are added on every lookup (an index-only MAX query),
+    and deletions are found by a periodic recount rather than rebuilding.
+    """
+
+    def __init__(self):
+        self.rows: Dict[int, Tuple[Dict[str, Any], FrozenSet[str]]] = {}
+        self.postings: Dict[str, set] = {}
+        self.max_id = 0
+        self.recounted_at = 0.0
+        self.lock = threading.Lock()
+
+    def _add(self, row: Dict[str, Any]):
+        grams = trigrams(row["name"])
+        self.rows[row["id"]] = (row, grams)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(row["id"])
+
+    def _remove(self, medicine_id: int):
+        _, grams = self.rows.pop(medicine_id)
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(medicine_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def refresh(self, db: Session, user_id: int):
+        max_id = db.execute(
+            select(func.max(models.Medicine.id)).where(models.Medicine.user_id == user_id)
+        ).scalar() or 0
+        if max_id > self.max_id:
+            new_rows = db.execute(
+                select(models.Medicine.id, models.Medicine.name, models.Medicine.barcode, models.Medicine.strength)
+                .where(models.Medicine.user_id == user_id, models.Medicine.id > self.max_id)
+            )
+            for row in new_rows:
+                self._add(dict(row._mapping))
+        now = time.monotonic()
+        if max_id < self.max_id or now - self.recounted_at >= SEARCH_INDEX_RECOUNT_SECONDS:
+            count = db.execute(
+                select(func.count()).select_from(models.Medicine).where(models.Medicine.user_id == user_id)
+            ).scalar()
+            if count != len(self.rows):
+                live = set(db.execute(select(models.Medicine.id).where(models.Medicine.user_id == user_id)).scalars())
+                for medicine_id in self.rows.keys() - live:
+                    self._remove(medicine_id)
+            self.recounted_at = now
+        self.max_id = max_id
+
+    def candidates(self, query_grams: FrozenSet[str], limit: int) -> List[Tuple[Dict[str, Any], FrozenSet[str]]]:
+        """The `limit` names with the best trigram_score among those sharing enough trigrams."""
+        postings = sorted((self.postings[gram] for gram in query_grams if gram in self.postings), key=len)
+        needed = max(1, math.ceil(len(query_grams) * SEARCH_MIN_OVERLAP))
+        if len(postings) < needed:
+            return []
+        # A name holding `needed` of the query's trigrams holds at least one of the rarest
+        # len(postings) - needed + 1, so only those posting lists have to be read
+        hits = Counter()
+        for ids in postings[:len(postings) - needed + 1]:
+            hits.update(ids)
+        # Hits on those lists pre-rank the pool (counted in C); only the front of it is scored exactly
+        rows = self.rows
+        scored = (
+            (trigram_score(query_grams, rows[medicine_id][1]), medicine_id)
+            for medicine_id, _ in hits.most_common(limit * 10)
+        )
+        return [rows[medicine_id] for _, medicine_id in heapq.nlargest(limit, scored)]
+
+
+_indexes = ResultCache("medicine_search_index", max_entries=SEARCH_INDEX_MAX_USERS,
+                       ttl_seconds=SEARCH_INDEX_TTL_SECONDS, use_disk=False)
+
+
+def _name_index(db: Session, user_id: int) -> NameIndex:
+    key = str(user_id)
+    index = _indexes.get(key)
+    if index is None:
+        index = NameIndex()
+        _indexes.set(key, index)
+    with index.lock:
+        index.refresh(db, user_id)
+    return index
+
+
+@event.listens_for(models.Medicine, "after_update")
+def _invalidate_on_rename(mapper, connection, target):
+    # Renames keep the same id and count, so the fingerprint wouldn't notice them
+    state = inspect(target)
+    if any(state.attrs[key].history.has_changes() for key in ("name", "barcode", "strength", "user_id")):
+        _indexes.invalidate(str(target.user_id))
+        for old_user_id in state.attrs.user_id.history.deleted or ():
+            _indexes.invalidate(str(old_user_id))
+
+
+# --- SEARCH ---
+
+def search_medicines(db: Session, user_id: int, query: str, limit: int = SEARCH_RESULT_LIMIT,
+                     min_score: float = SEARCH_MIN_SCORE) -> List[Dict[str, Any]]:
+    """
+    The user's medicines ranked by how well their name matches `query`, tolerant of
+    partial words and misspellings. Each result is {id, name, barcode, strength, score}.
+    """
+    query_words = _words(query or "")
+    if not query_words:
+        return []
+    query_grams = trigrams(query)
+    if _pg_trgm_ready and db.get_bind().dialect.name == "postgresql":
+        rows = [(row, None) for row in _pg_candidates(db, user_id, " ".join(query_words), SEARCH_CANDIDATES)]
+    else:
+        index = _name_index(db, user_id)
+        with index.lock:
+            rows = index.candidates(query_grams, SEARCH_CANDIDATES)
+
+    results = []
+    for row, name_grams in rows:
+        score = score_name(query_words, query_grams, row["name"], name_grams)
+        if score >= min_score:
+            results.append({**row, "score": score})
+    results.sort(key=lambda result: (-result["score"], result["name"], result["id"]))
+    return results[:limit]
+
+
+def best_match(db: Session, user_id: int, name: str, min_score: float = SEARCH_SNAP_MIN_SCORE) -> Optional[Dict[str, Any]]:
+    """The single catalog entry `name` most likely refers to, if it matches well enough."""
+    results = search_medicines(db, user_id, name, limit=1, min_score=min_score)
+    return results[0] if results else None
+
+
+def is_respelling(name: str, catalog_name: str) -> bool:
+    """
+    Whether `catalog_name` can be `name` misspelt or differently cased: the same number of
+    words and the same numbers (strengths), so "Dolo 650" is never "Dolo 500".
+    """
+    return (len(_words(name)) == len(_words(catalog_name))
+            and re.findall(r"\d+(?:\.\d+)?", name) == re.findall(r"\d+(?:\.\d+)?", catalog_name))
+
+
+def names_agree(name: str, catalog_name: str) -> bool:
+    """
+    `name` is the catalog name's leading words ("paracetamol" -> "Paracetamol 500mg") or
+    a close respelling of it (scoring at least SEARCH_SNAP_MIN_SCORE).
+    """
+    words, catalog_words = _words(name), _words(catalog_name)
+    if not words:
+        return False
+    if catalog_words[:len(words)] == words:
+        return True
+    return (is_respelling(name, catalog_name)
+            and score_name(words, trigrams(name), catalog_name) >= SEARCH_SNAP_MIN_SCORE)
+
+
+def resolve_medicine(db: Session, user_id: int, name: str) -> Optional[Dict[str, Any]]:
+    """
+    The catalog entry a typed or spoken name refers to, for answers that report on one
+    product: an exact or leading-words match first, otherwise a respelling scoring at
+    least SEARCH_SNAP_MIN_SCORE. A merely similar product ("insulin glargine" -> "Insulin",
+    "azithral" -> "Azithromycin") is not returned.
+    """
+    candidates = search_medicines(db, user_id, name, limit=SEARCH_CANDIDATES, min_score=SEARCH_MIN_SCORE)
+    words = _words(name)
+    for candidate in candidates:
+        if _words(candidate["name"])[:len(words)] == words:
+            return candidate
+    for candidate in candidates:
+        if names_agree(name, candidate["name"]):
+            return candidate
+    return None
+
+
+def canonical_name(db: Session, user_id: int, name: str, min_score: float = SEARCH_SNAP_MIN_SCORE) -> Optional[str]:
+    """
+    The catalog's spelling of `name` when it is the same name misspelt or differently
+    cased. A longer catalog name (e.g. with a strength added) or one with a different
+    strength is not a respelling.
+    """
+    match = best_match(db, user_id, name, min_score)
+    if match and is_respelling(name, match["name"]):
+        return match["name"]
+    return None
@@ -0,0 +1,241 @@
+# stock.py
+import asyncio
+import os
+from typing import Dict, Optional
+
+from sqlalchemy import case, delete, exists, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+# --- CONFIGURATION ---
+# Default cut-off for /medicines/stock's low_stock flag
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+# How often the totals are checked against the lots (and repaired); 0 = once, after startup
+STOCK_RECONCILE_INTERVAL_SECONDS = int(os.getenv("STOCK_RECONCILE_INTERVAL_SECONDS", "3600"))
+# Drifted medicines listed individually in a reconcile report
+STOCK_RECONCILE_REPORT_LIMIT = 100
+
+# --- DELTAS ---
+# Every path that changes a lot's quantity passes {medicine_id: change} here inside its
+# own transaction, so medicine_stock commits or rolls back together with the lots.
+
+
+def _nonzero(deltas: Dict[int, int]) -> Dict[int, int]:
+    # Sorted so concurrent multi-medicine updates lock rows in the same order
+    return {medicine_id: delta for medicine_id, delta in sorted(deltas.items()) if delta}
+
+
+def _lots_total(medicine_id: int):
+    """SUM of the medicine's lot quantities, including the caller's own (flushed) changes."""
+    return (
+        select(func.coalesce(func.sum(models.InventoryItem.quantity), 0))
+        .where(models.InventoryItem.medicine_id == medicine_id)
+        .scalar_subquery()
+    )
+
+
+def _upsert(dialect: str, deltas: Dict[int, int]):
+    """
+    INSERT ... ON CONFLICT (medicine_id) DO UPDATE SET quantity = quantity + <delta>.
+    A missing total (a medicine the backfill hasn't reached yet) starts from its lots,
+    which already include this change, rather than from the delta alone.
+    """
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = dialect_insert(models.MedicineStock).values(
+        [{"medicine_id": medicine_id, "quantity": _lots_total(medicine_id)} for medicine_id in deltas]
+    )
+    delta = case(
+        *[(models.MedicineStock.medicine_id == medicine_id, change) for medicine_id, change in deltas.items()],
+        else_=0,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[models.MedicineStock.medicine_id],
+        set_={"quantity": models.MedicineStock.quantity + delta},
+    )
+
+
+def _insert_missing(db: Session, medicine_ids):
+    """Zero totals for medicines without one; rows another worker or add_stock inserted first are left alone."""
+    rows = [{"medicine_id": medicine_id, "quantity": 0} for medicine_id in medicine_ids]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        db.execute(dialect_insert(models.MedicineStock).values(rows).on_conflict_do_nothing(
+            index_elements=[models.MedicineStock.medicine_id]
+        ))
+        return
+    existing = set(db.scalars(
+        select(models.MedicineStock.medicine_id).where(models.MedicineStock.medicine_id.in_(medicine_ids))
+    ))
+    rows = [row for row in rows if row["medicine_id"] not in existing]
+    if rows:
+        db.execute(insert(models.MedicineStock), rows)
+
+
+def _increment(medicine_id: int, delta: int):
+    return (
+        update(models.MedicineStock)
+        .where(models.MedicineStock.medicine_id == medicine_id)
+        .values(quantity=models.MedicineStock.quantity + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def add_stock(db: Session, deltas: Dict[int, int]):
+    """
+    Applies per-medicine quantity changes to medicine_stock in the caller's transaction.
+    Call it after the lot changes: they are flushed first so a missing total can be
+    started from the lots.
+    """
+    deltas = _nonzero(deltas)
+    if not deltas:
+        return
+    db.flush()
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        db.execute(_upsert(dialect, deltas))
+        return
+    for medicine_id, delta in deltas.items():
+        if db.execute(_increment(medicine_id, delta)).rowcount == 0:
+            db.execute(insert(models.MedicineStock).values(medicine_id=medicine_id, quantity=_lots_total(medicine_id)))
+
+
+async def add_stock_async(db: AsyncSession, deltas: Dict[int, int]):
+    """Async variant of add_stock for endpoints on the async session."""
+    deltas = _nonzero(deltas)
+    if not deltas:
+        return
+    await db.flush()
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        await db.execute(_upsert(dialect, deltas))
+        return
+    for medicine_id, delta in deltas.items():
+        if (await db.execute(_increment(medicine_id, delta))).rowcount == 0:
+            await db.execute(insert(models.MedicineStock).values(medicine_id=medicine_id, quantity=_lots_total(medicine_id)))
+
+
+def stock_quantity():
+    """Column expression for a medicine's total stock; use with an outer join on MedicineStock."""
+    return func.coalesce(models.MedicineStock.quantity, 0)
+
+
+def delete_stock_statement(medicine_id: int):
+    """Removes the total along with its medicine (it references medicines.id)."""
+    return delete(models.MedicineStock).where(models.MedicineStock.medicine_id == medicine_id)
+
+
+# --- RECONCILE ---
+
+def reconcile_stock(db: Session, user_id: Optional[int] = None, fix: bool = True) -> dict:
+    """
+    Compares medicine_stock with SUM(inventory_items.quantity) in one aggregate query
+    and, with `fix`, recomputes the drifted totals from the lots. Also backfills totals
+    for medicines created before medicine_stock existed.
+    """
+    actual = (
+        select(
+            models.InventoryItem.medicine_id,
+            func.sum(models.InventoryItem.quantity).label("quantity"),
+        )
+        .group_by(models.InventoryItem.medicine_id)
+        .subquery()
+    )
+    actual_quantity = func.coalesce(actual.c.quantity, 0)
+    query = (
+        select(models.Medicine.id, models.MedicineStock.quantity, actual_quantity)
+        .outerjoin(actual, actual.c.medicine_id == models.Medicine.id)
+        .outerjoin(models.MedicineStock, models.MedicineStock.medicine_id == models.Medicine.id)
+        .where(or_(
+            models.MedicineStock.medicine_id.is_(None) & (actual_quantity != 0),
+            models.MedicineStock.quantity != actual_quantity,
+        ))
+        .order_by(models.Medicine.id)
+    )
+    if user_id is not None:
+        query = query.where(models.Medicine.user_id == user_id)
+    drifted = db.execute(query).all()
+
+    orphaned = []
+    if user_id is None:
+        orphaned = db.execute(
+            select(models.MedicineStock.medicine_id).where(
+                ~exists().where(models.Medicine.id == models.MedicineStock.medicine_id)
+            )
+        ).scalars().all()
+
+    if fix and (drifted or orphaned):
+        ids = [row.id for row in drifted]
+        missing = [row.id for row in drifted if row.quantity is None]
+        if missing:
+            _insert_missing(db, missing)
+        if ids:
+            # Lock the totals before recounting. An add_stock that already touched one has
+            # committed by the time the lock is granted, so the recount (a new statement,
+            # hence a fresh READ COMMITTED snapshot) sees its lots; one that comes later
+            # waits and applies its delta on top of the recount. No-op on SQLite, whose
+            # writers are serialised anyway.
+            db.execute(
+                select(models.MedicineStock.medicine_id)
+                .where(models.MedicineStock.medicine_id.in_(ids))
+                .order_by(models.MedicineStock.medicine_id)
+                .with_for_update()
+            ).all()
+            # Recounted in the UPDATE itself rather than copied from the report above,
+            # so lots that changed in between are still counted correctly
+            recount = (
+                select(func.coalesce(func.sum(models.InventoryItem.quantity), 0))
+                .where(models.InventoryItem.medicine_id == models.MedicineStock.medicine_id)
+                .scalar_subquery()
+            )
+            db.execute(
+                update(models.MedicineStock)
+                .where(models.MedicineStock.medicine_id.in_(ids))
+                .values(quantity=recount)
+                .execution_options(synchronize_session=False)
+            )
+        if orphaned:
+            db.execute(delete(models.MedicineStock).where(models.MedicineStock.medicine_id.in_(orphaned)))
+        db.commit()
+
+    if drifted or orphaned:
+        print(f"--- STOCK RECONCILE: {len(drifted)} drifted total(s), {len(orphaned)} orphaned, "
+              f"{'fixed' if fix else 'not fixed'} ---")
+    return {
+        "drifted": len(drifted),
+        "orphaned": len(orphaned),
+        "fixed": bool(fix and (drifted or orphaned)),
+        "details": [
+            {"medicine_id": row.id, "stored": row.quantity, "actual": row[2]}
+            for row in drifted[:STOCK_RECONCILE_REPORT_LIMIT]
+        ],
+    }
+
+
+def reconcile_all() -> dict:
+    """reconcile_stock over every medicine, on its own session (startup and the periodic job)."""
+    db = SessionLocal()
+    try:
+        return reconcile_stock(db)
+    finally:
+        db.close()
+
+
+async def reconcile_periodically(interval_seconds: int = STOCK_RECONCILE_INTERVAL_SECONDS):
+    """
+    Background task: runs reconcile_all off the event loop once straight away (so startup
+    doesn't wait on the full aggregate) and then every `interval_seconds`; 0 = once only.
+    Until the first pass has backfilled them, pre-existing medicines read as 0 in stock.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(reconcile_all)
+        except Exception as e:
+            print(f"!!! STOCK RECONCILE FAILED: {e} !!!")
+        if interval_seconds <= 0:
+            return
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,174 @@
+# text_parsing.py
+import calendar
+import re
+from datetime import date
+from functools import lru_cache
+from typing import Any, List, NamedTuple, Optional
+
+from dateutil.parser import parse as parse_date
+
+# --- SINGLE-PASS LABEL SCANNER ---
+# One precompiled alternation finds every date, price, lot number and bracketed GS1
+# element in a single finditer over the OCR text, instead of one re.search per helper.
+
+_MONTH = r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*'
+
+_SCANNER = re.compile(
+    r'''
+    (?<!\w)(?:                                        # fields start at a word boundary
+    (?P<DATE>
+        (?:(?P<date_label>\bEXP(?:IRY)?|\bUSE\s+BEFORE|\bBEST\s+BEFORE|\bMFG|\bMFD|\bMANUFACTURED|\bPKD|\bPACKED)
+           \.?\s*(?:DATE|DT|ON)?\.?\s*[:\-]?\s*)?
+        (?P<date>
+            \d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}(?!\d)      # 12/03/2027, 12-03-27, 12.03.2027
+          | \d{4}[/-]\d{1,2}[/-]\d{1,2}(?!\d)          # 2027-03-12
+          | \d{1,2}[ -]''' + _MONTH + r'''[ -]\d{2,4}(?!\d)   # 12 Mar 2027
+          | \b''' + _MONTH + r'''[ ./-]?\d{4}(?!\d)     # MAR 2027, Mar.2027
+          | \d{1,2}[/.-]\d{4}(?!\d)                    # 03/2027
+        )
+    )
+  | (?P<PRICE>
+        (?:\bM\.?R\.?P\.?|\bRs\.?|₹|\$)\s*[:\-]?\s*(?:(?:Rs\.?|₹)\s*)?
+        (?P<price>\d+(?:\.\d+)?)
+    )
+  | (?P<LOT>
+        \b(?:Batch|Lot|B\.?\s*No)(?![a-z])\.?\s*(?:No\.?|Number|\#)?\s*[:\-]?\s*
+        (?P<lot>[\w\-]*\d[\w\-]*)
+    )
+    )
+  | (?P<GS1>                                         # AIs may follow the previous value directly
+        \((?P<ai>\d{2,4})\)(?P<ai_value>[^()\x1d\s]+)
+    )
+    ''',
+    re.IGNORECASE | re.VERBOSE,
+)
+
+_EXPIRY_LABELS = ("EXP", "USE", "BEST")
+_MFG_LABELS = ("MFG", "MFD", "MANUFACTURED", "PKD", "PACKED")
+
+_MONTHS = {name: index for index, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+
+
+class FieldCandidate(NamedTuple):
+    kind: str                 # "date", "price", "lot" or "gs1"
+    value: Any                # parsed value (date, float, str)
+    raw: str                  # matched text, including any label
+    start: int
+    end: int
+    label: Optional[str]      # "EXP"/"MFG" for dates, the AI for GS1 elements
+
+
+def _month_end(year: int, month: int) -> date:
+    # Month-only expiries ("EXP 03/2027") run to the end of that month
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+def _full_year(year: int) -> int:
+    # Two-digit years follow strptime's %y pivot (69-99 -> 1900s, 00-68 -> 2000s)
+    if year >= 100:
+        return year
+    return year + (1900 if year >= 69 else 2000)
+
+def _fast_parse_date(raw: str) -> Optional[date]:
+    """
+    Builds the date directly from the matched shape. Day/month order matches dateutil's
+    default: month first when ambiguous, day first when the first number can't be a month.
+    Raises ValueError for shapes it doesn't handle.
+    """
+    parts = re.split(r'[\s./-]+', raw.strip())
+    if all(p.isdigit() for p in parts):
+        if len(parts) == 3 and len(parts[0]) == 4:
+            return date(int(parts[0]), int(parts[1]), int(parts[2]))
+        if len(parts) == 3 and len(parts[2]) in (2, 4):
+            first, second, year = int(parts[0]), int(parts[1]), _full_year(int(parts[2]))
+            if first > 12:
+                return date(year, second, first)
+            return date(year, first, second)
+        if len(parts) == 2 and len(parts[1]) == 4:
+            return _month_end(int(parts[1]), int(parts[0]))
+        raise ValueError(raw)
+
+    if len(parts) == 3 and parts[0].isdigit() and parts[2].isdigit():
+        return date(_full_year(int(parts[2])), _MONTHS[parts[1][:3].lower()], int(parts[0]))
+    # "MAR 2027" / "Mar.2027" / "March2027"
+    match = re.fullmatch(r'([A-Za-z]+)[\s./-]*(\d{4})', raw.strip())
+    if match:
+        return _month_end(int(match.group(2)), _MONTHS[match.group(1)[:3].lower()])
+    raise ValueError(raw)
+
+@lru_cache(maxsize=4096)
+def _parse_date_string(raw: str) -> Optional[date]:
+    try:
+        return _fast_parse_date(raw)
+    except (ValueError, KeyError):
+        pass
+    # Anything the fast path didn't recognise goes to dateutil
+    try:
+        return parse_date(raw).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def _date_label(label: Optional[str]) -> Optional[str]:
+    if not label:
+        return None
+    label = label.upper()
+    if label.startswith(_EXPIRY_LABELS):
+        return "EXP"
+    return "MFG" if label.startswith(_MFG_LABELS) else label
+
+
+def scan_fields(text_block: str) -> List[FieldCandidate]:
+    """Single pass over the text yielding every recognised field candidate in text order."""
+    candidates = []
+    for match in _SCANNER.finditer(text_block):
+        # The outermost named group is the last one to close, so lastgroup names the field kind
+        kind = match.lastgroup
+        if kind == 'DATE':
+            value = _parse_date_string(match.group('date'))
+            if value is not None:
+                candidates.append(FieldCandidate("date", value, match.group(), match.start(), match.end(),
+                                                 _date_label(match.group('date_label'))))
+        elif kind == 'PRICE':
+            candidates.append(FieldCandidate("price", float(match.group('price')), match.group(),
+                                             match.start(), match.end(), None))
+        elif kind == 'LOT':
+            candidates.append(FieldCandidate("lot", match.group('lot'), match.group(),
+                                             match.start(), match.end(), None))
+        else:
+            candidates.append(FieldCandidate("gs1", match.group('ai_value'), match.group(),
+                                             match.start(), match.end(), match.group('ai')))
+    return candidates
+
+
+class LabelScan:
+    """All candidates from one scan, with the ranking rules for picking each field."""
+
+    def __init__(self, text_block: str):
+        self.candidates = scan_fields(text_block)
+
+    def of_kind(self, kind: str) -> List[FieldCandidate]:
+        return [c for c in self.candidates if c.kind == kind]
+
+    def ranked_dates(self) -> List[FieldCandidate]:
+        """Expiry-first ordering: EXP-labelled, then unlabelled (latest date first), then MFG."""
+        order = {"EXP": 0, None: 1}
+        return sorted(self.of_kind("date"), key=lambda c: (order.get(c.label, 2), -c.value.toordinal()))
+
+    def expiry_date(self) -> Optional[FieldCandidate]:
+        dates = self.ranked_dates()
+        return dates[0] if dates else None
+
+    def price(self) -> Optional[FieldCandidate]:
+        # MRP is the printed retail price; prefer it over other currency amounts
+        prices = self.of_kind("price")
+        mrp = [c for c in prices if c.raw.upper().replace('.', '').startswith("MRP")]
+        return (mrp or prices or [None])[0]
+
+    def lot_number(self) -> Optional[FieldCandidate]:
+        lots = self.of_kind("lot")
+        return lots[0] if lots else None
+
+
+def scan_label(text_block: str) -> LabelScan:
+    return LabelScan(text_block)